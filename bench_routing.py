@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+PresPilot - End-to-end deck time per model routing profile
+Runs research + generate_pptx through the Flask app against the local fake
+Anthropic API (fake_anthropic.py) once per routing profile and reports deck
+wall time and upstream calls per model. The fake gives each model tier its
+own speed and rate of unusable answers, so escalations show up too.
+
+    python bench_routing.py --decks 10 --concurrency 4 --slides 8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare routing profiles on a full deck generation')
+    parser.add_argument('--profiles', default='quality,balanced,fast')
+    parser.add_argument('--decks', type=int, default=8, help='decks per profile')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--slides', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.4, help='median seconds to first token on the medium tier')
+    parser.add_argument('--small-speed', type=float, default=0.35)
+    parser.add_argument('--large-speed', type=float, default=2.0)
+    parser.add_argument('--small-invalid-rate', type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    from fake_anthropic import FakeAnthropic
+    fake = FakeAnthropic(latency=(args.latency, 0.3), output_token_seconds=0.002,
+                         model_speed={'haiku': args.small_speed, 'opus': args.large_speed},
+                         invalid_rate_by_model={'haiku': args.small_invalid_rate}, seed=7).start()
+
+    # Everything below must be configured before the app and LLM modules are imported
+    workdir = tempfile.mkdtemp(prefix='bench_routing_')
+    os.environ['ANTHROPIC_API_URL'] = fake.url
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'fake-key')
+    # Every profile must pay for its own LLM calls: no response cache, proofread
+    # memo or per-section artifacts carried over from the profile before it
+    os.environ['LLM_CACHE_ENABLED'] = 'false'
+    os.environ['LLM_MEMO_ENABLED'] = 'false'
+    os.environ['DECK_ARTIFACTS_ENABLED'] = 'false'
+    os.environ['LLM_LEDGER_PATH'] = os.path.join(workdir, 'ledger.db')
+    # The app keeps its sqlite files in the working directory; run in a scratch
+    # one that still sees the theme templates
+    repo = os.path.dirname(os.path.abspath(__file__))
+    for name in ('theme-templates', 'theme-previews'):
+        os.symlink(os.path.join(repo, name), os.path.join(workdir, name))
+    os.chdir(workdir)
+    sys.path.insert(0, repo)
+
+    import server
+    import llm_routing
+
+    def one_deck(index, timings):
+        client = server.app.test_client()
+        started = time.monotonic()
+        research = client.post('/api/research', json={'topic': f"Benchmark topic {index}", 'num_slides': args.slides})
+        sections = research.get_json()['sections']
+        response = client.post('/api/presentations/generate-pptx', json={
+            'title': f"Deck {index}", 'topic': f"Benchmark topic {index}", 'sections': sections,
+            'slideFormat': 'Concise', 'notesStyle': 'Detailed'})
+        if response.status_code != 200:
+            raise Exception(f"generate-pptx returned {response.status_code}")
+        timings.append(time.monotonic() - started)
+
+    report = {}
+    for profile in [name.strip() for name in args.profiles.split(',') if name.strip()]:
+        llm_routing.set_profile(profile)
+        fake.reset()
+        timings = []
+        queue = list(range(args.decks))
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    index = queue.pop()
+                one_deck(index, timings)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        stats = fake.get_stats()
+        report[profile] = {
+            'decks': len(timings),
+            'deck_mean_s': round(sum(timings) / len(timings), 2),
+            'deck_p95_s': round(_percentile(timings, 95), 2),
+            'decks_per_min': round(len(timings) / elapsed * 60, 1),
+            'upstream_calls': stats['requests'],
+            'calls_by_model': stats['by_model'],
+            'invalid_answers': stats['invalid'],
+            'escalations': llm_routing.get_stats()['escalations'],
+        }
+        print(f"{profile:>9}: mean {report[profile]['deck_mean_s']}s, p95 {report[profile]['deck_p95_s']}s, "
+              f"{report[profile]['decks_per_min']} decks/min")
+
+    fake.stop()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
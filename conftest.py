@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Shared test setup
+The LLM and deck modules read their configuration when they are first
+imported, by whichever test module gets there first, so it is set here for
+the whole session: sqlite files go to a scratch directory and the response
+cache is off. Tests that need the upstream API point llm_client at a
+FakeAnthropic themselves.
+"""
+
+import os
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix='prespilot_tests_')
+
+os.environ.update(ANTHROPIC_API_KEY='fake-key', LLM_CACHE_ENABLED='false',
+                  LLM_CACHE_PATH=os.path.join(WORKDIR, 'llm_cache.db'),
+                  LLM_LEDGER_PATH=os.path.join(WORKDIR, 'llm_ledger.db'),
+                  LLM_MEMO_PATH=os.path.join(WORKDIR, 'llm_memo.db'),
+                  DECK_JOBS_DB_PATH=os.path.join(WORKDIR, 'deck_jobs.db'),
+                  DECK_JOBS_DIR=os.path.join(WORKDIR, 'deck_jobs'),
+                  DECK_ARTIFACTS_PATH=os.path.join(WORKDIR, 'deck_artifacts.db'),
+                  DECK_CHECKPOINT_PATH=os.path.join(WORKDIR, 'deck_checkpoints.db'),
+                  DECK_CHECKPOINT_DIR=os.path.join(WORKDIR, 'deck_checkpoints'))
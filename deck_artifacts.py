@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Per-section deck artifacts for incremental regeneration
+When a user edits one section and downloads again, only that section should
+go back to the LLM. Every section's derived content (shortened bullets,
+speaker notes, proofread title and bullets) is stored under a hash of the
+section as sent plus the slide format, notes style and a version of the
+prompts that produced it; build_deck looks each section up first and only
+runs the shorten/notes/proofread tasks for sections it has not seen.
+
+Sections whose pipeline fell back somewhere (a failed notes call, an
+unproofread bullet) are not stored, so a later download retries them.
+The table is bounded by size with least-recently-used eviction.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+import llm_cache
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_PATH = os.environ.get('DECK_ARTIFACTS_PATH', 'deck_artifacts.db')
+ARTIFACTS_ENABLED = os.environ.get('DECK_ARTIFACTS_ENABLED', 'true').lower() == 'true'
+ARTIFACTS_MAX_BYTES = int(os.environ.get('DECK_ARTIFACTS_MAX_BYTES', 50 * 1024 * 1024))
+
+_lock = threading.Lock()
+stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evicted': 0}
+
+
+_store = llm_cache.SqliteStore(ARTIFACTS_PATH, 'section_artifacts', '''
+    key TEXT PRIMARY KEY,
+    artifacts TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+''', indexes=['last_access'], max_bytes=ARTIFACTS_MAX_BYTES, evict_every=100)
+
+
+def _count(name, amount=1):
+    with _lock:
+        stats[name] += amount
+
+
+def section_key(section, slide_format, notes_style, version):
+    """Hash of everything a section's derived content depends on"""
+    material = json.dumps({'section': section, 'slide_format': slide_format, 'notes_style': notes_style,
+                           'version': version}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def get(key):
+    """Stored artifacts dict for key, or None"""
+    if not ARTIFACTS_ENABLED:
+        return None
+    try:
+        conn = _store.connection()
+        row = conn.execute('SELECT artifacts FROM section_artifacts WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            _count('misses')
+            return None
+        conn.execute('UPDATE section_artifacts SET last_access = ? WHERE key = ?', (time.time(), key))
+        _count('hits')
+        return json.loads(row[0])
+    except sqlite3.Error as e:
+        logger.warning(f"Section artifact read failed: {e}")
+        _count('misses')
+        return None
+
+
+def put(key, artifacts):
+    if not ARTIFACTS_ENABLED:
+        return
+    data = json.dumps(artifacts, ensure_ascii=False)
+    try:
+        conn = _store.connection()
+        conn.execute('INSERT OR REPLACE INTO section_artifacts (key, artifacts, size, last_access) VALUES (?, ?, ?, ?)',
+                     (key, data, len(data.encode('utf-8')), time.time()))
+        _count('writes')
+        removed = _store.wrote()
+        if removed:
+            _count('evicted', removed)
+    except sqlite3.Error as e:
+        logger.warning(f"Section artifact write failed: {e}")
+
+
+def evict():
+    """Drop the least recently used sections until the table is under ARTIFACTS_MAX_BYTES"""
+    removed = _store.evict()
+    if removed:
+        _count('evicted', removed)
+    return removed
+
+
+def get_stats():
+    with _lock:
+        result = dict(stats)
+    lookups = result['hits'] + result['misses']
+    result['hit_rate'] = round(result['hits'] / lookups, 3) if lookups else 0.0
+    result['enabled'] = ARTIFACTS_ENABLED
+    result['max_bytes'] = ARTIFACTS_MAX_BYTES
+    return result
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Checkpointed, resumable deck builds
+A deck build that dies part way (the browser's fetch times out and the user
+retries, or the worker process is killed) should not redo the LLM work it
+already finished. Each slide task's result - shortened bullets, speaker
+notes, proofread corrections - is written to sqlite under a checkpoint scope
+as it completes, and a build in the same scope restores those results
+instead of running the tasks again. The finished .pptx is kept too, so a
+retry of a request that completed after its client gave up gets the file
+straight away.
+
+The scope of a synchronous request is its Idempotency-Key, bound to the
+user and the exact request body; a deck job uses its job id, so a job
+reclaimed after a worker crash resumes where it stopped. Checkpoints
+expire after DECK_CHECKPOINT_TTL seconds.
+
+Only one build runs per request scope at a time: it holds a lease in the
+same database, renewed as its tasks are checkpointed, and a concurrent
+duplicate waits for it (see Checkpoint.acquire).
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import sqlite3
+import threading
+
+import llm_cache
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.environ.get('DECK_CHECKPOINT_PATH', 'deck_checkpoints.db')
+CHECKPOINT_DIR = os.environ.get('DECK_CHECKPOINT_DIR', 'deck_checkpoints')
+CHECKPOINT_TTL = int(os.environ.get('DECK_CHECKPOINT_TTL', 24 * 3600))
+CLEANUP_EVERY = 300
+# A build's lease lapses this long after its last checkpointed task, e.g. when its worker was killed
+LEASE_SECONDS = int(os.environ.get('DECK_LEASE_SECONDS', 120))
+LEASE_POLL_SECONDS = 0.5
+
+_lock = threading.Lock()
+stats = {'scopes_resumed': 0, 'tasks_restored': 0, 'tasks_saved': 0, 'outputs_replayed': 0, 'expired': 0,
+         'lease_waits': 0, 'lease_timeouts': 0}
+_last_cleanup = 0.0
+
+
+_store = llm_cache.SqliteStore(CHECKPOINT_PATH, 'deck_checkpoints', '''
+    scope TEXT NOT NULL,
+    task TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (scope, task)
+''', indexes=['created_at'], ttl_column='created_at', ttl=CHECKPOINT_TTL)
+_leases = llm_cache.SqliteStore(CHECKPOINT_PATH, 'deck_leases', '''
+    scope TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+''', ttl_column='expires_at', ttl=0)
+
+
+def _count(name, amount=1):
+    with _lock:
+        stats[name] += amount
+
+
+def request_scope(user_id, idempotency_key, payload):
+    """Scope for a request: the same key with a different body or user is a different build"""
+    material = json.dumps({'user_id': str(user_id), 'key': idempotency_key, 'payload': payload},
+                          sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class Checkpoint:
+    """The saved task results of one scope, loaded once when the build starts"""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.restored = 0
+        self.owner = None
+        self.saved = self._load()
+        if self.saved:
+            _count('scopes_resumed')
+            logger.info(f"Resuming deck build {scope[:12]} from {len(self.saved)} checkpointed tasks")
+
+    def _load(self):
+        try:
+            rows = _store.connection().execute(
+                'SELECT task, value FROM deck_checkpoints WHERE scope = ? AND created_at > ?',
+                (self.scope, time.time() - CHECKPOINT_TTL)).fetchall()
+            return {task: json.loads(value) for task, value in rows}
+        except sqlite3.Error as e:
+            logger.warning(f"Could not load deck checkpoints: {e}")
+            return {}
+
+    def _take_lease(self):
+        """Claim the scope unless another build holds an unexpired lease on it"""
+        now = time.time()
+        conn = _leases.connection()
+        conn.execute('''
+            INSERT INTO deck_leases (scope, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (scope) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE deck_leases.expires_at < ?
+        ''', (self.scope, self.owner, now + LEASE_SECONDS, now))
+        row = conn.execute('SELECT owner FROM deck_leases WHERE scope = ?', (self.scope,)).fetchone()
+        return row is not None and row[0] == self.owner
+
+    def acquire(self, wait):
+        """
+        Become the one build of this scope, waiting up to wait seconds for a
+        concurrent one to finish or lapse; False if it is still running. After
+        a wait, call finished_output() again - the other build may have
+        completed the deck - and the checkpoints it saved are reloaded.
+        """
+        self.owner = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        waited = False
+        while True:
+            try:
+                if self._take_lease():
+                    break
+            except sqlite3.Error as e:
+                logger.warning(f"Could not take deck build lease, building anyway: {e}")
+                break
+            if time.monotonic() >= deadline:
+                _count('lease_timeouts')
+                return False
+            if not waited:
+                waited = True
+                _count('lease_waits')
+                logger.info(f"Deck build {self.scope[:12]} is already running, waiting for it")
+            time.sleep(LEASE_POLL_SECONDS)
+        if waited:
+            self.saved = self._load()
+        return True
+
+    def release(self):
+        try:
+            _leases.connection().execute('DELETE FROM deck_leases WHERE scope = ? AND owner = ?',
+                                         (self.scope, self.owner))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not release deck build lease: {e}")
+
+    def has(self, task):
+        return task in self.saved
+
+    def get(self, task):
+        self.restored += 1
+        _count('tasks_restored')
+        return self.saved[task]
+
+    def put(self, task, value):
+        try:
+            _store.connection().execute('INSERT OR REPLACE INTO deck_checkpoints (scope, task, value, created_at) '
+                                        'VALUES (?, ?, ?, ?)', (self.scope, task, json.dumps(value), time.time()))
+            _count('tasks_saved')
+            if self.owner is not None:
+                _leases.connection().execute('UPDATE deck_leases SET expires_at = ? WHERE scope = ? AND owner = ?',
+                                             (time.time() + LEASE_SECONDS, self.scope, self.owner))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not checkpoint deck task {task}: {e}")
+        cleanup()
+
+    def output_path(self):
+        return os.path.join(CHECKPOINT_DIR, f"{self.scope}.pptx")
+
+    def partial_path(self):
+        """Where this attempt writes the deck before moving it to output_path()"""
+        return os.path.join(CHECKPOINT_DIR, f"{self.scope}.{self.owner or uuid.uuid4().hex}.partial")
+
+    def finished_output(self):
+        """Path of this scope's finished deck if a previous build completed it, else None"""
+        path = self.output_path()
+        if os.path.exists(path) and os.path.getmtime(path) > time.time() - CHECKPOINT_TTL:
+            _count('outputs_replayed')
+            return path
+        return None
+
+    def complete(self):
+        """The deck is built: its file stands for the task results from here on"""
+        try:
+            _store.connection().execute('DELETE FROM deck_checkpoints WHERE scope = ?', (self.scope,))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not clear deck checkpoints: {e}")
+
+
+def cleanup():
+    """Drop checkpoints and finished decks older than CHECKPOINT_TTL, at most every CLEANUP_EVERY seconds"""
+    global _last_cleanup
+    now = time.time()
+    with _lock:
+        if now - _last_cleanup < CLEANUP_EVERY:
+            return
+        _last_cleanup = now
+    try:
+        removed = _store.evict()
+        _leases.evict()
+        if os.path.isdir(CHECKPOINT_DIR):
+            for name in os.listdir(CHECKPOINT_DIR):
+                path = os.path.join(CHECKPOINT_DIR, name)
+                if os.path.getmtime(path) < now - CHECKPOINT_TTL:
+                    os.remove(path)
+                    removed += 1
+        if removed:
+            _count('expired', removed)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Deck checkpoint cleanup failed: {e}")
+
+
+def get_stats():
+    with _lock:
+        return dict(stats)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Per-slide task graph for deck generation
+build_deck splits a deck into small tasks per slide (shorten bullets, speaker
+notes, proofread, render) that depend only on that slide's own inputs, plus
+an ordering edge from each render to the previous one, since slides are
+appended to a single python-pptx Presentation. TaskGraph runs them on a
+bounded thread pool as soon as their dependencies finish, so slide 1 is
+rendered while slide 15's notes are still in flight. A task that returns a
+Future (an LLM call started on the llm_client loop, proofreads queued on the
+batcher) gives its thread back and finishes when the Future does.
+
+Ready tasks start in the order they were added (slide by slide), which keeps
+early slides ahead of later ones. Each task is timed from when it became
+ready to when it started (queued_s) and how long it ran (seconds).
+"""
+
+import time
+import heapq
+import logging
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+class Task:
+    def __init__(self, order, name, fn, deps, kind, bounded):
+        self.order = order
+        self.name = name
+        self.fn = fn
+        self.deps = deps
+        self.kind = kind
+        self.bounded = bounded
+        self.result = None
+        self.awaiting = None
+        self.ready_at = None
+        self.started_at = None
+        self.seconds = None
+
+
+class TaskGraph:
+    """
+    Tasks are added with the names of the tasks they depend on, which must
+    already have been added (so the graph cannot have cycles). fn takes no
+    arguments; it reads its inputs from shared state its dependencies wrote,
+    or from result(name).
+    """
+
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, fn, deps=(), kind=None, bounded=True):
+        """
+        Add a task; kind groups tasks for timing (default: the name up to ':').
+        Unbounded tasks do not count against the run limit, for work that is
+        bounded elsewhere, like items queued on the proofreading batcher.
+        """
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task {name}")
+        deps = tuple(dep for dep in deps if dep is not None)
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Task {name} depends on unknown task {dep}")
+        self.tasks[name] = Task(len(self.tasks), name, fn, deps, kind or name.split(':')[0], bounded)
+        return name
+
+    def result(self, name):
+        return self.tasks[name].result
+
+    def run(self, limit, on_done=None):
+        """
+        Run every task, with at most limit bounded tasks in progress at a time
+        (running on a thread or waiting on the Future it returned). If a task
+        raises, no new tasks start, running ones are waited for and the
+        exception is re-raised. on_done(name, result) is called on this
+        thread as each task succeeds.
+        """
+        waiting = {name: len(task.deps) for name, task in self.tasks.items()}
+        dependents = {name: [] for name in self.tasks}
+        for task in self.tasks.values():
+            for dep in task.deps:
+                dependents[dep].append(task.name)
+        ready = []
+        now = time.monotonic()
+        for name, count in waiting.items():
+            if count == 0:
+                self.tasks[name].ready_at = now
+                heapq.heappush(ready, (self.tasks[name].order, name))
+
+        running = {}
+        in_progress = 0
+        failure = None
+        with ThreadPoolExecutor(max_workers=limit, thread_name_prefix='deck-task') as pool:
+            while ready or running:
+                deferred = []
+                while ready and failure is None:
+                    order, name = heapq.heappop(ready)
+                    task = self.tasks[name]
+                    if task.bounded and in_progress >= limit:
+                        deferred.append((order, name))
+                        continue
+                    in_progress += task.bounded
+                    # Tasks run with the caller's context (e.g. the LLM ledger attribution)
+                    running[pool.submit(contextvars.copy_context().run, self._run_task, task)] = name
+                for item in deferred:
+                    heapq.heappush(ready, item)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    task = self.tasks[name]
+                    error = future.exception()
+                    if error is None and task.awaiting is None and isinstance(future.result(), Future):
+                        task.awaiting = future.result()
+                        running[task.awaiting] = name
+                        continue
+                    finished = time.monotonic()
+                    task.seconds = finished - task.started_at
+                    in_progress -= task.bounded
+                    if error is not None:
+                        logger.error(f"Deck task {name} failed: {error}")
+                        failure = failure or error
+                        continue
+                    task.result = future.result()
+                    if on_done is not None:
+                        on_done(name, task.result)
+                    for dependent in dependents[name]:
+                        waiting[dependent] -= 1
+                        if waiting[dependent] == 0:
+                            self.tasks[dependent].ready_at = finished
+                            heapq.heappush(ready, (self.tasks[dependent].order, dependent))
+        if failure is not None:
+            raise failure
+        return {name: task.result for name, task in self.tasks.items()}
+
+    def _run_task(self, task):
+        task.started_at = time.monotonic()
+        return task.fn()
+
+    def timings(self):
+        """Per-task timing, in the order tasks were added"""
+        return [{'task': task.name, 'kind': task.kind, 'seconds': round(task.seconds, 3),
+                 'queued_s': round(task.started_at - task.ready_at, 3)}
+                for task in self.tasks.values() if task.seconds is not None]
+
+    def timings_by_kind(self):
+        """{kind: {'count', 'total_s', 'max_s'}} over the tasks that ran"""
+        kinds = {}
+        for task in self.tasks.values():
+            if task.seconds is None:
+                continue
+            totals = kinds.setdefault(task.kind, {'count': 0, 'total_s': 0.0, 'max_s': 0.0})
+            totals['count'] += 1
+            totals['total_s'] += task.seconds
+            totals['max_s'] = max(totals['max_s'], task.seconds)
+        return {kind: {'count': totals['count'], 'total_s': round(totals['total_s'], 3),
+                       'max_s': round(totals['max_s'], 3)} for kind, totals in kinds.items()}
+
+
+def then(future, fn):
+    """A Future for fn(future) once future is done; fn gets the finished Future, so it can fall back on an error"""
+    chained = Future()
+
+    def done(source):
+        try:
+            chained.set_result(fn(source))
+        except Exception as e:
+            chained.set_exception(e)
+    future.add_done_callback(done)
+    return chained
+
+
+def gather(futures):
+    """A Future for the list of futures, set once every one of them is done"""
+    gathered = Future()
+    futures = list(futures)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            finished = remaining[0] == 0
+        if finished:
+            gathered.set_result(futures)
+    if not futures:
+        gathered.set_result([])
+    for future in futures:
+        future.add_done_callback(done)
+    return gathered
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Deck generation progress events
+A small in-process event bus. build_deck publishes structured progress
+events on a channel (the deck job id) as it goes: each stage starting and
+finishing, speaker notes done for slide N, proofreading X of Y, and a final
+done or failed event. Subscribers - the SSE endpoint, telemetry listeners -
+read them from here.
+
+Every event gets a per-channel sequence number, and a channel keeps its
+recent history, so a subscriber that connects late or reconnects with
+Last-Event-ID replays what it missed. Closed channels are dropped after
+RETAIN_SECONDS.
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+HISTORY = 500
+RETAIN_SECONDS = 600
+
+
+class _Channel:
+    def __init__(self):
+        self.events = deque(maxlen=HISTORY)
+        self.seq = 0
+        self.closed_at = None
+
+
+class EventBus:
+    def __init__(self):
+        self._channels = {}
+        self._listeners = []
+        self._cond = threading.Condition()
+        self.stats = {'published': 0, 'channels_opened': 0, 'subscribers': 0}
+
+    def add_listener(self, listener):
+        """Call listener(channel, event) for every event on every channel (e.g. timing telemetry)"""
+        self._listeners.append(listener)
+
+    def publish(self, channel, event_type, **fields):
+        """Append an event to channel and wake its subscribers; returns the event"""
+        with self._cond:
+            state = self._channels.get(channel)
+            if state is None:
+                self._prune()
+                state = self._channels[channel] = _Channel()
+                self.stats['channels_opened'] += 1
+            state.seq += 1
+            event = {'seq': state.seq, 'type': event_type, 'ts': round(time.time(), 3), **fields}
+            state.events.append(event)
+            if event_type in ('done', 'failed'):
+                state.closed_at = time.monotonic()
+            self.stats['published'] += 1
+            self._cond.notify_all()
+        for listener in self._listeners:
+            try:
+                listener(channel, event)
+            except Exception as e:
+                logger.warning(f"Progress listener failed: {e}")
+        return event
+
+    def has_channel(self, channel):
+        with self._cond:
+            return channel in self._channels
+
+    def wait(self, channel, after=0, timeout=15.0):
+        """
+        Events on channel with seq > after, blocking up to timeout for the first
+        one. Returns (events, closed); events is empty on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                state = self._channels.get(channel)
+                events = [event for event in state.events if event['seq'] > after] if state else []
+                closed = state is not None and state.closed_at is not None
+                remaining = deadline - time.monotonic()
+                if events or closed or remaining <= 0:
+                    return events, closed
+                self._cond.wait(remaining)
+
+    def subscribe(self, channel, after=0, timeout=15.0):
+        """
+        Yield events on channel until it closes; yields None every timeout
+        seconds without an event, so the caller can send a keep-alive or stop.
+        """
+        with self._cond:
+            self.stats['subscribers'] += 1
+        try:
+            while True:
+                events, closed = self.wait(channel, after, timeout)
+                if not events and not closed:
+                    yield None
+                for event in events:
+                    after = event['seq']
+                    yield event
+                if closed:
+                    return
+        finally:
+            with self._cond:
+                self.stats['subscribers'] -= 1
+
+    def _prune(self):
+        """Drop channels closed more than RETAIN_SECONDS ago; called with the lock held"""
+        cutoff = time.monotonic() - RETAIN_SECONDS
+        for channel in [name for name, state in self._channels.items()
+                        if state.closed_at is not None and state.closed_at < cutoff]:
+            del self._channels[channel]
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats['open_channels'] = sum(1 for state in self._channels.values() if state.closed_at is None)
+        return stats
+
+
+bus = EventBus()
+
+
+class Progress:
+    """What build_deck publishes through: the events of one deck on one channel"""
+
+    def __init__(self, channel, bus=bus):
+        self.channel = channel
+        self.bus = bus
+
+    def emit(self, event_type, **fields):
+        return self.bus.publish(self.channel, event_type, **fields)
+
+    def counter(self, event_type, total, **fields):
+        """A thread-safe callable that emits event_type with done=n of total each time it is called"""
+        lock = threading.Lock()
+        done = [0]
+
+        def step(**extra):
+            with lock:
+                done[0] += 1
+                self.emit(event_type, done=done[0], total=total, **fields, **extra)
+        return step
+
+
+def get_stats():
+    return bus.get_stats()
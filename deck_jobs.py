@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Background deck generation jobs
+Generating a deck takes minutes of LLM calls and rendering. Instead of
+holding an HTTP request (and a gunicorn worker) open for all of it, the
+request is stored as a job in sqlite and answered with its id at once; a
+small pool of worker threads per process runs queued jobs and writes the
+.pptx to DECK_JOBS_DIR, and the client polls for status and then fetches
+the file.
+
+Because jobs live in sqlite, nothing queued is lost when a worker process
+restarts. A running job keeps a heartbeat; if it goes stale (the process
+running it died), any worker claims it again, up to MAX_ATTEMPTS times.
+Finished jobs and their files are removed after DECK_JOB_TTL seconds.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.environ.get('DECK_JOBS_DB_PATH', 'deck_jobs.db')
+JOBS_DIR = os.environ.get('DECK_JOBS_DIR', 'deck_jobs')
+WORKERS = int(os.environ.get('DECK_JOB_WORKERS', 2))
+JOB_TTL = int(os.environ.get('DECK_JOB_TTL', 24 * 3600))
+# A running job whose heartbeat is older than this has lost its worker
+STALE_AFTER = int(os.environ.get('DECK_JOB_STALE_SECONDS', 120))
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 1.0
+CLEANUP_EVERY = 300
+# Progress events are written at most this often per job, latest event only
+PROGRESS_FLUSH_SECONDS = 1.0
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+
+class JobQueue:
+    """
+    sqlite-backed queue of deck jobs. runner(job, output_path) does the work
+    for one job (a dict with 'id', 'user_id' and the request 'payload') and
+    may return a JSON-serializable summary that is kept with the job.
+    on_finish(job, status, error) is called once the outcome is recorded, or
+    with status 'failed' if it could not be.
+    """
+
+    def __init__(self, runner, db_path=JOBS_DB_PATH, output_dir=JOBS_DIR, workers=WORKERS, on_finish=None):
+        self.runner = runner
+        self.on_finish = on_finish
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self.workers = workers
+        self._pid = None
+        self._wake = threading.Event()
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._progress = {}
+        self._progress_lock = threading.Lock()
+        self._progress_wake = threading.Event()
+        self._last_cleanup = 0.0
+        self._init_db()
+
+    def _init_db(self):
+        conn = _connect(self.db_path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS deck_jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    file_path TEXT,
+                    summary TEXT,
+                    progress TEXT,
+                    error TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    heartbeat REAL,
+                    idempotency_key TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_deck_jobs_status ON deck_jobs (status, created_at)')
+            columns = [row['name'] for row in conn.execute('PRAGMA table_info(deck_jobs)')]
+            for column in ('progress', 'idempotency_key'):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE deck_jobs ADD COLUMN {column} TEXT')
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_deck_jobs_idempotency '
+                         'ON deck_jobs (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL')
+        finally:
+            conn.close()
+
+    def start(self):
+        """Start the worker and heartbeat threads; again in a forked worker, where threads do not survive"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._wake = threading.Event()
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._progress = {}
+        self._progress_lock = threading.Lock()
+        self._progress_wake = threading.Event()
+        os.makedirs(self.output_dir, exist_ok=True)
+        for index in range(self.workers):
+            threading.Thread(target=self._work, name=f"deck-job-{index}", daemon=True).start()
+        threading.Thread(target=self._heartbeat, name='deck-job-heartbeat', daemon=True).start()
+        threading.Thread(target=self._write_progress, name='deck-job-progress', daemon=True).start()
+
+    def submit(self, user_id, payload, idempotency_key=None):
+        """Queue a job; returns its id, or the id of the user's earlier job with the same idempotency_key"""
+        self.start()
+        job_id = uuid.uuid4().hex
+        conn = _connect(self.db_path)
+        try:
+            conn.execute('INSERT INTO deck_jobs (id, user_id, status, payload, created_at, idempotency_key) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (job_id, str(user_id), 'queued', json.dumps(payload), time.time(), idempotency_key))
+        except sqlite3.IntegrityError:
+            return conn.execute('SELECT id FROM deck_jobs WHERE user_id = ? AND idempotency_key = ?',
+                                (str(user_id), idempotency_key)).fetchone()['id']
+        finally:
+            conn.close()
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        """The job as a dict (without its payload), or None"""
+        conn = _connect(self.db_path)
+        try:
+            row = conn.execute('SELECT * FROM deck_jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            if job['status'] == 'queued':
+                job['queue_position'] = conn.execute(
+                    "SELECT COUNT(*) FROM deck_jobs WHERE status = 'queued' AND created_at < ?",
+                    (job['created_at'],)).fetchone()[0] + 1
+        finally:
+            conn.close()
+        job['payload'] = json.loads(job['payload'])
+        job['summary'] = json.loads(job['summary']) if job['summary'] else None
+        job['progress'] = json.loads(job['progress']) if job['progress'] else None
+        return job
+
+    def set_progress(self, job_id, event):
+        """
+        Record the job's latest progress event, for status readers in other
+        processes. Only buffers it: events are published from LLM callbacks on
+        the llm_client loop, so the write happens on the progress writer thread.
+        """
+        with self._progress_lock:
+            self._progress[job_id] = event
+        self._progress_wake.set()
+
+    def _write_progress(self):
+        """Write the buffered latest event of each job, at most every PROGRESS_FLUSH_SECONDS"""
+        while True:
+            self._progress_wake.wait()
+            self._progress_wake.clear()
+            with self._progress_lock:
+                pending, self._progress = self._progress, {}
+            try:
+                conn = _connect(self.db_path)
+                try:
+                    conn.executemany('UPDATE deck_jobs SET progress = ? WHERE id = ?',
+                                     [(json.dumps(event), job_id) for job_id, event in pending.items()])
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not record deck job progress: {e}")
+            time.sleep(PROGRESS_FLUSH_SECONDS)
+
+    def _claim(self):
+        """Atomically take the oldest queued job, or a running one whose worker has died"""
+        conn = _connect(self.db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            row = conn.execute('''
+                SELECT * FROM deck_jobs
+                WHERE status = 'queued' OR (status = 'running' AND heartbeat < ? AND attempts < ?)
+                ORDER BY created_at LIMIT 1
+            ''', (now - STALE_AFTER, MAX_ATTEMPTS)).fetchone()
+            if row is None:
+                # Give up on jobs whose worker died on every attempt
+                conn.execute('''
+                    UPDATE deck_jobs SET status = 'failed', error = 'Worker stopped while generating', finished_at = ?
+                    WHERE status = 'running' AND heartbeat < ? AND attempts >= ?
+                ''', (now, now - STALE_AFTER, MAX_ATTEMPTS))
+                conn.execute('COMMIT')
+                return None
+            conn.execute('''
+                UPDATE deck_jobs SET status = 'running', attempts = attempts + 1, started_at = ?, heartbeat = ?
+                WHERE id = ?
+            ''', (now, now, row['id']))
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        if job['status'] == 'running':
+            logger.warning(f"Deck job {job['id']} lost its worker, resuming it (attempt {job['attempts'] + 1})")
+        return job
+
+    def _finish(self, job_id, status, file_path=None, summary=None, error=None):
+        conn = _connect(self.db_path)
+        try:
+            conn.execute('''
+                UPDATE deck_jobs SET status = ?, file_path = ?, summary = ?, error = ?, finished_at = ?
+                WHERE id = ?
+            ''', (status, file_path, json.dumps(summary) if summary is not None else None, error, time.time(),
+                  job_id))
+        finally:
+            conn.close()
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.warning(f"Deck job queue unavailable: {e}")
+                job = None
+            if job is None:
+                self._cleanup()
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                # Never lose the worker thread to one job
+                logger.error(f"Deck job worker error on {job['id']}: {e}")
+
+    def _run(self, job):
+        output_path = os.path.join(self.output_dir, f"{job['id']}.pptx")
+        with self._running_lock:
+            self._running.add(job['id'])
+        started = time.monotonic()
+        status, error, summary = 'done', None, None
+        try:
+            summary = self.runner(job, output_path)
+            logger.info(f"Deck job {job['id']} done in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"Deck job {job['id']} failed: {e}")
+            status, error = 'failed', str(e)
+        try:
+            if status == 'done':
+                self._finish(job['id'], 'done', file_path=output_path, summary=summary)
+            else:
+                self._finish(job['id'], 'failed', error=error)
+        except Exception as e:
+            # The row stays 'running' and is reclaimed once its heartbeat stops;
+            # on_finish hears of a failure, so nothing is charged for an unrecorded deck
+            logger.error(f"Deck job {job['id']} could not be recorded as {status}: {e}")
+            status, error = 'failed', f"Could not save the job result: {e}"
+        finally:
+            with self._running_lock:
+                self._running.discard(job['id'])
+        if self.on_finish is not None:
+            try:
+                self.on_finish(job, status, error)
+            except Exception as e:
+                logger.warning(f"Deck job {job['id']} finish hook failed: {e}")
+
+    def _heartbeat(self):
+        """Keep this process's running jobs from looking abandoned"""
+        while True:
+            time.sleep(STALE_AFTER / 4)
+            with self._running_lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                conn = _connect(self.db_path)
+                try:
+                    conn.executemany('UPDATE deck_jobs SET heartbeat = ? WHERE id = ?',
+                                     [(time.time(), job_id) for job_id in running])
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Deck job heartbeat failed: {e}")
+
+    def _cleanup(self):
+        """Delete finished jobs older than JOB_TTL and their files"""
+        now = time.time()
+        if now - self._last_cleanup < CLEANUP_EVERY:
+            return
+        self._last_cleanup = now
+        try:
+            conn = _connect(self.db_path)
+            try:
+                expired = conn.execute("SELECT id, file_path FROM deck_jobs WHERE status IN ('done', 'failed') "
+                                       "AND finished_at < ?", (now - JOB_TTL,)).fetchall()
+                for row in expired:
+                    if row['file_path'] and os.path.exists(row['file_path']):
+                        os.remove(row['file_path'])
+                conn.executemany('DELETE FROM deck_jobs WHERE id = ?', [(row['id'],) for row in expired])
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Deck job cleanup failed: {e}")
+
+    def get_stats(self):
+        conn = _connect(self.db_path)
+        try:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM deck_jobs GROUP BY status').fetchall())
+        finally:
+            conn.close()
+        with self._running_lock:
+            running_here = len(self._running)
+        return {'workers': self.workers, 'running_here': running_here,
+                'jobs': {status: counts.get(status, 0) for status in STATUSES}}
@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Local stand-in for the Anthropic messages API
+Lets the LLM transport be exercised offline and repeatably: point
+ANTHROPIC_API_URL at it and every server variant talks to it instead of the
+real API. It supports:
+- configurable latency: a lognormal time-to-first-token per prompt type plus
+  per-input-token and per-output-token costs
+- fault injection: a fraction of requests answered 529 (with retry-after)
+  or left hanging so the client times out
+- streaming (server-sent events) as well as plain JSON responses
+- canned responses keyed by prompt type (outline JSON, single outline
+  sections, bullets, notes, single and batched proofreads, style
+  config), truncated at max_tokens like the real API
+- forced tool calls (tool_choice of type "tool"): the canned answer comes
+  back as a tool_use block whose input is the parsed JSON, or the answer's
+  lines for a tool with a single list field
+- per-model speed multipliers and per-model rates of unusable answers
+- prompt caching: a system block marked with cache_control and at least the
+  model's minimum cacheable length (1024 tokens, 2048 on Haiku) is reported as
+  a cache write the first time and a cache read afterwards, and cached input
+  tokens are processed ten times faster; a shorter one is billed as plain
+  input, as upstream does
+
+In-process:
+    with FakeAnthropic(latency=(0.2, 0.3), overload_rate=0.05) as fake:
+        os.environ['ANTHROPIC_API_URL'] = fake.url   # before importing llm_client
+
+As a subprocess:
+    python fake_anthropic.py --port 8765 --latency 0.2 --overload-rate 0.05
+    python fake_anthropic.py --bench 200          # quick throughput run
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# (median seconds, lognormal sigma) of the time to first token
+DEFAULT_LATENCY = (0.05, 0.3)
+# Cached input tokens cost this fraction of an uncached one to process
+CACHE_READ_FACTOR = 0.1
+# Shortest prefix upstream will cache, by model name substring
+CACHE_MIN_TOKENS = {'haiku': 2048}
+CACHE_DEFAULT_MIN_TOKENS = 1024
+STREAM_CHUNK_WORDS = 3
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _system_text(system):
+    if isinstance(system, str):
+        return system, False
+    blocks = system or []
+    text = ''.join(block.get('text', '') for block in blocks)
+    cacheable = any(block.get('cache_control') for block in blocks)
+    return text, cacheable
+
+
+def classify_prompt(prompt, system_text=''):
+    """Guess which PresPilot prompt this is, so the canned response has the right shape"""
+    text = f"{system_text}\n{prompt}"
+    if 'STYLE REQUEST' in text:
+        return 'style'
+    if 'OUTLINE SECTION REPAIR' in text:
+        return 'outline_section'
+    if 'CORRECTED ITEMS:' in text:
+        return 'proofread_batch'
+    if 'ORIGINAL SLIDE TEXT:' in text:
+        return 'proofread_slide'
+    if 'ORIGINAL SPEAKER NOTES:' in text:
+        return 'proofread_notes'
+    if re.search(r'\d+-slide presentation', text) and 'outline' in text.lower():
+        return 'outline'
+    if 'NO MORE THAN 5 WORDS' in text:
+        return 'concise_batch'
+    if 'bullet' in text.lower() and 'one per line' in text.lower():
+        return 'bullets'
+    if 'speaker notes' in text.lower() or 'Speaker notes:' in text:
+        return 'notes'
+    return 'text'
+
+
+def _between(text, start, end):
+    match = re.search(re.escape(start) + r'\s*(.*?)\s*' + re.escape(end), text, re.DOTALL)
+    return match.group(1) if match else ''
+
+
+def _canned_outline(prompt):
+    match = re.search(r'(\d+)-slide presentation on:\s*(.+)', prompt)
+    num_slides = int(match.group(1)) if match else 5
+    topic = match.group(2).strip() if match else 'the topic'
+    titles = ['Overview', 'Background', 'Key Benefits', 'Statistics', 'Challenges',
+              'Implementation', 'Case Study', 'Best Practices', 'Future Trends', 'Summary']
+    sections = []
+    for i in range(num_slides):
+        title = titles[i % len(titles)]
+        sections.append({
+            'title': title,
+            'facts': [f"{title} point {j + 1} about {topic} includes a specific figure of {10 * (i + 1) + j} percent."
+                      for j in range(3)]
+        })
+    return json.dumps({'sections': sections}, indent=2)
+
+
+def _canned_outline_section(prompt):
+    match = re.search(r'Write section (\d+)(?: \("(.+?)"\))?', prompt)
+    number = int(match.group(1)) if match else 1
+    title = match.group(2) if match and match.group(2) else f"Part {number}"
+    return json.dumps({'title': title,
+                       'facts': [f"{title} point {j + 1} adds a specific figure of {5 * number + j} percent." for j in range(3)]})
+
+
+def _canned_concise(prompt):
+    lines = re.findall(r'^\s*\d+\.\s*(.+)$', prompt, re.MULTILINE)
+    return '\n'.join(' '.join(line.split()[:5]) for line in lines)
+
+
+def _canned_notes(prompt):
+    title = _between(prompt, 'titled "', '"') or _between(prompt, 'slide about "', '"') or 'this slide'
+    return (f"Let's look at {title}. This slide brings together the key points and puts them in context. "
+            f"Notably, each point builds on the previous one with concrete examples. "
+            f"In practice, teams that apply these ideas see measurable results within months. "
+            f"Keep these points in mind as we move on to the next part of the presentation.")
+
+
+def _canned_style():
+    return json.dumps({
+        'theme_name': 'Offline Teal', 'primary_color': '#00695C', 'secondary_color': '#004D40',
+        'accent_color': '#FFB300', 'background_color': '#FAFAFA', 'text_color': '#212121',
+        'title_font': 'Montserrat', 'body_font': 'Open Sans', 'title_size': 40, 'body_size': 20,
+        'style_description': 'A calm teal palette with warm amber accents around image placeholders.',
+        'mood': 'refined', 'image_placeholder_style': 'themed', 'image_placeholder_size': 'medium',
+        'image_placeholder_position': 'alternating (left, right, top, bottom rotation)',
+        'layout_preference': 'balanced (text and images get equal space)'
+    }, indent=2)
+
+
+def canned_response(prompt_type, prompt):
+    """Default response text for each prompt type"""
+    if prompt_type == 'outline':
+        return _canned_outline(prompt)
+    if prompt_type == 'outline_section':
+        return _canned_outline_section(prompt)
+    if prompt_type == 'concise_batch':
+        return _canned_concise(prompt)
+    if prompt_type == 'bullets':
+        return '\n'.join(['Rapid market growth', 'Lower operating costs', 'Higher customer satisfaction'])
+    if prompt_type == 'notes':
+        return _canned_notes(prompt)
+    if prompt_type == 'proofread_slide':
+        return _between(prompt, 'ORIGINAL SLIDE TEXT:', 'CORRECTED TEXT:') or prompt
+    if prompt_type == 'proofread_batch':
+        return json.dumps({'items': json.loads(_between(prompt, 'ITEMS:', 'CORRECTED ITEMS:') or '[]')})
+    if prompt_type == 'proofread_notes':
+        return _between(prompt, 'ORIGINAL SPEAKER NOTES:', 'CORRECTED NOTES:') or prompt
+    if prompt_type == 'style':
+        return _canned_style()
+    return 'This is a canned response from the local fake Anthropic server.'
+
+
+def tool_input(tool, text):
+    """Shape a canned text answer as the input of a forced tool call"""
+    try:
+        value = json.loads(text)
+        if isinstance(value, dict):
+            return value
+    except json.JSONDecodeError:
+        pass
+    properties = tool.get('input_schema', {}).get('properties', {})
+    lists = [name for name, schema in properties.items() if schema.get('type') == 'array']
+    if len(lists) == 1:
+        return {lists[0]: [line.strip() for line in text.splitlines() if line.strip()]}
+    # Unusable answer: the model ignored the schema
+    return {'answer': text}
+
+
+class FakeAnthropic:
+    """
+    Threaded HTTP server answering POST /v1/messages.
+    GET /stats returns request counters; POST /reset clears them and the prompt cache.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=DEFAULT_LATENCY, latency_by_type=None,
+                 input_token_seconds=0.0, output_token_seconds=0.0, overload_rate=0.0,
+                 overload_status=529, retry_after=1, timeout_rate=0.0, hang_seconds=300.0,
+                 responses=None, model_speed=None, invalid_rate_by_model=None, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_by_type = latency_by_type or {}
+        self.input_token_seconds = input_token_seconds
+        self.output_token_seconds = output_token_seconds
+        self.overload_rate = overload_rate
+        self.overload_status = overload_status
+        self.retry_after = retry_after
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        # prompt_type -> text, or callable(prompt) -> text, overriding the canned defaults
+        self.responses = responses or {}
+        # model name substring -> latency multiplier, e.g. {'haiku': 0.4, 'opus': 2.0}
+        self.model_speed = model_speed or {}
+        # model name substring -> fraction of answers replaced by unusable text (exercises validation fallback)
+        self.invalid_rate_by_model = invalid_rate_by_model or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._cached_prefixes = set()
+        self._stopping = threading.Event()
+        self._server = None
+        self._thread = None
+        self.stats = {}
+        self.reset()
+
+    # ----- lifecycle -----
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1/messages"
+
+    def start(self):
+        fake = self
+
+        class Handler(_Handler):
+            server_fake = fake
+
+        self._stopping.clear()
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-anthropic', daemon=True)
+        self._thread.start()
+        logger.info(f"Fake Anthropic API listening on {self.url}")
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self._cached_prefixes.clear()
+            self.stats = {'requests': 0, 'streamed': 0, 'overloaded': 0, 'hung': 0,
+                          'cache_reads': 0, 'cache_writes': 0, 'cache_too_small': 0, 'in_flight': 0, 'peak_in_flight': 0,
+                          'invalid': 0, 'by_type': {}, 'by_model': {}}
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['by_type'] = dict(self.stats['by_type'])
+            stats['by_model'] = dict(self.stats['by_model'])
+        return stats
+
+    # ----- simulation -----
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+            if name == 'in_flight':
+                self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.stats['in_flight'])
+
+    def _roll(self, rate):
+        with self._lock:
+            return self._random.random() < rate
+
+    def _first_token_delay(self, prompt_type):
+        median, sigma = self.latency_by_type.get(prompt_type, self.latency)
+        with self._lock:
+            return median * self._random.lognormvariate(0, sigma) if sigma else median
+
+    def _for_model(self, table, model, default):
+        return next((value for name, value in table.items() if name in model), default)
+
+    def sleep(self, seconds):
+        """Sleep that ends early when the server is stopped"""
+        self._stopping.wait(max(0.0, seconds))
+
+    def plan(self, payload):
+        """Work out the response text, token usage and delays for one request"""
+        messages = payload.get('messages', [])
+        prompt = next((m.get('content', '') for m in messages if m.get('role') == 'user'), '')
+        if isinstance(prompt, list):
+            prompt = ''.join(block.get('text', '') for block in prompt)
+        prefill = messages[-1].get('content', '') if messages and messages[-1].get('role') == 'assistant' else ''
+        system_text, cacheable = _system_text(payload.get('system'))
+        prompt_type = classify_prompt(prompt, system_text)
+
+        model = payload.get('model', 'fake-model')
+        custom = self.responses.get(prompt_type)
+        text = custom(prompt) if callable(custom) else custom if custom is not None else \
+            canned_response(prompt_type, prompt)
+        if self._roll(self._for_model(self.invalid_rate_by_model, model, 0.0)):
+            self._count('invalid')
+            text = "I'm not sure what you would like me to do with this text. Could you clarify?"
+        if prefill and text.startswith(prefill):
+            # Continuation of a truncated reply: only the remainder is generated
+            text = text[len(prefill):]
+
+        tool = None
+        choice = payload.get('tool_choice') or {}
+        if choice.get('type') == 'tool':
+            tool = next((t for t in payload.get('tools', []) if t.get('name') == choice.get('name')), None)
+        tool_args = tool_input(tool, text) if tool else None
+        if tool_args is not None:
+            text = json.dumps(tool_args)
+
+        max_tokens = int(payload.get('max_tokens', 1024))
+        stop_reason = 'tool_use' if tool else 'end_turn'
+        if estimate_tokens(text) > max_tokens:
+            text = text[:max_tokens * 4]
+            stop_reason = 'max_tokens'
+            if tool:
+                tool_args = {}
+
+        usage = {'input_tokens': estimate_tokens(prompt) + estimate_tokens(prefill) +
+                                 (estimate_tokens(json.dumps(tool)) if tool else 0),
+                 'output_tokens': estimate_tokens(text),
+                 'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0}
+        system_tokens = estimate_tokens(system_text)
+        if cacheable and system_tokens < self._for_model(CACHE_MIN_TOKENS, model, CACHE_DEFAULT_MIN_TOKENS):
+            cacheable = False
+            self._count('cache_too_small')
+        if cacheable:
+            with self._lock:
+                hit = system_text in self._cached_prefixes
+                self._cached_prefixes.add(system_text)
+            usage['cache_read_input_tokens' if hit else 'cache_creation_input_tokens'] = system_tokens
+            self._count('cache_reads' if hit else 'cache_writes')
+            processed = usage['input_tokens'] + (system_tokens * CACHE_READ_FACTOR if hit else system_tokens)
+        else:
+            usage['input_tokens'] += system_tokens
+            processed = usage['input_tokens']
+
+        with self._lock:
+            self.stats['by_type'][prompt_type] = self.stats['by_type'].get(prompt_type, 0) + 1
+            self.stats['by_model'][model] = self.stats['by_model'].get(model, 0) + 1
+
+        return {
+            'prompt_type': prompt_type,
+            'model': model,
+            'text': text,
+            'tool': tool,
+            'tool_input': tool_args,
+            'stop_reason': stop_reason,
+            'usage': usage,
+            'first_token_delay': (self._first_token_delay(prompt_type) + processed * self.input_token_seconds)
+                                 * self._for_model(self.model_speed, model, 1.0),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_fake = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.server_fake.get_stats())
+        else:
+            self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+
+    def do_POST(self):
+        fake = self.server_fake
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length) if length else b''
+
+        if self.path.rstrip('/') == '/reset':
+            fake.reset()
+            self._send_json(200, {'reset': True})
+            return
+        if not self.path.rstrip('/').endswith('/messages'):
+            self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+            return
+
+        try:
+            payload = json.loads(raw or b'{}')
+        except json.JSONDecodeError as e:
+            self._send_json(400, {'type': 'error', 'error': {'type': 'invalid_request_error', 'message': str(e)}})
+            return
+
+        fake._count('requests')
+        fake._count('in_flight')
+        try:
+            if fake._roll(fake.timeout_rate):
+                fake._count('hung')
+                fake.sleep(fake.hang_seconds)
+                self.close_connection = True
+                return
+            if fake._roll(fake.overload_rate):
+                fake._count('overloaded')
+                fake.sleep(fake._first_token_delay(None) / 2)
+                self._send_json(fake.overload_status,
+                                {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}},
+                                headers={'retry-after': str(fake.retry_after)})
+                return
+
+            plan = fake.plan(payload)
+            if payload.get('stream'):
+                fake._count('streamed')
+                self._stream(fake, plan)
+            else:
+                fake.sleep(plan['first_token_delay'] + plan['usage']['output_tokens'] * fake.output_token_seconds)
+                self._send_json(200, {
+                    'id': f"msg_fake_{time.time_ns()}",
+                    'type': 'message',
+                    'role': 'assistant',
+                    'model': plan['model'],
+                    'content': [{'type': 'tool_use', 'id': f"toolu_fake_{time.time_ns()}",
+                                 'name': plan['tool']['name'], 'input': plan['tool_input']}] if plan['tool']
+                               else [{'type': 'text', 'text': plan['text']}],
+                    'stop_reason': plan['stop_reason'],
+                    'usage': plan['usage'],
+                })
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            fake._count('in_flight', -1)
+
+    def _stream(self, fake, plan):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(name, body):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(body)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        usage = dict(plan['usage'])
+        event('message_start', {'type': 'message_start', 'message': {
+            'id': f"msg_fake_{time.time_ns()}", 'type': 'message', 'role': 'assistant', 'model': plan['model'],
+            'content': [], 'stop_reason': None, 'usage': dict(usage, output_tokens=1)}})
+        event('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                      'content_block': {'type': 'text', 'text': ''}})
+        fake.sleep(plan['first_token_delay'])
+
+        words = re.findall(r'\S+\s*', plan['text'])
+        for i in range(0, len(words), STREAM_CHUNK_WORDS):
+            chunk = ''.join(words[i:i + STREAM_CHUNK_WORDS])
+            fake.sleep(estimate_tokens(chunk) * fake.output_token_seconds)
+            event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                          'delta': {'type': 'text_delta', 'text': chunk}})
+
+        event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        event('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': plan['stop_reason']},
+                                'usage': {'output_tokens': usage['output_tokens']}})
+        event('message_stop', {'type': 'message_stop'})
+
+
+# ============= Command line =============
+
+def _bench(fake, count, concurrency_label):
+    """Send count mixed prompts through llm_client.run_many and print latency/throughput"""
+    os.environ['ANTHROPIC_API_URL'] = fake.url
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'fake-key')
+    os.environ.setdefault('LLM_CACHE_ENABLED', 'false')
+    import llm_client
+
+    prompts = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            prompts.append({'prompt': f"ORIGINAL SLIDE TEXT:\nBullet number {i}\n\nCORRECTED TEXT:",
+                            'max_tokens': 500, 'prompt_type': 'proofread_slide'})
+        elif kind == 1:
+            prompts.append({'prompt': f'Create detailed speaker notes for a presentation slide about "Topic {i}".\n\n'
+                                      'Speaker notes:', 'max_tokens': 500, 'prompt_type': 'deck_notes'})
+        else:
+            prompts.append({'prompt': f"Create a detailed outline for a 5-slide presentation on: topic {i}",
+                            'max_tokens': 3000, 'prompt_type': 'outline'})
+
+    started = time.monotonic()
+    results = llm_client.run_many(prompts, max_retries=6)
+    elapsed = time.monotonic() - started
+    failures = sum(1 for result in results if isinstance(result, Exception))
+    print(f"{count} calls ({concurrency_label}) in {elapsed:.2f}s = {count / elapsed:.1f} calls/s, {failures} failed")
+    print(json.dumps({'fake': fake.get_stats(), 'limiter': llm_client.llm_limiter.get_stats(),
+                      'latency': llm_client.llm_latency.get_stats()}, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local fake Anthropic messages API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY[0],
+                        help='median seconds to first token')
+    parser.add_argument('--sigma', type=float, default=DEFAULT_LATENCY[1], help='lognormal spread of the latency')
+    parser.add_argument('--input-token-seconds', type=float, default=0.0)
+    parser.add_argument('--output-token-seconds', type=float, default=0.0)
+    parser.add_argument('--overload-rate', type=float, default=0.0, help='fraction of requests answered 529')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='fraction of requests left hanging')
+    parser.add_argument('--hang-seconds', type=float, default=300.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--bench', type=int, default=0, metavar='N',
+                        help='run N mixed calls through llm_client against an in-process server, then exit')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeAnthropic(host=args.host, port=0 if args.bench else args.port,
+                         latency=(args.latency, args.sigma),
+                         input_token_seconds=args.input_token_seconds,
+                         output_token_seconds=args.output_token_seconds,
+                         overload_rate=args.overload_rate, timeout_rate=args.timeout_rate,
+                         hang_seconds=args.hang_seconds, seed=args.seed)
+
+    with fake:
+        if args.bench:
+            _bench(fake, args.bench, f"overload_rate={args.overload_rate}")
+            return 0
+        print(f"export ANTHROPIC_API_URL={fake.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+PresPilot - gunicorn settings
+    gunicorn -c gunicorn.conf.py server:app
+
+Threaded workers are required. A deck job's progress stream
+(/api/presentations/jobs/<id>/events) holds its thread until it ends, at most
+DECK_SSE_MAX_SECONDS, and with the default sync workers a few open progress
+tabs would leave no worker for other requests. llm_client sizes its
+connection pool from GUNICORN_THREADS as well.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+# Slow LLM calls run in background jobs now, but the synchronous endpoints still wait on them
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+keepalive = 5
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Cross-request micro-batching of small prompts
+Proofreading a slide title or bullet is a tiny prompt with a large fixed
+cost per upstream call. A MicroBatcher collects such jobs from every request
+thread for up to LLM_BATCH_MAX_WAIT_MS or LLM_BATCH_MAX_ITEMS items (a whole
+deck can be queued at once with submit_many), sends them as one JSON list of
+{"id", "text"} items, and gets the corrections back by id as schema-checked
+tool input. Each returned item is checked against its original: an id that
+is missing, repeated, or whose text no longer resembles the input it claims
+to correct is retried on its own with the normal single-item prompt.
+
+Per-item results still go through llm_cache under the single-item key, so
+a batched and an unbatched run of the same deck share cached proofreads. A
+MemoTable (llm_memo), if given, is checked before either and remembers every
+accepted correction by its normalized text.
+"""
+
+import os
+import json
+import time
+import logging
+import difflib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import llm_cache
+import llm_client
+import llm_ledger
+import llm_limiter
+import llm_routing
+import llm_schema
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('LLM_BATCH_ENABLED', 'true').lower() == 'true'
+MAX_ITEMS = int(os.environ.get('LLM_BATCH_MAX_ITEMS', 20))
+MAX_WAIT = int(os.environ.get('LLM_BATCH_MAX_WAIT_MS', 25)) / 1000.0
+# Output budget per batched item, on top of a fixed allowance
+TOKENS_PER_ITEM = 80
+BATCH_BASE_TOKENS = 100
+# A correction less similar than this to its original is taken to belong to another item
+MIN_ALIGNMENT = 0.4
+
+BATCH_TOOL = llm_schema.tool('record_corrections', 'Record the corrected text of every item, by id.', {
+    'type': 'object',
+    'properties': {
+        'items': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'id': {'type': 'integer'},
+                    'text': {'type': 'string'},
+                },
+                'required': ['id', 'text'],
+            },
+        },
+    },
+    'required': ['items'],
+})
+
+_batchers = []
+
+
+class _Job:
+    __slots__ = ('text', 'future', 'enqueued', 'context')
+
+    def __init__(self, text):
+        self.text = text
+        self.future = Future()
+        self.enqueued = time.monotonic()
+        self.context = llm_ledger.current()
+
+
+def build_batch_prompt(texts):
+    """User block listing the items as JSON, with ids from 1"""
+    items = json.dumps([{'id': i, 'text': text} for i, text in enumerate(texts, 1)], ensure_ascii=False, indent=1)
+    return f"""ITEMS:
+{items}
+
+CORRECTED ITEMS:"""
+
+
+def similarity(original, corrected):
+    return difflib.SequenceMatcher(None, original.lower(), corrected.lower()).ratio()
+
+
+def _aligned(texts, number, corrected):
+    """The correction resembles its own original, and that more than either neighbour's (a shifted answer)"""
+    own = similarity(texts[number - 1], corrected)
+    if own < MIN_ALIGNMENT:
+        return False
+    neighbours = [texts[n - 1] for n in (number - 1, number + 1) if 1 <= n <= len(texts)]
+    return all(similarity(text, corrected) <= own for text in neighbours)
+
+
+def align(texts, items):
+    """
+    Map id -> corrected text for each returned item that can be trusted: a known
+    id, seen once, non-empty, and aligned with the original under that id
+    """
+    results = {}
+    repeated = set()
+    for item in items:
+        number = item['id']
+        if not 1 <= number <= len(texts) or not item['text'].strip():
+            continue
+        if number in results:
+            repeated.add(number)
+            continue
+        if _aligned(texts, number, item['text']):
+            results[number] = item['text'].strip()
+    for number in repeated:
+        results.pop(number, None)
+    return results
+
+
+def _plausible_correction(original):
+    """Validator for a single correction: non-empty and not wildly longer than the input"""
+    return lambda corrected: 0 < len(corrected.strip()) <= 3 * len(original) + 40
+
+
+class MicroBatcher:
+    """
+    Collects single-line jobs of one prompt type and runs them in batches.
+    single_prompt(text) builds the unbatched prompt (sent with system);
+    batch_system must ask for every item back by id through BATCH_TOOL.
+    """
+
+    def __init__(self, name, single_prompt, system, batch_system, prompt_type, model=None, api_key=None,
+                 single_max_tokens=500, max_items=MAX_ITEMS, max_wait=MAX_WAIT, memo=None):
+        self.name = name
+        self.single_prompt = single_prompt
+        self.system = system
+        self.batch_system = batch_system
+        self.prompt_type = prompt_type
+        self.model = model
+        self.api_key = api_key
+        self.single_max_tokens = single_max_tokens
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self.memo = memo
+        self.stats = {'submitted': 0, 'memo_hits': 0, 'cache_hits': 0, 'batches': 0, 'batched_items': 0,
+                      'singles': 0, 'fallbacks': 0, 'failed_batches': 0}
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        _batchers.append(self)
+
+    def _ensure_started(self):
+        """Start the collector thread; again in a forked worker, where threads do not survive"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._cond = threading.Condition()
+            self._queue = []
+            self._executor = ThreadPoolExecutor(max_workers=llm_limiter.MAX_CONCURRENCY,
+                                                thread_name_prefix=f"llm-batch-{self.name}")
+            threading.Thread(target=self._collect, name=f"llm-batch-{self.name}", daemon=True).start()
+            # Only now, so no other thread skips ahead to a half-built batcher
+            self._pid = os.getpid()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def _model(self):
+        return llm_routing.model_for(self.prompt_type, self.model) or llm_client.DEFAULT_MODEL
+
+    def _cache_key(self, text):
+        # Same key llm_client uses for the single-item prompt
+        return llm_cache.make_key(self._model(), self.single_prompt(text), self.single_max_tokens, self.system)
+
+    def submit(self, text):
+        """Queue one item; returns a Future resolving to the corrected text"""
+        return self.submit_many([text])[0]
+
+    def submit_many(self, texts):
+        """Queue several items (e.g. every title and bullet of a deck) together; returns their Futures in order"""
+        self._ensure_started()
+        self._count('submitted', len(texts))
+        queued = []
+        futures = []
+        for text in texts:
+            job = _Job(text)
+            futures.append(job.future)
+            memoized = self.memo.get(text) if self.memo is not None else None
+            if memoized is not None:
+                self._count('memo_hits')
+                job.future.set_result(memoized)
+                continue
+            if llm_cache.is_cacheable(self.prompt_type):
+                cached = llm_cache.get(self._cache_key(text), self.prompt_type)
+                if cached is not None:
+                    self._count('cache_hits')
+                    llm_ledger.record_cache_hit(self.prompt_type, self._model())
+                    job.future.set_result(cached)
+                    continue
+            if not ENABLED:
+                self._executor.submit(self._dispatch, [job])
+            else:
+                queued.append(job)
+
+        if queued:
+            # Queued under one lock, so a deck's items land in the same batches
+            with self._cond:
+                self._queue.extend(queued)
+                self._cond.notify()
+        return futures
+
+    def _collect(self):
+        """Cut the queue into batches of up to max_items, waiting at most max_wait after the oldest job"""
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                deadline = self._queue[0].enqueued + self.max_wait
+                while len(self._queue) < self.max_items:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._queue[:self.max_items]
+                del self._queue[:self.max_items]
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        llm_ledger.bind(**batch[0].context)
+        try:
+            if len(batch) == 1:
+                self._run_single(batch)
+            else:
+                self._run_batch(batch)
+        except Exception as e:
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(e)
+
+    def _run_single(self, jobs):
+        """Unbatched prompts, run concurrently; used for lone jobs and batch fallbacks"""
+        self._count('singles', len(jobs))
+        prompts = [{'prompt': self.single_prompt(job.text), 'max_tokens': self.single_max_tokens,
+                    'prompt_type': self.prompt_type, 'system': self.system,
+                    'validate': _plausible_correction(job.text)} for job in jobs]
+        results = llm_client.run_many(prompts, model=self.model, api_key=self.api_key)
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                job.future.set_exception(result)
+                continue
+            if self.memo is not None and _plausible_correction(job.text)(result):
+                self.memo.put(job.text, result.strip())
+            job.future.set_result(result)
+
+    def _run_batch(self, batch):
+        texts = [job.text.strip() for job in batch]
+        max_tokens = BATCH_BASE_TOKENS + TOKENS_PER_ITEM * len(batch)
+        # Together, so get_stats never sees one without the other
+        with self._stats_lock:
+            self.stats['batches'] += 1
+            self.stats['batched_items'] += len(batch)
+        try:
+            # A mostly unusable answer is worth one retry on a larger model;
+            # a few bad items are cheaper to redo one by one
+            result = llm_client.call_structured(build_batch_prompt(texts), BATCH_TOOL, max_tokens=max_tokens,
+                                                model=self.model, api_key=self.api_key,
+                                                prompt_type=f"{self.prompt_type}_batch", system=self.batch_system,
+                                                validate=lambda answer: len(align(texts, answer['items'])) * 2 >= len(texts))
+            results = align(texts, result['items'])
+        except llm_schema.SchemaError as e:
+            logger.warning(f"Batched {self.name} answer did not match its schema: {e}")
+            self._count('failed_batches')
+            results = {}
+
+        missing = []
+        for number, job in enumerate(batch, 1):
+            corrected = results.get(number)
+            if corrected is None:
+                missing.append(job)
+                continue
+            if llm_cache.is_cacheable(self.prompt_type):
+                llm_cache.put(self._cache_key(job.text), self.prompt_type, corrected)
+            if self.memo is not None:
+                self.memo.put(job.text, corrected)
+            job.future.set_result(corrected)
+
+        if missing:
+            logger.warning(f"Batched {self.name} answer had {len(missing)}/{len(batch)} missing or misaligned items, "
+                           f"retrying them singly")
+            self._count('fallbacks', len(missing))
+            self._run_single(missing)
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['avg_batch_size'] = round(stats['batched_items'] / stats['batches'], 1) if stats['batches'] else 0.0
+        stats['max_items'] = self.max_items
+        stats['max_wait_ms'] = int(self.max_wait * 1000)
+        return stats
+
+
+def get_stats():
+    return {'enabled': ENABLED, 'batchers': {batcher.name: batcher.get_stats() for batcher in _batchers}}
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+PresPilot - max_tokens right-sizing from observed usage
+Call sites ask for generous max_tokens (3000 for an outline, 500 for a
+one-line proofread). This module records usage.output_tokens and whether the
+response stopped on max_tokens per prompt type, and once enough samples
+exist it picks a tighter budget: the observed p99 plus a safety margin,
+never above what the caller asked for. A response that still hits the
+tighter budget is continued by llm_client rather than restarted.
+"""
+
+import os
+import math
+import threading
+from collections import deque
+
+ENABLED = os.environ.get('LLM_BUDGET_ENABLED', 'true').lower() == 'true'
+WINDOW = 500
+MIN_SAMPLES = 30
+SAFETY_MARGIN = 1.25
+# Budgets are rounded up to this granularity and never go below MIN_BUDGET
+GRANULARITY = 64
+MIN_BUDGET = 64
+
+_lock = threading.Lock()
+_usage = {}
+_truncations = {}
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(math.ceil(pct / 100.0 * len(ordered))) - 1)
+    return ordered[max(0, index)]
+
+
+def record(prompt_type, output_tokens, truncated):
+    """Record the total output tokens one completed response needed"""
+    if not prompt_type or not output_tokens:
+        return
+    with _lock:
+        window = _usage.get(prompt_type)
+        if window is None:
+            window = _usage[prompt_type] = deque(maxlen=WINDOW)
+        window.append(output_tokens)
+        if truncated:
+            _truncations[prompt_type] = _truncations.get(prompt_type, 0) + 1
+
+
+def budget_for(prompt_type, requested):
+    """max_tokens to send for this prompt type, at most the caller's requested value"""
+    if not ENABLED or not prompt_type:
+        return requested
+    with _lock:
+        window = list(_usage.get(prompt_type, ()))
+    if len(window) < MIN_SAMPLES:
+        return requested
+    budget = _percentile(window, 99) * SAFETY_MARGIN
+    budget = int(math.ceil(budget / GRANULARITY) * GRANULARITY)
+    return min(requested, max(MIN_BUDGET, budget))
+
+
+def get_stats():
+    """Observed output-token distribution and current budget per prompt type"""
+    with _lock:
+        snapshot = {key: list(window) for key, window in _usage.items()}
+        truncations = dict(_truncations)
+    stats = {}
+    for prompt_type, window in sorted(snapshot.items()):
+        stats[prompt_type] = {
+            'count': len(window),
+            'p50': _percentile(window, 50),
+            'p99': _percentile(window, 99),
+            'max': max(window),
+            'truncations': truncations.get(prompt_type, 0),
+            'budget': budget_for(prompt_type, 10 ** 6) if len(window) >= MIN_SAMPLES else None,
+        }
+    return {'enabled': ENABLED, 'by_type': stats}
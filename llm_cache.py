@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Persistent LLM response cache
+Content-addressed store in front of llm_client.call_anthropic(). Entries are
+keyed by a hash of (model, prompt, max_tokens) and live in a local sqlite
+file, bounded by a TTL and a total size with least-recently-used eviction.
+
+Only prompt types listed in LLM_CACHE_TYPES are cached, so prompts that are
+expected to vary between calls (e.g. research outlines) are never served
+stale.
+"""
+
+import os
+import time
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.environ.get('LLM_CACHE_PATH', 'llm_cache.db')
+CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 7 * 24 * 3600))
+CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+CACHE_TYPES = {
+    t.strip() for t in os.environ.get(
+        'LLM_CACHE_TYPES', 'proofread_slide,proofread_notes,deck_notes,concise_batch'
+    ).split(',') if t.strip()
+}
+
+_lock = threading.Lock()
+_stats = {}
+
+
+class SqliteStore:
+    """
+    One sqlite table used as a bounded store: the response cache here, and
+    llm_memo, deck_artifacts and deck_checkpoints. Rows can expire by age
+    (ttl_column older than ttl seconds) and, if the table has size and
+    last_access columns, are evicted least recently used first once they
+    total more than max_bytes.
+
+    Every store is an optimization - callers log a sqlite3.Error and carry on
+    as if on a miss, and never fail a request because of it.
+    """
+
+    def __init__(self, path, table, columns, indexes=(), max_bytes=None, ttl_column=None, ttl=None,
+                 evict_every=50):
+        self.path = path
+        self.table = table
+        self.schema = [f"CREATE TABLE IF NOT EXISTS {table} ({columns})"]
+        self.schema += [f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})" for column in indexes]
+        self.max_bytes = max_bytes
+        self.ttl_column = ttl_column
+        self.ttl = ttl
+        # Eviction runs every N writes rather than on every put
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def connection(self):
+        """One sqlite connection per thread (and per forked worker), in WAL mode so gunicorn workers share the file"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.schema:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def wrote(self):
+        """Count one write; returns how many rows the periodic eviction removed, if it ran"""
+        with self._lock:
+            self._writes += 1
+            run_eviction = self._writes % self.evict_every == 0
+        return self.evict() if run_eviction else 0
+
+    def evict(self):
+        """Drop expired rows, then the least recently used until the table is under max_bytes"""
+        conn = self.connection()
+        removed = 0
+        if self.ttl_column:
+            removed += conn.execute(f"DELETE FROM {self.table} WHERE {self.ttl_column} < ?",
+                                    (time.time() - self.ttl,)).rowcount
+        if self.max_bytes is not None:
+            total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            if total > self.max_bytes:
+                for rowid, size in conn.execute(
+                        f"SELECT rowid, size FROM {self.table} ORDER BY last_access ASC").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute(f"DELETE FROM {self.table} WHERE rowid = ?", (rowid,))
+                    total -= size
+                    removed += 1
+        if removed:
+            logger.info(f"{self.table} evicted {removed} entries")
+        return removed
+
+
+_store = SqliteStore(CACHE_PATH, 'llm_cache', '''
+    key TEXT PRIMARY KEY,
+    prompt_type TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+''', indexes=['last_access'], max_bytes=CACHE_MAX_BYTES, ttl_column='created_at', ttl=CACHE_TTL)
+
+
+def get_connection():
+    """This thread's connection to the cache file; llm_singleflight keeps its leases there too"""
+    return _store.connection()
+
+
+def is_cacheable(prompt_type):
+    """Whether responses for this prompt type may be served from the cache"""
+    return CACHE_ENABLED and prompt_type in CACHE_TYPES
+
+
+def make_key(model, prompt, max_tokens, system=None, tool=None):
+    """Content hash identifying one upstream request"""
+    digest = hashlib.sha256()
+    digest.update(f"{model}\x00{max_tokens}\x00".encode('utf-8'))
+    if system:
+        digest.update(system.encode('utf-8'))
+        digest.update(b'\x00')
+    if tool:
+        digest.update(json.dumps(tool, sort_keys=True).encode('utf-8'))
+        digest.update(b'\x00')
+    digest.update(prompt.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _count(prompt_type, outcome):
+    with _lock:
+        counters = _stats.setdefault(prompt_type, {'hits': 0, 'misses': 0})
+        counters[outcome] += 1
+
+
+def get(key, prompt_type):
+    """Return the cached response text, or None on a miss or expired entry"""
+    now = time.time()
+    try:
+        conn = get_connection()
+        row = conn.execute('SELECT response, created_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+        if row is None or now - row[1] > CACHE_TTL:
+            if row is not None:
+                conn.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+            _count(prompt_type, 'misses')
+            return None
+        conn.execute('UPDATE llm_cache SET last_access = ? WHERE key = ?', (now, key))
+        _count(prompt_type, 'hits')
+        return row[0]
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache read failed: {e}")
+        _count(prompt_type, 'misses')
+        return None
+
+
+def put(key, prompt_type, response):
+    """Store a response and periodically evict expired and least-recently-used entries"""
+    now = time.time()
+    try:
+        conn = get_connection()
+        conn.execute('''
+            INSERT OR REPLACE INTO llm_cache (key, prompt_type, response, size, created_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (key, prompt_type, response, len(response.encode('utf-8')), now, now))
+        _store.wrote()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM cache write failed: {e}")
+
+
+def evict():
+    """Drop expired entries, then the least recently used until under CACHE_MAX_BYTES"""
+    return _store.evict()
+
+
+def get_stats():
+    """Hit/miss counters per prompt type plus overall hit rate"""
+    with _lock:
+        by_type = {k: dict(v) for k, v in _stats.items()}
+    hits = sum(v['hits'] for v in by_type.values())
+    misses = sum(v['misses'] for v in by_type.values())
+    return {
+        'enabled': CACHE_ENABLED,
+        'types': sorted(CACHE_TYPES),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        'by_type': by_type,
+    }
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Record/replay cassettes for LLM traffic
+With LLM_CASSETTE=record every successful upstream response is appended to
+a cassette file together with how long it took (and, for streams, when each
+chunk arrived). With LLM_CASSETTE=replay the same requests are answered from
+the cassette, sleeping the recorded latency times LLM_CASSETTE_SCALE (1.0 =
+original timing, 0.5 = twice as fast, 0 = instant), so one captured
+generate_pptx run can be replayed many times to profile the non-LLM work.
+
+The cassette is one JSON line per response, gzip-compressed when the path
+ends in .gz. Entries are keyed by model, system, messages and stream flag -
+not max_tokens, which llm_budget may tune between runs. A key recorded
+several times is replayed in rotation. Set LLM_CACHE_ENABLED=false when
+replaying, otherwise repeat runs are answered by llm_cache instead, and
+record with a single worker process since workers do not share the writer.
+"""
+
+import os
+import gzip
+import json
+import time
+import atexit
+import asyncio
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MODE = os.environ.get('LLM_CASSETTE', '').lower()
+CASSETTE_PATH = os.environ.get('LLM_CASSETTE_PATH', 'llm_cassette.jsonl.gz')
+SCALE = float(os.environ.get('LLM_CASSETTE_SCALE', 1.0))
+
+RECORDING = MODE == 'record'
+REPLAYING = MODE == 'replay'
+
+_lock = threading.Lock()
+_writer = None
+_entries = None
+_positions = {}
+_stats = {'recorded': 0, 'replayed': 0, 'misses': 0}
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def make_key(payload):
+    """Identity of a request for replay purposes"""
+    identity = {
+        'model': payload.get('model'),
+        'system': payload.get('system'),
+        'messages': payload.get('messages'),
+        'stream': bool(payload.get('stream')),
+    }
+    if payload.get('tools'):
+        identity['tools'] = payload['tools']
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _append(entry):
+    global _writer
+    line = json.dumps(entry, separators=(',', ':')) + '\n'
+    with _lock:
+        if _writer is None:
+            # Appending starts a new gzip member, which readers handle transparently
+            _writer = _open(CASSETTE_PATH, 'a')
+        _writer.write(line)
+        _writer.flush()
+        _stats['recorded'] += 1
+
+
+@atexit.register
+def close():
+    """Finish the cassette file; called automatically at interpreter exit"""
+    global _writer
+    with _lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+def record(payload, seconds, data):
+    """Store one successful non-streaming response"""
+    _append({'k': make_key(payload), 't': round(seconds, 4), 'r': data})
+
+
+def record_stream(payload, started, chunks):
+    """Pass streamed text chunks through, storing them with their arrival offsets once the stream ends"""
+    timed = []
+    for chunk in chunks:
+        timed.append([round(time.monotonic() - started, 4), chunk])
+        yield chunk
+    _append({'k': make_key(payload), 't': timed[-1][0] if timed else 0.0, 's': timed})
+
+
+def load(path=None):
+    """(Re)load the cassette into memory; returns the number of entries"""
+    global _entries
+    entries = {}
+    path = path or CASSETTE_PATH
+    count = 0
+    with _open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            entries.setdefault(entry['k'], []).append(entry)
+            count += 1
+    with _lock:
+        _entries = entries
+        _positions.clear()
+    logger.info(f"Loaded {count} LLM cassette entries from {path}")
+    return count
+
+
+def _next_entry(payload):
+    if _entries is None:
+        load()
+    key = make_key(payload)
+    with _lock:
+        recorded = _entries.get(key)
+        if not recorded:
+            _stats['misses'] += 1
+            raise Exception(f"No cassette entry for this request (key {key[:12]}) in {CASSETTE_PATH}")
+        position = _positions.get(key, 0)
+        _positions[key] = position + 1
+        _stats['replayed'] += 1
+    return recorded[position % len(recorded)]
+
+
+def _response(entry):
+    if 'r' in entry:
+        return entry['r']
+    # A streamed recording replayed for a non-streaming request
+    text = ''.join(chunk for _, chunk in entry['s'])
+    return {'content': [{'type': 'text', 'text': text}], 'stop_reason': 'end_turn', 'usage': {}}
+
+
+def replay(payload):
+    """Recorded response for payload, after the (scaled) recorded latency"""
+    entry = _next_entry(payload)
+    time.sleep(entry['t'] * SCALE)
+    return _response(entry)
+
+
+async def replay_async(payload):
+    entry = _next_entry(payload)
+    await asyncio.sleep(entry['t'] * SCALE)
+    return _response(entry)
+
+
+def replay_stream(payload):
+    """Yield recorded stream chunks at their (scaled) original offsets"""
+    entry = _next_entry(payload)
+    chunks = entry.get('s')
+    if chunks is None:
+        chunks = [[entry['t'], ''.join(block.get('text', '') for block in entry['r'].get('content', []))]]
+    started = time.monotonic()
+    for offset, chunk in chunks:
+        delay = offset * SCALE - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+        yield chunk
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats['mode'] = MODE or 'off'
+    stats['path'] = CASSETTE_PATH if MODE else None
+    return stats
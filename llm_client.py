@@ -0,0 +1,936 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Shared LLM transport
+Every server variant sends its prompts through call_anthropic() in this module.
+Requests go over one keep-alive connection pool per process, so the TCP+TLS
+handshake is paid once per connection instead of once per prompt.
+
+run_many() is the fan-out counterpart: it issues a whole batch of prompts
+concurrently on a background asyncio loop. Sync and async calls alike pass
+through the process-wide adaptive limiter in llm_limiter, which shrinks
+concurrency and pauses everyone on 529/429 instead of each call backing off
+on its own. Request timeouts (and optional hedged duplicates) follow the
+observed latency of each prompt type, see llm_latency, and max_tokens is
+right-sized from observed usage, see llm_budget.
+
+stream_anthropic() yields response text as the server-sent event stream
+arrives, for endpoints that can show partial results.
+
+Callers tag each prompt with a prompt_type (e.g. 'proofread_slide'); opted-in
+types are answered from the persistent llm_cache when possible, and identical
+prompts already in flight are coalesced by llm_singleflight. The model is
+chosen per prompt type by llm_routing. call_structured() asks for data through
+a forced tool call and checks it against the tool's schema (llm_schema). Every upstream
+call is accounted for in llm_ledger. Upstream
+responses can be recorded to and replayed from a cassette, see llm_cassette.
+"""
+
+import os
+import json
+import time
+import atexit
+import asyncio
+import logging
+import threading
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+import llm_budget
+import llm_cache
+import llm_cassette
+import llm_json
+import llm_ledger
+import llm_latency
+import llm_limiter
+import llm_routing
+import llm_schema
+import llm_singleflight
+
+logger = logging.getLogger(__name__)
+
+ANTHROPIC_API_URL = os.environ.get('ANTHROPIC_API_URL', 'https://api.anthropic.com/v1/messages')
+ANTHROPIC_VERSION = "2023-06-01"
+DEFAULT_MODEL = "claude-sonnet-4-20250514"
+# Upper bound for a whole aiohttp request; per-call timeouts come from llm_latency
+REQUEST_TIMEOUT = 120
+OVERLOAD_STATUSES = (429, 529)
+# How many times a response cut off by max_tokens is continued
+MAX_CONTINUATIONS = 3
+# Upstream only caches a prompt prefix of at least this many tokens, by model
+# name substring; shorter system blocks are sent without cache_control
+PROMPT_CACHE_MIN_TOKENS = {'haiku': 2048}
+PROMPT_CACHE_DEFAULT_MIN_TOKENS = 1024
+
+
+def _default_pool_size():
+    """Size the pool to the number of threads that can call the API at once"""
+    if os.environ.get('LLM_POOL_SIZE'):
+        return int(os.environ['LLM_POOL_SIZE'])
+    threads = int(os.environ.get('GUNICORN_THREADS', os.environ.get('THREADS', 1)))
+    # Each request thread may fan out to several concurrent calls
+    return max(10, threads * 4)
+
+
+POOL_SIZE = _default_pool_size()
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_usage = {}
+_stats = {
+    'requests': 0,
+    'async_requests': 0,
+    'errors': 0,
+    'in_flight': 0,
+    'peak_in_flight': 0,
+}
+
+
+# Background event loop shared by every run_many() caller in this process
+_loop = None
+_loop_lock = threading.Lock()
+_async_session = None
+
+
+def _reset_after_fork():
+    """Drop the parent's pool in a forked worker - sockets must not be shared"""
+    global _session, _session_lock, _stats_lock, _loop, _loop_lock, _async_session
+    _session = None
+    _session_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _loop = None
+    _loop_lock = threading.Lock()
+    _async_session = None
+    for key in _stats:
+        _stats[key] = 0
+    _usage.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_session():
+    """Return the process-wide pooled HTTP session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+                logger.info(f"LLM connection pool created (size={POOL_SIZE})")
+    return _session
+
+
+def get_pool_stats():
+    """Snapshot of connection pool utilization for the health endpoint"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['pool_size'] = POOL_SIZE
+
+    connections_opened = 0
+    idle_connections = 0
+    session = _session
+    if session is not None:
+        adapter = session.get_adapter(ANTHROPIC_API_URL)
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            connections_opened += pool.num_connections
+            idle_connections += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+    stats['connections_opened'] = connections_opened
+    stats['idle_connections'] = idle_connections
+    sync_requests = stats['requests'] - stats['async_requests']
+    if sync_requests:
+        # 1.0 means every request reused a warm connection
+        stats['reuse_ratio'] = round(1 - connections_opened / sync_requests, 3)
+    else:
+        stats['reuse_ratio'] = 0.0
+    return stats
+
+
+def _resolve_api_key(api_key):
+    api_key = api_key or os.environ.get('ANTHROPIC_API_KEY')
+    if not api_key:
+        raise Exception("ANTHROPIC_API_KEY environment variable not set")
+    return api_key
+
+
+def _headers(api_key):
+    return {
+        "x-api-key": api_key,
+        "anthropic-version": ANTHROPIC_VERSION,
+        "content-type": "application/json"
+    }
+
+
+def prompt_cacheable(system, model):
+    """Whether system is long enough for upstream to cache it on model (about four characters per token)"""
+    minimum = next((tokens for name, tokens in PROMPT_CACHE_MIN_TOKENS.items() if name in model),
+                   PROMPT_CACHE_DEFAULT_MIN_TOKENS)
+    return len(system) // 4 >= minimum
+
+
+def _build_payload(prompt, max_tokens, model, prefill=None, system=None, tool=None):
+    messages = [{"role": "user", "content": prompt}]
+    if prefill:
+        # Continue a truncated response from where it stopped
+        messages.append({"role": "assistant", "content": prefill})
+    payload = {
+        "model": model or DEFAULT_MODEL,
+        "max_tokens": max_tokens,
+        "messages": messages
+    }
+    if system and prompt_cacheable(system, payload["model"]):
+        # Static instructions go first and are marked for upstream prompt caching,
+        # so only the short user block is processed from scratch on each call
+        payload["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+    elif system:
+        payload["system"] = system
+    if tool:
+        # Force the answer to be this tool's input, see llm_schema
+        payload["tools"] = [tool]
+        payload["tool_choice"] = {"type": "tool", "name": tool["name"]}
+    return payload
+
+
+def _record_usage(prompt_type, usage):
+    """Accumulate input/output and prompt-cache token counts per prompt type"""
+    if not usage:
+        return
+    with _stats_lock:
+        totals = _usage.setdefault(prompt_type or 'untyped', {
+            'calls': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cache_read_input_tokens': 0,
+            'cache_creation_input_tokens': 0,
+        })
+        totals['calls'] += 1
+        for field in ('input_tokens', 'output_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens'):
+            totals[field] += usage.get(field) or 0
+
+
+def get_usage_stats():
+    """Token accounting per prompt type, including prompt-cache reads and writes"""
+    with _stats_lock:
+        by_type = {k: dict(v) for k, v in _usage.items()}
+    for totals in by_type.values():
+        uncached = totals['input_tokens'] + totals['cache_creation_input_tokens']
+        total_input = uncached + totals['cache_read_input_tokens']
+        totals['cache_read_ratio'] = round(totals['cache_read_input_tokens'] / total_input, 3) if total_input else 0.0
+    return by_type
+
+
+def _extract_text(data):
+    return ''.join(block.get('text', '') for block in data.get('content', []) if block.get('type', 'text') == 'text')
+
+
+def _extract_tool_input(data, tool):
+    """
+    The forced tool call's input. A field the schema expects as a list or object
+    but that arrived JSON-encoded in a string is decoded, and a plain-text JSON
+    answer is accepted too; both are parsed with llm_json.loads_lenient.
+    """
+    for block in data.get('content', []):
+        if block.get('type') == 'tool_use' and block.get('name') == tool['name']:
+            return _decode_embedded_json(block.get('input'), tool['input_schema'])
+    try:
+        return llm_json.loads_lenient(_extract_text(data))
+    except json.JSONDecodeError as e:
+        raise llm_schema.SchemaError(f"No {tool['name']} tool call in the response and no JSON in its text: {e}")
+
+
+def _decode_embedded_json(value, schema):
+    if not isinstance(value, dict):
+        return value
+    for name, field_schema in schema.get('properties', {}).items():
+        if field_schema.get('type') in ('array', 'object') and isinstance(value.get(name), str):
+            try:
+                value[name] = llm_json.loads_lenient(value[name])
+            except json.JSONDecodeError:
+                pass
+    return value
+
+
+def _track_start(is_async=False):
+    with _stats_lock:
+        _stats['requests'] += 1
+        if is_async:
+            _stats['async_requests'] += 1
+        _stats['in_flight'] += 1
+        _stats['peak_in_flight'] = max(_stats['peak_in_flight'], _stats['in_flight'])
+
+
+def _track_end(failed):
+    with _stats_lock:
+        _stats['in_flight'] -= 1
+        if failed:
+            _stats['errors'] += 1
+
+
+def _post(payload, api_key, timeout, stream=False):
+    """Send one request over the shared pool"""
+    _track_start()
+    failed = True
+    try:
+        response = get_session().post(ANTHROPIC_API_URL, headers=_headers(api_key), json=payload,
+                                      timeout=timeout, stream=stream)
+        failed = False
+        return response
+    finally:
+        _track_end(failed)
+
+
+def _cache_lookup(key, prompt_type):
+    """Return cached text for opted-in prompt types, else None"""
+    if not llm_cache.is_cacheable(prompt_type):
+        return None
+    return llm_cache.get(key, prompt_type)
+
+
+def _cache_store(key, prompt_type, text):
+    if llm_cache.is_cacheable(prompt_type):
+        llm_cache.put(key, prompt_type, text)
+
+
+def _is_valid(validate, text):
+    """Validators return a falsy value or raise to reject a response"""
+    if validate is None:
+        return True
+    try:
+        return validate(text) is not False
+    except Exception as e:
+        logger.info(f"Response failed validation: {e}")
+        return False
+
+
+def _escalate(prompt_type, model, validate):
+    """Models to try in turn: just the routed one, or bigger tiers too when the caller validates"""
+    return llm_routing.escalation_chain(prompt_type, model) if validate is not None else [model]
+
+
+def _log_invalid(prompt_type, model, last):
+    if last:
+        logger.warning(f"Response for {prompt_type} failed validation on every model tier, returning it as is")
+    else:
+        llm_routing.record_escalation(prompt_type, model)
+        logger.warning(f"Response for {prompt_type} from {model} failed validation, retrying on a larger model")
+
+
+def call_anthropic(prompt, max_tokens=2000, max_retries=6, model=None, api_key=None, prompt_type=None,
+                   system=None, validate=None):
+    """
+    Make API call to Anthropic, answering from the cache or an identical in-flight call when possible.
+    system holds static instructions, sent as a system block (prompt-cached when it is long enough).
+    The model is routed by prompt type; validate(text), if given, rejects an answer by
+    returning False or raising, and the prompt is then retried one model tier up
+    (as far as llm_routing allows).
+    """
+    model = llm_routing.model_for(prompt_type, model)
+    key = llm_cache.make_key(model or DEFAULT_MODEL, prompt, max_tokens, system)
+    cached = _cache_lookup(key, prompt_type)
+    if cached is not None:
+        llm_ledger.record_cache_hit(prompt_type, model or DEFAULT_MODEL)
+        return cached
+
+    def fetch():
+        chain = _escalate(prompt_type, model, validate)
+        for position, attempt_model in enumerate(chain):
+            # Keyed by the right-sized budget, as _complete_async sends and records it
+            if llm_latency.hedge_delay(prompt_type, llm_budget.budget_for(prompt_type, max_tokens)) is not None:
+                text = _run_on_loop(_complete_async(prompt, max_tokens, max_retries, attempt_model, api_key,
+                                                    prompt_type, system))
+            else:
+                text = _complete(prompt, max_tokens, max_retries, attempt_model, api_key, prompt_type, system)
+            if _is_valid(validate, text):
+                _cache_store(key, prompt_type, text)
+                break
+            _log_invalid(prompt_type, attempt_model, position == len(chain) - 1)
+        return text
+
+    return llm_singleflight.do(key, fetch)
+
+
+def call_structured(prompt, tool, max_tokens=2000, max_retries=6, model=None, api_key=None, prompt_type=None,
+                    system=None, validate=None):
+    """
+    Like call_anthropic, but the answer is the input of a forced call to tool
+    (see llm_schema.tool), returned as a dict checked against tool['input_schema'].
+    Malformed or truncated JSON is recovered as far as possible by llm_json.
+    A response that does not match the schema raises llm_schema.SchemaError at
+    once instead of being retried; validate(result) escalates as in call_anthropic.
+    """
+    model = llm_routing.model_for(prompt_type, model)
+    key = llm_cache.make_key(model or DEFAULT_MODEL, prompt, max_tokens, system, tool)
+    cached = _cache_lookup(key, prompt_type)
+    if cached is not None:
+        llm_ledger.record_cache_hit(prompt_type, model or DEFAULT_MODEL)
+        return json.loads(cached)
+
+    def fetch():
+        chain = _escalate(prompt_type, model, validate)
+        for position, attempt_model in enumerate(chain):
+            result = _complete_structured(prompt, tool, max_tokens, max_retries, attempt_model, api_key,
+                                          prompt_type, system)
+            if _is_valid(validate, result):
+                _cache_store(key, prompt_type, json.dumps(result))
+                break
+            _log_invalid(prompt_type, attempt_model, position == len(chain) - 1)
+        # Serialized so each coalesced caller gets its own copy
+        return json.dumps(result)
+
+    return json.loads(llm_singleflight.do(key, fetch))
+
+
+def _complete_structured(prompt, tool, max_tokens, max_retries, model, api_key, prompt_type, system=None):
+    """
+    One forced tool call. A tool call cut off at max_tokens cannot be continued
+    like text, so the caller's full max_tokens is sent rather than a right-sized budget.
+    """
+    api_key = _resolve_api_key(api_key)
+    payload = _build_payload(prompt, max_tokens, model, system=system, tool=tool)
+    delay = llm_latency.hedge_delay(prompt_type, max_tokens)
+    if delay is not None:
+        data = _run_on_loop(_call_hedged_async(payload, max_retries, api_key, prompt_type, delay))
+    else:
+        data = _call_upstream(payload, max_retries, api_key, prompt_type)
+    return _structured_result(data, tool, max_tokens, prompt_type)
+
+
+def _structured_result(data, tool, max_tokens, prompt_type):
+    """Account for a forced tool call's response and return its schema-checked input"""
+    _record_usage(prompt_type, data.get('usage'))
+    truncated = data.get('stop_reason') == 'max_tokens'
+    llm_budget.record(prompt_type, data.get('usage', {}).get('output_tokens', 0), truncated=truncated)
+    if truncated:
+        # Whatever prefix survived is used if it still matches the schema
+        logger.warning(f"{tool['name']} call for {prompt_type} was cut off at {max_tokens} tokens")
+    return llm_schema.validate(_extract_tool_input(data, tool), tool['input_schema'])
+
+
+def _continue_budget(data, max_tokens, used):
+    """Tokens left for a continuation, or 0 when the response is complete"""
+    if data.get('stop_reason') != 'max_tokens':
+        return 0
+    return max(0, max_tokens - used)
+
+
+def _complete(prompt, max_tokens, max_retries, model, api_key, prompt_type, system=None):
+    """
+    Run a prompt to completion with a right-sized budget (see llm_budget).
+    A response that stops on max_tokens is continued from its own text,
+    up to the caller's max_tokens in total, instead of being restarted.
+    """
+    api_key = _resolve_api_key(api_key)
+    budget = llm_budget.budget_for(prompt_type, max_tokens)
+    text = ''
+    used = 0
+    for continuation in range(MAX_CONTINUATIONS + 1):
+        payload = _build_payload(prompt, budget, model, prefill=text.rstrip(), system=system)
+        data = _call_upstream(payload, max_retries, api_key, prompt_type)
+        text = text.rstrip() + _extract_text(data)
+        _record_usage(prompt_type, data.get('usage'))
+        used += data.get('usage', {}).get('output_tokens', 0)
+        budget = _continue_budget(data, max_tokens, used)
+        if not budget:
+            break
+        logger.info(f"Response for {prompt_type} hit max_tokens at {used} tokens, continuing ({continuation + 1}/{MAX_CONTINUATIONS})")
+    llm_budget.record(prompt_type, used, truncated=continuation > 0)
+    return text
+
+
+def _call_upstream(payload, max_retries, api_key, prompt_type=None):
+    """Make API call to Anthropic, retrying overloads under the shared adaptive limiter"""
+    if llm_cassette.REPLAYING:
+        return _replay(payload)
+    counts = {'retries': 0, 'overloads': 0}
+    started = time.monotonic()
+    try:
+        data = _attempt_upstream(payload, max_retries, api_key, prompt_type, counts)
+    except Exception:
+        llm_ledger.record_call(payload, prompt_type, None, time.monotonic() - started, ok=False, **counts)
+        raise
+    llm_ledger.record_call(payload, prompt_type, data.get('usage'), time.monotonic() - started, **counts)
+    return data
+
+
+def _attempt_upstream(payload, max_retries, api_key, prompt_type, counts):
+    """Retry loop behind _call_upstream; counts collects retries and overloads for the ledger"""
+    max_tokens = payload['max_tokens']
+    timeout = llm_latency.timeout_for(prompt_type, max_tokens)
+
+    for attempt in range(max_retries):
+        counts['retries'] = attempt
+        limiter = llm_limiter.limiter
+        limiter.acquire()
+        error = None
+        started = time.monotonic()
+        try:
+            response = _post(payload, api_key, timeout)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            # A pooled keep-alive connection may have been closed by the server
+            error = e
+        finally:
+            limiter.release()
+
+        if error is not None:
+            if attempt < max_retries - 1:
+                wait_time = 2 ** attempt
+                logger.warning(f"API {type(error).__name__}, retrying in {wait_time}s... (attempt {attempt + 1}/{max_retries})")
+                time.sleep(wait_time)
+                continue
+            raise Exception(f"API request failed after {max_retries} attempts: {str(error)}")
+
+        if response.status_code == 200:
+            elapsed = time.monotonic() - started
+            limiter.on_success(response.headers)
+            llm_latency.record(prompt_type, max_tokens, elapsed)
+            data = response.json()
+            if llm_cassette.RECORDING:
+                llm_cassette.record(payload, elapsed, data)
+            return data
+        elif response.status_code in OVERLOAD_STATUSES and attempt < max_retries - 1:
+            counts['overloads'] += 1
+            # The pause is shared: every caller in the process waits it out together
+            pause = limiter.on_overload(response.status_code, response.headers)
+            logger.warning(f"API overloaded ({response.status_code}), pausing LLM calls for {pause:.1f}s... (attempt {attempt + 1}/{max_retries})")
+            continue
+        else:
+            logger.error(f"Anthropic API error: {response.status_code} - {response.text}")
+            raise Exception(f"API error: {response.status_code} - {response.text}")
+
+    raise Exception("Max retries exceeded")
+
+
+def _replay(payload):
+    """Answer from the cassette, still holding a limiter slot so fan-out concurrency stays realistic"""
+    limiter = llm_limiter.limiter
+    limiter.acquire()
+    try:
+        return llm_cassette.replay(payload)
+    finally:
+        limiter.release()
+
+
+# ============= Streaming =============
+
+def _iter_sse_text(response, usage=None):
+    """Yield text deltas from a messages API server-sent event stream, collecting token usage into usage"""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        try:
+            event = json.loads(line[5:].strip())
+        except json.JSONDecodeError:
+            continue
+        event_type = event.get('type')
+        if event_type == 'content_block_delta' and event.get('delta', {}).get('type') == 'text_delta':
+            yield event['delta']['text']
+        elif event_type in ('message_start', 'message_delta') and usage is not None:
+            usage.update(event.get('message', event).get('usage') or {})
+        elif event_type == 'error':
+            raise Exception(f"API stream error: {event.get('error')}")
+        elif event_type == 'message_stop':
+            return
+
+
+def stream_anthropic(prompt, max_tokens=2000, max_retries=6, model=None, api_key=None, prompt_type=None,
+                     system=None):
+    """
+    Stream the response text for one prompt as it is generated.
+    Overloads and connection errors are retried only before the first chunk;
+    a failure mid-stream is raised to the consumer.
+    """
+    api_key = _resolve_api_key(api_key)
+    payload = _build_payload(prompt, max_tokens, llm_routing.model_for(prompt_type, model), system=system)
+    payload['stream'] = True
+    timeout = llm_latency.timeout_for(prompt_type, max_tokens)
+    if llm_cassette.REPLAYING:
+        yield from llm_cassette.replay_stream(payload)
+        return
+
+    counts = {'retries': 0, 'overloads': 0}
+    usage = {}
+    started = time.monotonic()
+    ok = False
+    try:
+        yield from _stream_upstream(payload, max_retries, api_key, prompt_type, timeout, counts, usage)
+        ok = True
+    finally:
+        _record_usage(prompt_type, usage)
+        llm_ledger.record_call(payload, prompt_type, usage, time.monotonic() - started, ok=ok, streamed=True,
+                               **counts)
+
+
+def _stream_upstream(payload, max_retries, api_key, prompt_type, timeout, counts, usage):
+    """Retry loop behind stream_anthropic"""
+    max_tokens = payload['max_tokens']
+    for attempt in range(max_retries):
+        counts['retries'] = attempt
+        limiter = llm_limiter.limiter
+        limiter.acquire()
+        error = None
+        started = time.monotonic()
+        try:
+            try:
+                response = _post(payload, api_key, timeout, stream=True)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                error = e
+            else:
+                with response:
+                    if response.status_code == 200:
+                        limiter.on_success(response.headers)
+                        chunks = _iter_sse_text(response, usage)
+                        if llm_cassette.RECORDING:
+                            chunks = llm_cassette.record_stream(payload, started, chunks)
+                        yield from chunks
+                        llm_latency.record(prompt_type, max_tokens, time.monotonic() - started)
+                        return
+                    status, headers, body = response.status_code, response.headers, response.text
+        finally:
+            limiter.release()
+
+        if error is not None:
+            if attempt < max_retries - 1:
+                wait_time = 2 ** attempt
+                logger.warning(f"API {type(error).__name__}, retrying in {wait_time}s... (attempt {attempt + 1}/{max_retries})")
+                time.sleep(wait_time)
+                continue
+            raise Exception(f"API request failed after {max_retries} attempts: {str(error)}")
+
+        if status in OVERLOAD_STATUSES and attempt < max_retries - 1:
+            counts['overloads'] += 1
+            pause = limiter.on_overload(status, headers)
+            logger.warning(f"API overloaded ({status}), pausing LLM calls for {pause:.1f}s... (attempt {attempt + 1}/{max_retries})")
+            continue
+        logger.error(f"Anthropic API error: {status} - {body}")
+        raise Exception(f"API error: {status} - {body}")
+
+    raise Exception("Max retries exceeded")
+
+
+# ============= Async fan-out =============
+
+def _get_loop():
+    """Start (once per process) the background loop that runs async calls"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='llm-client-loop', daemon=True)
+                thread.start()
+                _loop = loop
+    return _loop
+
+
+def _get_async_session():
+    """Pooled aiohttp session - loop thread only"""
+    global _async_session
+    if _async_session is None:
+        connector = aiohttp.TCPConnector(limit=max(POOL_SIZE, llm_limiter.MAX_CONCURRENCY), keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        _async_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _async_session
+
+
+async def _in_context(coro, context):
+    """Carry the caller's ledger attribution (endpoint, user) onto the loop thread"""
+    llm_ledger.bind(**context)
+    return await coro
+
+
+def _run_on_loop(coro, timeout=None):
+    """Run a coroutine on the background loop from a sync caller and wait for it"""
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, llm_ledger.current()), _get_loop()).result(timeout)
+
+
+def submit(prompt, max_tokens=2000, max_retries=6, model=None, api_key=None, prompt_type=None, system=None,
+           validate=None, tool=None):
+    """
+    Start one call on the background loop without waiting for it; returns a
+    concurrent.futures.Future for the text, or with a tool, the validated tool input
+    """
+    if tool is not None:
+        coro = call_structured_async(prompt, tool, max_tokens=max_tokens, max_retries=max_retries, model=model,
+                                     api_key=api_key, prompt_type=prompt_type, system=system, validate=validate)
+    else:
+        coro = call_anthropic_async(prompt, max_tokens=max_tokens, max_retries=max_retries, model=model,
+                                    api_key=api_key, prompt_type=prompt_type, system=system, validate=validate)
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, llm_ledger.current()), _get_loop())
+
+
+@atexit.register
+def _close_async_session():
+    """Close the aiohttp session cleanly at interpreter shutdown"""
+    loop, session = _loop, _async_session
+    if loop is not None and session is not None and loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result(5)
+        except Exception:
+            pass
+
+
+async def call_anthropic_async(prompt, max_tokens=2000, max_retries=6, model=None, api_key=None, prompt_type=None,
+                               system=None, validate=None):
+    """Async counterpart of call_anthropic; must run on the background loop"""
+    model = llm_routing.model_for(prompt_type, model)
+    key = llm_cache.make_key(model or DEFAULT_MODEL, prompt, max_tokens, system)
+    cached = _cache_lookup(key, prompt_type)
+    if cached is not None:
+        llm_ledger.record_cache_hit(prompt_type, model or DEFAULT_MODEL)
+        return cached
+
+    async def fetch():
+        chain = _escalate(prompt_type, model, validate)
+        for position, attempt_model in enumerate(chain):
+            text = await _complete_async(prompt, max_tokens, max_retries, attempt_model, api_key, prompt_type, system)
+            if _is_valid(validate, text):
+                _cache_store(key, prompt_type, text)
+                break
+            _log_invalid(prompt_type, attempt_model, position == len(chain) - 1)
+        return text
+
+    return await llm_singleflight.do_async(key, fetch)
+
+
+async def call_structured_async(prompt, tool, max_tokens=2000, max_retries=6, model=None, api_key=None,
+                                prompt_type=None, system=None, validate=None):
+    """Async counterpart of call_structured; must run on the background loop"""
+    model = llm_routing.model_for(prompt_type, model)
+    key = llm_cache.make_key(model or DEFAULT_MODEL, prompt, max_tokens, system, tool)
+    cached = _cache_lookup(key, prompt_type)
+    if cached is not None:
+        llm_ledger.record_cache_hit(prompt_type, model or DEFAULT_MODEL)
+        return json.loads(cached)
+
+    async def fetch():
+        resolved_key = _resolve_api_key(api_key)
+        chain = _escalate(prompt_type, model, validate)
+        for position, attempt_model in enumerate(chain):
+            payload = _build_payload(prompt, max_tokens, attempt_model, system=system, tool=tool)
+            delay = llm_latency.hedge_delay(prompt_type, max_tokens)
+            if delay is not None:
+                data = await _call_hedged_async(payload, max_retries, resolved_key, prompt_type, delay)
+            else:
+                data = await _call_upstream_async(payload, max_retries, resolved_key, prompt_type)
+            result = _structured_result(data, tool, max_tokens, prompt_type)
+            if _is_valid(validate, result):
+                _cache_store(key, prompt_type, json.dumps(result))
+                break
+            _log_invalid(prompt_type, attempt_model, position == len(chain) - 1)
+        return json.dumps(result)
+
+    return json.loads(await llm_singleflight.do_async(key, fetch))
+
+
+async def _complete_async(prompt, max_tokens, max_retries, model, api_key, prompt_type, system=None):
+    """Async counterpart of _complete, hedging each round when latency data allows"""
+    api_key = _resolve_api_key(api_key)
+    budget = llm_budget.budget_for(prompt_type, max_tokens)
+    text = ''
+    used = 0
+    for continuation in range(MAX_CONTINUATIONS + 1):
+        payload = _build_payload(prompt, budget, model, prefill=text.rstrip(), system=system)
+        delay = llm_latency.hedge_delay(prompt_type, budget)
+        if delay is not None:
+            data = await _call_hedged_async(payload, max_retries, api_key, prompt_type, delay)
+        else:
+            data = await _call_upstream_async(payload, max_retries, api_key, prompt_type)
+        text = text.rstrip() + _extract_text(data)
+        _record_usage(prompt_type, data.get('usage'))
+        used += data.get('usage', {}).get('output_tokens', 0)
+        budget = _continue_budget(data, max_tokens, used)
+        if not budget:
+            break
+        logger.info(f"Response for {prompt_type} hit max_tokens at {used} tokens, continuing ({continuation + 1}/{MAX_CONTINUATIONS})")
+    llm_budget.record(prompt_type, used, truncated=continuation > 0)
+    return text
+
+
+async def _call_hedged_async(payload, max_retries, api_key, prompt_type, delay):
+    """
+    Fire a duplicate request once the primary runs past delay (the observed p95).
+    The first successful response wins and the other request is cancelled.
+    """
+    def start():
+        task = asyncio.ensure_future(_call_upstream_async(payload, max_retries, api_key, prompt_type))
+        tasks.append(task)
+        return task
+
+    tasks = []
+    try:
+        primary = start()
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or llm_limiter.limiter.is_congested():
+            # Never add duplicate load while upstream is already overloaded
+            return await primary
+
+        hedge = start()
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    llm_latency.record_hedge(won=task is hedge)
+                    return task.result()
+                error = task.exception()
+        llm_latency.record_hedge(won=False)
+        raise error
+    finally:
+        # The loser, or both requests when this call itself is cancelled (run_many,
+        # a client disconnect): asyncio.wait does not pass cancellation on to them,
+        # and they would keep their limiter slots and connections
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def _call_upstream_async(payload, max_retries, api_key, prompt_type=None):
+    """Async upstream call, retrying overloads under the shared adaptive limiter"""
+    if llm_cassette.REPLAYING:
+        limiter = llm_limiter.limiter
+        await limiter.acquire_async()
+        try:
+            return await llm_cassette.replay_async(payload)
+        finally:
+            limiter.release()
+    counts = {'retries': 0, 'overloads': 0}
+    started = time.monotonic()
+    try:
+        data = await _attempt_upstream_async(payload, max_retries, api_key, prompt_type, counts)
+    except BaseException:
+        # Includes a hedge cancelled because its twin answered first
+        llm_ledger.record_call(payload, prompt_type, None, time.monotonic() - started, ok=False, **counts)
+        raise
+    llm_ledger.record_call(payload, prompt_type, data.get('usage'), time.monotonic() - started, **counts)
+    return data
+
+
+async def _attempt_upstream_async(payload, max_retries, api_key, prompt_type, counts):
+    """Retry loop behind _call_upstream_async"""
+    max_tokens = payload['max_tokens']
+    session = _get_async_session()
+    timeout = aiohttp.ClientTimeout(total=llm_latency.timeout_for(prompt_type, max_tokens))
+
+    for attempt in range(max_retries):
+        counts['retries'] = attempt
+        limiter = llm_limiter.limiter
+        await limiter.acquire_async()
+        _track_start(is_async=True)
+        error = None
+        completed = False
+        started = time.monotonic()
+        try:
+            async with session.post(ANTHROPIC_API_URL, headers=_headers(api_key), json=payload,
+                                    timeout=timeout) as response:
+                status = response.status
+                headers = response.headers
+                if status == 200:
+                    data = await response.json(content_type=None)
+                else:
+                    body = await response.text()
+            completed = True
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+            error = e
+        finally:
+            _track_end(not completed)
+            limiter.release()
+
+        if error is not None:
+            if attempt < max_retries - 1:
+                wait_time = 2 ** attempt
+                logger.warning(f"API {type(error).__name__}, retrying in {wait_time}s... (attempt {attempt + 1}/{max_retries})")
+                await asyncio.sleep(wait_time)
+                continue
+            raise Exception(f"API request failed after {max_retries} attempts: {str(error)}")
+
+        if status == 200:
+            elapsed = time.monotonic() - started
+            limiter.on_success(headers)
+            llm_latency.record(prompt_type, max_tokens, elapsed)
+            if llm_cassette.RECORDING:
+                llm_cassette.record(payload, elapsed, data)
+            return data
+        elif status in OVERLOAD_STATUSES and attempt < max_retries - 1:
+            counts['overloads'] += 1
+            pause = limiter.on_overload(status, headers)
+            logger.warning(f"API overloaded ({status}), pausing LLM calls for {pause:.1f}s... (attempt {attempt + 1}/{max_retries})")
+            continue
+        else:
+            logger.error(f"Anthropic API error: {status} - {body}")
+            raise Exception(f"API error: {status} - {body}")
+
+    raise Exception("Max retries exceeded")
+
+
+def run_many(prompts, max_tokens=2000, max_retries=6, model=None, api_key=None, timeout=None, prompt_type=None,
+             concurrency=None, timings=None, on_done=None):
+    """
+    Run a batch of prompts concurrently and return results in input order.
+
+    Each item is either a prompt string or a dict with 'prompt' and optional
+    'max_tokens' / 'prompt_type' / 'system' / 'validate' / 'tool'. An item with a
+    'tool' is run through call_structured_async and comes back as a dict. A failed
+    item comes back as its Exception instead of text, so callers can fall back per item.
+
+    concurrency caps how many of these prompts are in flight at once, on top of
+    the process-wide limiter, so one large batch cannot take every slot. If a
+    timings list is passed, it is filled with each item's seconds, in input order.
+    on_done(index, result) is called on the event loop thread as each item
+    finishes (result is the text, dict or Exception); keep it quick.
+    """
+    if not prompts:
+        return []
+    if timings is not None:
+        timings[:] = [0.0] * len(prompts)
+
+    async def bounded(index, call, semaphore):
+        if semaphore is not None:
+            await semaphore.acquire()
+        started = time.monotonic()
+        try:
+            result = await call
+        except Exception as e:
+            result = e
+        finally:
+            if timings is not None:
+                timings[index] = time.monotonic() - started
+            if semaphore is not None:
+                semaphore.release()
+        if on_done is not None:
+            on_done(index, result)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def gather():
+        calls = []
+        for item in prompts:
+            if isinstance(item, dict) and item.get('tool'):
+                calls.append(call_structured_async(item['prompt'], item['tool'],
+                                                   max_tokens=item.get('max_tokens', max_tokens),
+                                                   max_retries=max_retries, model=model, api_key=api_key,
+                                                   prompt_type=item.get('prompt_type', prompt_type),
+                                                   system=item.get('system'), validate=item.get('validate')))
+            elif isinstance(item, dict):
+                calls.append(call_anthropic_async(item['prompt'], max_tokens=item.get('max_tokens', max_tokens),
+                                                  max_retries=max_retries, model=model, api_key=api_key,
+                                                  prompt_type=item.get('prompt_type', prompt_type),
+                                                  system=item.get('system'), validate=item.get('validate')))
+            else:
+                calls.append(call_anthropic_async(item, max_tokens=max_tokens, max_retries=max_retries,
+                                                  model=model, api_key=api_key, prompt_type=prompt_type))
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        return await asyncio.gather(*(bounded(index, call, semaphore) for index, call in enumerate(calls)),
+                                    return_exceptions=True)
+
+    return _run_on_loop(gather(), timeout)
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+PresPilot - JSON helpers for LLM output
+SectionStreamParser consumes an outline response as it streams in and hands
+back each {"title", "facts"} section the moment its closing brace arrives, so
+slides can be shown before the whole outline has been generated.
+
+loads_lenient() parses the JSON an LLM actually writes: code fences and
+preambles, // and /* */ comments, trailing or missing commas (between any
+two values), smart or single quotes (with apostrophes inside single-quoted
+strings), raw newlines inside strings, and a tail cut off mid-value,
+for which it returns the longest prefix that closes into valid JSON (e.g. the
+sections that were complete). JSONRepairer does the same incrementally.
+bench_json.py measures it against llm_json_corpus.jsonl and a fuzzer.
+"""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Opening quote -> characters that close the string it starts
+_QUOTES = {'"': '"', '\u201c': '\u201d\u201c', '\u201d': '\u201d\u201c', '\u201e': '\u201d\u201c', "'": "'"}
+_CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_CLOSERS = {'{': '}', '[': ']'}
+# What can follow the ' that closes a single-quoted string; anything else
+# (a letter, as in don't) means the ' was an apostrophe
+_SINGLE_QUOTE_ENDS = ',:}]\'"\n\r'
+
+
+class JSONRepairer:
+    """
+    Rewrites LLM output into strict JSON one character at a time, so it can
+    be fed a streamed response chunk by chunk. Text before the first { or [
+    and after the matching close is ignored. After each complete element a
+    cut point is remembered; result() falls back to the longest cut that
+    closes into valid JSON when the text is truncated or otherwise broken.
+    """
+
+    def __init__(self):
+        self.out = []
+        self.stack = []
+        self.cuts = []
+        self.quote = None
+        self.escaped = False
+        self.comment = None
+        self.slash = False
+        self.star = False
+        self.started = False
+        self.done = False
+        self.last = ''
+        # Whitespace or a comment since the last emitted character
+        self.gap = False
+        # A ' in a single-quoted string, held until the next character shows
+        # whether it closes the string or is an apostrophe
+        self.pending = None
+
+    def feed(self, text):
+        for char in text:
+            if self.done:
+                break
+            self._char(char)
+        return self
+
+    def _emit(self, text):
+        self.out.append(text)
+        self.last = text[-1]
+        self.gap = False
+
+    def _cut(self):
+        self.cuts.append((len(self.out), tuple(self.stack)))
+
+    def _char(self, char):
+        if self.pending is not None:
+            if char in ' \t':
+                self.pending += char
+                return
+            pending, self.pending = self.pending, None
+            if char in _SINGLE_QUOTE_ENDS:
+                self._close_string()
+                for space in pending[1:]:
+                    self._char(space)
+            else:
+                self.out.append("'")
+                for space in pending[1:]:
+                    self._char(space)
+
+        if self.comment == 'line':
+            if char == '\n':
+                self.comment = None
+            return
+        if self.comment == 'block':
+            if self.star and char == '/':
+                self.comment = None
+            self.star = char == '*'
+            return
+
+        if self.quote is not None:
+            if self.escaped:
+                self.escaped = False
+                self.out.append(char)
+            elif char == '\\':
+                self.escaped = True
+                self.out.append(char)
+            elif char in self.quote:
+                if char == "'":
+                    self.pending = char
+                    return
+                self._close_string()
+            elif char == '"':
+                self.out.append('\\"')
+            elif char in _CONTROL_ESCAPES:
+                self.out.append(_CONTROL_ESCAPES[char])
+            elif char < ' ':
+                self.out.append(f"\\u{ord(char):04x}")
+            else:
+                self.out.append(char)
+            return
+
+        if self.slash:
+            self.slash = False
+            if char == '/':
+                self.comment = 'line'
+                self.gap = True
+                return
+            if char == '*':
+                self.comment = 'block'
+                self.star = False
+                self.gap = True
+                return
+
+        if not self.started:
+            if char not in '{[':
+                return
+            self.started = True
+
+        if char == '/':
+            self.slash = True
+        elif char in _QUOTES:
+            if char == "'" and self.last not in '{[,:"}]' and not self._after_bare_value():
+                return
+            self._separate()
+            self.quote = _QUOTES[char]
+            self._emit('"')
+        elif char in '{[':
+            self._separate()
+            self.stack.append(char)
+            self._emit(char)
+        elif char in '}]':
+            self._drop_trailing_comma()
+            if self.stack:
+                self._emit(_CLOSERS[self.stack.pop()])
+            if self.stack:
+                self._cut()
+            else:
+                self.done = True
+        elif char == ',':
+            if self.last in ',{[:':
+                return
+            self._cut()
+            self._emit(char)
+        elif char.isspace():
+            self.out.append(char)
+            self.gap = True
+        elif char == ':':
+            self._emit(char)
+        else:
+            # A number or true/false/null; starting a new one after a value means a comma is missing
+            self._separate()
+            self._emit(char)
+
+    def _close_string(self):
+        self.quote = None
+        self._emit('"')
+
+    def _after_bare_value(self):
+        """A number or literal has ended (whitespace or a comment came after it)"""
+        return self.gap and (self.last.isalnum() or self.last in '.+-')
+
+    def _separate(self):
+        """Insert the comma missing between two adjacent values"""
+        if self.stack and (self.last in '"}]' or self._after_bare_value()):
+            self._emit(',')
+
+    def _drop_trailing_comma(self):
+        while self.out and self.out[-1].isspace():
+            self.out.pop()
+        if self.out and self.out[-1] == ',':
+            self.out.pop()
+        self.last = self.out[-1][-1] if self.out else ''
+
+    def _close(self, length, stack):
+        text = ''.join(self.out[:length]).rstrip().rstrip(',')
+        return text + ''.join(_CLOSERS[opener] for opener in reversed(stack))
+
+    def result(self):
+        """The parsed value, or the longest valid prefix of it; raises json.JSONDecodeError if there is none"""
+        if self.pending is not None:
+            # The response ended right after a closing '
+            self.pending = None
+            self._close_string()
+        raw = ''.join(self.out)
+        if not self.started:
+            raise json.JSONDecodeError('No JSON object or array found', raw, 0)
+        candidates = [raw] if self.done else []
+        if not self.done and self.quote is None:
+            candidates.append(self._close(len(self.out), self.stack))
+        candidates.extend(self._close(length, stack) for length, stack in reversed(self.cuts))
+        for candidate in candidates:
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+        raise json.JSONDecodeError('No valid JSON prefix could be recovered', raw, len(raw))
+
+
+def loads_lenient(text):
+    """json.loads for LLM output; see JSONRepairer for what it tolerates"""
+    stripped = text.strip()
+    if stripped[:1] in ('{', '['):
+        try:
+            return json.loads(stripped)
+        except json.JSONDecodeError:
+            pass
+    return JSONRepairer().feed(text).result()
+
+
+class SectionStreamParser:
+    """
+    Incremental scanner for {"sections": [{...}, ...]} (or a bare [{...}, ...]).
+    Tracks bracket depth and string/escape state character by character, so
+    braces inside fact strings never confuse it and text outside the JSON
+    (code fences, preambles) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.section_start = None
+        self.position = 0
+        self.count = 0
+
+    def feed(self, text):
+        """Add streamed text; returns the list of sections completed by it"""
+        completed = []
+        for char in text:
+            self.buffer.append(char)
+            index = self.position
+            self.position += 1
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                if self.stack:
+                    self.in_string = True
+            elif char in '{[':
+                if char == '{' and self.section_start is None and self.stack in (['{', '['], ['[']):
+                    self.section_start = index
+                self.stack.append(char)
+            elif char in '}]':
+                if self.stack:
+                    self.stack.pop()
+                if char == '}' and self.section_start is not None and self.stack in (['{', '['], ['[']):
+                    section = self._decode(''.join(self.buffer[self.section_start:index + 1]))
+                    self.section_start = None
+                    if section is not None:
+                        completed.append(section)
+                if not self.stack:
+                    # Outer value closed - drop everything consumed so far
+                    self.buffer = []
+                    self.position = 0
+
+        return completed
+
+    def _decode(self, raw):
+        try:
+            section = loads_lenient(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping malformed streamed section: {e}")
+            return None
+        if not isinstance(section, dict) or 'title' not in section:
+            return None
+        section.setdefault('facts', [])
+        self.count += 1
+        return section
+
+
+def iter_sections(chunks):
+    """Yield outline sections from an iterable of streamed text chunks"""
+    parser = SectionStreamParser()
+    for chunk in chunks:
+        for section in parser.feed(chunk):
+            yield section
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Observed LLM latency per prompt type
+Keeps a rolling window of successful call latencies per (prompt_type,
+max_tokens bucket) and derives from it:
+- an adaptive request timeout (a multiple of p95 instead of a fixed 60s)
+- a hedge delay: once a call runs past p95, a duplicate may be fired and
+  whichever answers first wins (enabled with LLM_HEDGE=true)
+Until a bucket has MIN_SAMPLES observations the static defaults apply.
+"""
+
+import os
+import threading
+from collections import deque
+
+DEFAULT_TIMEOUT = 60.0
+MIN_TIMEOUT = float(os.environ.get('LLM_MIN_TIMEOUT', 10))
+MAX_TIMEOUT = float(os.environ.get('LLM_MAX_TIMEOUT', 120))
+TIMEOUT_MULTIPLIER = 3.0
+WINDOW = 200
+MIN_SAMPLES = 20
+HEDGE_ENABLED = os.environ.get('LLM_HEDGE', 'false').lower() == 'true'
+HEDGE_TYPES = {
+    t.strip() for t in os.environ.get('LLM_HEDGE_TYPES', 'outline,notes,deck_notes,proofread_notes').split(',')
+    if t.strip()
+}
+
+TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096, 8192)
+
+_lock = threading.Lock()
+_samples = {}
+_hedges = {'fired': 0, 'won': 0}
+
+
+def _bucket(max_tokens):
+    for bucket in TOKEN_BUCKETS:
+        if max_tokens <= bucket:
+            return bucket
+    return TOKEN_BUCKETS[-1]
+
+
+def _key(prompt_type, max_tokens):
+    return (prompt_type or 'untyped', _bucket(max_tokens))
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def record(prompt_type, max_tokens, seconds):
+    """Record the latency of one successful upstream call"""
+    key = _key(prompt_type, max_tokens)
+    with _lock:
+        window = _samples.get(key)
+        if window is None:
+            window = _samples[key] = deque(maxlen=WINDOW)
+        window.append(seconds)
+
+
+def percentile(prompt_type, max_tokens, pct):
+    """Observed latency percentile, or None until enough samples exist"""
+    with _lock:
+        window = list(_samples.get(_key(prompt_type, max_tokens), ()))
+    if len(window) < MIN_SAMPLES:
+        return None
+    return _percentile(window, pct)
+
+
+def timeout_for(prompt_type, max_tokens):
+    """Request timeout derived from p95, clamped to [MIN_TIMEOUT, MAX_TIMEOUT]"""
+    p95 = percentile(prompt_type, max_tokens, 95)
+    if p95 is None:
+        return DEFAULT_TIMEOUT
+    return max(MIN_TIMEOUT, min(MAX_TIMEOUT, p95 * TIMEOUT_MULTIPLIER))
+
+
+def hedge_delay(prompt_type, max_tokens):
+    """Seconds after which to fire a hedged duplicate, or None to not hedge"""
+    if not HEDGE_ENABLED or prompt_type not in HEDGE_TYPES:
+        return None
+    return percentile(prompt_type, max_tokens, 95)
+
+
+def record_hedge(won):
+    with _lock:
+        _hedges['fired'] += 1
+        if won:
+            _hedges['won'] += 1
+
+
+def get_stats():
+    """p50/p95 and current timeout per (prompt_type, max_tokens bucket)"""
+    with _lock:
+        snapshot = {key: list(window) for key, window in _samples.items()}
+        hedges = dict(_hedges)
+    buckets = {}
+    for (prompt_type, bucket), window in sorted(snapshot.items()):
+        buckets[f"{prompt_type}:{bucket}"] = {
+            'count': len(window),
+            'p50': round(_percentile(window, 50), 3),
+            'p95': round(_percentile(window, 95), 3),
+            'timeout': round(timeout_for(prompt_type, bucket), 1),
+        }
+    return {'hedging': HEDGE_ENABLED, 'hedges': hedges, 'buckets': buckets}
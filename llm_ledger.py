@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Per-call LLM ledger
+One row per upstream LLM call (and per response-cache hit): which endpoint
+and user it served, the prompt type and model, input/output and prompt-cache
+tokens, wall-clock latency including retries, how many retries and 529/429s
+it took, and whether it succeeded.
+
+Rows are buffered in memory and written to sqlite in batches by a
+background thread, so recording never adds a disk write to a request.
+summarize() aggregates them, e.g. to see how much of generate_pptx is spent
+in proofread_slide calls:
+
+    python llm_ledger.py --hours 24 --group-by endpoint,prompt_type
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import sqlite3
+import logging
+import argparse
+import threading
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+LEDGER_PATH = os.environ.get('LLM_LEDGER_PATH', 'llm_ledger.db')
+ENABLED = os.environ.get('LLM_LEDGER_ENABLED', 'true').lower() == 'true'
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 2.0
+# Rows kept in memory if the database is unavailable, before the oldest are dropped
+MAX_PENDING = 10000
+
+GROUP_COLUMNS = ('endpoint', 'prompt_type', 'user_id', 'model', 'day', 'hour')
+
+_context = contextvars.ContextVar('llm_ledger_context', default=None)
+_lock = threading.Lock()
+_wake = threading.Event()
+_pending = []
+_writer = None
+_stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'flushes': 0}
+
+
+def _reset_after_fork():
+    global _lock, _wake, _writer
+    _lock = threading.Lock()
+    _wake = threading.Event()
+    _writer = None
+    _pending.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def bind(endpoint=None, user_id=None):
+    """Attribute LLM calls made from the current request/task to this endpoint and user"""
+    _context.set({'endpoint': endpoint, 'user_id': user_id})
+
+
+def current():
+    """The bound context, for carrying it onto another thread or event loop"""
+    return _context.get() or {}
+
+
+def _connect():
+    conn = sqlite3.connect(LEDGER_PATH, timeout=10)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            endpoint TEXT,
+            user_id TEXT,
+            prompt_type TEXT,
+            model TEXT,
+            input_tokens INTEGER DEFAULT 0,
+            output_tokens INTEGER DEFAULT 0,
+            cache_read_tokens INTEGER DEFAULT 0,
+            cache_write_tokens INTEGER DEFAULT 0,
+            latency REAL DEFAULT 0,
+            retries INTEGER DEFAULT 0,
+            overloads INTEGER DEFAULT 0,
+            cache_hit INTEGER DEFAULT 0,
+            streamed INTEGER DEFAULT 0,
+            ok INTEGER DEFAULT 1
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls (created_at)')
+    return conn
+
+
+def _enqueue(row):
+    global _writer
+    if not ENABLED:
+        return
+    with _lock:
+        _pending.append(row)
+        _stats['recorded'] += 1
+        if len(_pending) > MAX_PENDING:
+            _stats['dropped'] += len(_pending) - MAX_PENDING
+            del _pending[:len(_pending) - MAX_PENDING]
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name='llm-ledger', daemon=True)
+            _writer.start()
+        if len(_pending) >= BATCH_SIZE:
+            _wake.set()
+
+
+def record_call(payload, prompt_type, usage, seconds, retries=0, overloads=0, ok=True, streamed=False):
+    """Record one upstream call, retries included; usage is the response's usage block"""
+    usage = usage or {}
+    context = current()
+    _enqueue((
+        time.time(), context.get('endpoint'), context.get('user_id'), prompt_type, payload.get('model'),
+        usage.get('input_tokens') or 0, usage.get('output_tokens') or 0,
+        usage.get('cache_read_input_tokens') or 0, usage.get('cache_creation_input_tokens') or 0,
+        round(seconds, 4), retries, overloads, 0, int(streamed), int(ok),
+    ))
+
+
+def record_cache_hit(prompt_type, model):
+    """Record a call answered from llm_cache without going upstream"""
+    context = current()
+    _enqueue((time.time(), context.get('endpoint'), context.get('user_id'), prompt_type, model,
+              0, 0, 0, 0, 0.0, 0, 0, 1, 0, 1))
+
+
+def flush():
+    """Write all buffered rows now; returns how many were written"""
+    with _lock:
+        rows = list(_pending)
+        _pending.clear()
+    if not rows:
+        return 0
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO llm_calls (created_at, endpoint, user_id, prompt_type, model,
+                        input_tokens, output_tokens, cache_read_tokens, cache_write_tokens,
+                        latency, retries, overloads, cache_hit, streamed, ok)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"LLM ledger write failed, keeping {len(rows)} rows for the next flush: {e}")
+        with _lock:
+            _pending[:0] = rows
+        return 0
+    with _lock:
+        _stats['written'] += len(rows)
+        _stats['flushes'] += 1
+    return len(rows)
+
+
+def _write_loop():
+    while True:
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        flush()
+
+
+atexit.register(flush)
+
+
+def summarize(hours=24, group_by=('endpoint', 'prompt_type')):
+    """Aggregate ledger rows from the last `hours`, grouped by any of GROUP_COLUMNS"""
+    flush()
+    for column in group_by:
+        if column not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group LLM ledger by {column}")
+    expressions = {
+        'day': "date(created_at, 'unixepoch')",
+        'hour': "strftime('%Y-%m-%d %H:00', created_at, 'unixepoch')",
+    }
+    selected = ''.join(f"{expressions.get(column, column)} AS {column}, " for column in group_by)
+    grouping = f"GROUP BY {', '.join(group_by)}" if group_by else ''
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(f'''
+            SELECT {selected}
+                COUNT(*) AS calls,
+                SUM(cache_hit) AS cache_hits,
+                SUM(1 - ok) AS errors,
+                SUM(input_tokens) AS input_tokens,
+                SUM(output_tokens) AS output_tokens,
+                SUM(cache_read_tokens) AS cache_read_tokens,
+                SUM(cache_write_tokens) AS cache_write_tokens,
+                SUM(retries) AS retries,
+                SUM(overloads) AS overloads,
+                ROUND(SUM(latency), 3) AS total_latency,
+                ROUND(AVG(CASE WHEN cache_hit = 0 THEN latency END), 3) AS avg_latency,
+                ROUND(MAX(latency), 3) AS max_latency
+            FROM llm_calls
+            WHERE created_at >= ?
+            {grouping}
+            ORDER BY total_latency DESC
+        ''', (time.time() - hours * 3600,)).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats['pending'] = len(_pending)
+    stats['enabled'] = ENABLED
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize the LLM call ledger')
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--group-by', default='endpoint,prompt_type',
+                        help=f"comma separated, any of {', '.join(GROUP_COLUMNS)}")
+    args = parser.parse_args(argv)
+    group_by = tuple(column.strip() for column in args.group_by.split(',') if column.strip())
+    print(json.dumps(summarize(args.hours, group_by), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Adaptive, process-wide concurrency control for upstream LLM calls
+AIMD limiter shared by every caller in the process: the allowed concurrency
+grows by roughly one per window of successful calls and halves on a 529 or
+429. Overload responses also pause all callers together, for the upstream
+retry-after when given or a shared exponential backoff otherwise, and the
+anthropic-ratelimit-* headers are used to pace proactively before the
+remaining request budget runs out.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))
+MIN_CONCURRENCY = 1
+# Ignore further decreases for this long after one, so a burst of 529s
+# from the same overload only halves the limit once
+DECREASE_COOLDOWN = 2.0
+MAX_BACKOFF = 30.0
+
+
+def _parse_reset(value):
+    """anthropic-ratelimit-*-reset is an RFC 3339 timestamp; return seconds from now"""
+    try:
+        reset_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _parse_retry_after(headers):
+    value = headers.get('retry-after') if headers else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class AdaptiveLimiter:
+    """Additive-increase / multiplicative-decrease gate around upstream calls"""
+
+    def __init__(self, max_limit=MAX_CONCURRENCY, min_limit=MIN_CONCURRENCY):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.consecutive_overloads = 0
+        self.last_decrease = 0.0
+        self.stats = {'successes': 0, 'overloads': 0, 'paced': 0, 'waits': 0}
+        self._cond = threading.Condition()
+
+    def _can_start(self, now):
+        return now >= self.paused_until and self.in_flight < max(self.min_limit, int(self.limit))
+
+    def try_acquire(self):
+        """Take a slot if one is free; returns seconds to wait otherwise (0 means acquired)"""
+        with self._cond:
+            now = time.monotonic()
+            if self._can_start(now):
+                self.in_flight += 1
+                return 0
+            self.stats['waits'] += 1
+            return max(0.02, self.paused_until - now)
+
+    def acquire(self):
+        """Block the calling thread until a slot is free"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._can_start(now):
+                    self.in_flight += 1
+                    return
+                self.stats['waits'] += 1
+                self._cond.wait(timeout=max(0.02, self.paused_until - now))
+
+    async def acquire_async(self):
+        """Wait on the event loop (without blocking it) until a slot is free"""
+        while True:
+            delay = self.try_acquire()
+            if delay == 0:
+                return
+            await asyncio.sleep(min(delay, 1.0))
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, headers=None):
+        """Grow the limit by ~1 per window of successes and pace on low remaining budget"""
+        with self._cond:
+            self.stats['successes'] += 1
+            self.consecutive_overloads = 0
+            self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+            self._pace(headers)
+            self._cond.notify_all()
+
+    def on_overload(self, status, headers=None):
+        """Halve the limit and pause every caller; returns the pause in seconds"""
+        with self._cond:
+            now = time.monotonic()
+            self.stats['overloads'] += 1
+            if now - self.last_decrease >= DECREASE_COOLDOWN:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self.last_decrease = now
+                logger.warning(f"Upstream returned {status}, LLM concurrency limit now {int(self.limit)}")
+
+            retry_after = _parse_retry_after(headers)
+            if retry_after is None:
+                retry_after = min(MAX_BACKOFF, 2 ** self.consecutive_overloads)
+            self.consecutive_overloads += 1
+            self.paused_until = max(self.paused_until, now + retry_after)
+            return self.paused_until - now
+
+    def _pace(self, headers):
+        """Pause until the rate-limit window resets if its remaining budget is nearly spent"""
+        if not headers:
+            return
+        for kind in ('requests', 'tokens', 'output-tokens'):
+            remaining = headers.get(f'anthropic-ratelimit-{kind}-remaining')
+            reset = headers.get(f'anthropic-ratelimit-{kind}-reset')
+            if remaining is None or reset is None:
+                continue
+            try:
+                remaining = int(remaining)
+            except ValueError:
+                continue
+            # Requests budget is compared to callers in flight; token budgets
+            # are only honoured once they are fully exhausted
+            exhausted = remaining <= self.in_flight if kind == 'requests' else remaining <= 0
+            if exhausted:
+                wait = _parse_reset(reset)
+                if wait:
+                    self.stats['paced'] += 1
+                    self.paused_until = max(self.paused_until, time.monotonic() + wait)
+
+    def is_congested(self):
+        """True while the limit is below its maximum, i.e. after a recent overload"""
+        return self.limit < self.max_limit or time.monotonic() < self.paused_until
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats['limit'] = int(self.limit)
+            stats['max_limit'] = self.max_limit
+            stats['in_flight'] = self.in_flight
+            stats['paused_for'] = round(max(0.0, self.paused_until - time.monotonic()), 2)
+        return stats
+
+
+limiter = AdaptiveLimiter()
+
+
+def _reset_after_fork():
+    global limiter
+    limiter = AdaptiveLimiter()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_stats():
+    return limiter.get_stats()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Durable proofreading memo
+Maps already-seen slide text and speaker notes to their proofread version,
+so section titles like "Overview" or a fact that reappears in another deck
+(or in a re-download of the same deck) never go back to the LLM. Unlike
+llm_cache, entries are keyed by the normalized input text alone rather than
+by the exact request, so they survive model routing changes, and they do not
+expire: the table is bounded by size with least-recently-used eviction.
+
+Each MemoTable has a version derived from its proofreading prompt; changing
+the prompt changes the version, and rows written under an older version are
+dropped the first time the table is used. Every output is also stored as
+mapping to itself, so text that has already been proofread is recognized
+as such.
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+
+import llm_cache
+
+logger = logging.getLogger(__name__)
+
+MEMO_PATH = os.environ.get('LLM_MEMO_PATH', 'llm_memo.db')
+MEMO_ENABLED = os.environ.get('LLM_MEMO_ENABLED', 'true').lower() == 'true'
+MEMO_MAX_BYTES = int(os.environ.get('LLM_MEMO_MAX_BYTES', 20 * 1024 * 1024))
+
+_WHITESPACE = re.compile(r'\s+')
+_QUOTES = str.maketrans({'‘': "'", '’': "'", '“': '"', '”': '"'})
+
+_lock = threading.Lock()
+_tables = []
+
+
+def normalize(text):
+    """Memo key text: Unicode NFKC, straight quotes, whitespace collapsed; case is kept"""
+    text = unicodedata.normalize('NFKC', text).translate(_QUOTES)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+_store = llm_cache.SqliteStore(MEMO_PATH, 'proofread_memo', '''
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version TEXT NOT NULL,
+    output TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+''', indexes=['last_access'], max_bytes=MEMO_MAX_BYTES, evict_every=100)
+
+
+class MemoTable:
+    """Proofread outputs of one kind ('slide', 'notes'), versioned by the prompt that produced them"""
+
+    def __init__(self, kind, prompt):
+        self.kind = kind
+        self.version = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'invalidated': 0}
+        self._purged_pid = None
+        _tables.append(self)
+
+    def _count(self, name, amount=1):
+        with _lock:
+            self.stats[name] += amount
+
+    def _key(self, text):
+        return hashlib.sha256(normalize(text).encode('utf-8')).hexdigest()
+
+    def _purge_stale(self, conn):
+        """Drop rows written under another prompt version, once per process"""
+        if self._purged_pid == os.getpid():
+            return
+        self._purged_pid = os.getpid()
+        removed = conn.execute('DELETE FROM proofread_memo WHERE kind = ? AND version != ?',
+                               (self.kind, self.version)).rowcount
+        if removed:
+            self._count('invalidated', removed)
+            logger.info(f"Proofread memo '{self.kind}' dropped {removed} entries from an older prompt version")
+
+    def get(self, text):
+        """Proofread version of text, or None if it has not been seen"""
+        if not MEMO_ENABLED or not text.strip():
+            return None
+        try:
+            conn = _store.connection()
+            self._purge_stale(conn)
+            key = self._key(text)
+            row = conn.execute('SELECT output FROM proofread_memo WHERE kind = ? AND key = ? AND version = ?',
+                               (self.kind, key, self.version)).fetchone()
+            if row is None:
+                self._count('misses')
+                return None
+            conn.execute('UPDATE proofread_memo SET last_access = ? WHERE kind = ? AND key = ?',
+                         (time.time(), self.kind, key))
+            self._count('hits')
+            return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Proofread memo read failed: {e}")
+            self._count('misses')
+            return None
+
+    def put(self, text, output):
+        """Remember text -> output, and output -> itself"""
+        if not MEMO_ENABLED or not text.strip() or not output.strip():
+            return
+        now = time.time()
+        size = len(output.encode('utf-8'))
+        rows = [(self.kind, self._key(text), self.version, output, size, now)]
+        if normalize(output) != normalize(text):
+            rows.append((self.kind, self._key(output), self.version, output, size, now))
+        try:
+            conn = _store.connection()
+            self._purge_stale(conn)
+            conn.executemany('''
+                INSERT OR REPLACE INTO proofread_memo (kind, key, version, output, size, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self._count('writes', len(rows))
+            _store.wrote()
+        except sqlite3.Error as e:
+            logger.warning(f"Proofread memo write failed: {e}")
+
+    def get_stats(self):
+        with _lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['version'] = self.version
+        return stats
+
+
+def evict():
+    """Drop the least recently used entries until the table is under MEMO_MAX_BYTES"""
+    return _store.evict()
+
+
+def get_stats():
+    return {'enabled': MEMO_ENABLED, 'max_bytes': MEMO_MAX_BYTES,
+            'tables': {table.kind: table.get_stats() for table in _tables}}
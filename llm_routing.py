@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Task-based model routing
+Maps each prompt type to a model tier and a latency target, so trivial work
+(proofreading a two-word title, shortening a bullet) goes to the small fast
+model and only open-ended generation uses the bigger one. LLM_ROUTING_PROFILE
+picks the table:
+- balanced (default): per-type tiers from ROUTES
+- quality: everything on the medium tier, as before routing existed
+- fast: small tier for everything except the outline
+- off: use whatever model the caller passes
+
+A caller that supplies a validator gets its answer re-requested one tier up
+when validation fails (see llm_client.call_anthropic), by default only once:
+LLM_ESCALATION_STEPS sets how many tiers it may climb and
+LLM_ESCALATION_MAX_TIER the highest tier it may reach, so routine prompts do
+not end up on the large model unnoticed. Compare profiles end to end with
+bench_routing.py.
+"""
+
+import os
+import threading
+
+import llm_latency
+
+TIERS = {
+    'small': os.environ.get('LLM_MODEL_SMALL', 'claude-3-5-haiku-20241022'),
+    'medium': os.environ.get('LLM_MODEL_MEDIUM', 'claude-sonnet-4-20250514'),
+    'large': os.environ.get('LLM_MODEL_LARGE', 'claude-opus-4-20250514'),
+}
+TIER_ORDER = ('small', 'medium', 'large')
+
+ESCALATION_STEPS = int(os.environ.get('LLM_ESCALATION_STEPS', 1))
+ESCALATION_MAX_TIER = os.environ.get('LLM_ESCALATION_MAX_TIER', 'large').lower()
+if ESCALATION_MAX_TIER not in TIER_ORDER:
+    raise ValueError(f"Unknown LLM_ESCALATION_MAX_TIER: {ESCALATION_MAX_TIER}")
+
+# prompt_type -> (tier, p95 latency target in seconds)
+ROUTES = {
+    'proofread_slide': ('small', 3),
+    'proofread_slide_batch': ('small', 8),
+    'concise_bullets': ('small', 3),
+    'concise_batch': ('small', 5),
+    'web_context': ('small', 4),
+    'proofread_notes': ('medium', 15),
+    'notes': ('medium', 12),
+    'deck_notes': ('medium', 12),
+    'outline': ('medium', 30),
+    'outline_section': ('medium', 10),
+    'style': ('medium', 20),
+}
+
+PROFILES = ('balanced', 'quality', 'fast', 'off')
+_profile = os.environ.get('LLM_ROUTING_PROFILE', 'balanced').lower()
+_lock = threading.Lock()
+_escalations = {}
+# Escalations onto the large tier, the most expensive model, counted on their own
+_large_escalations = {}
+
+
+def set_profile(name):
+    """Switch routing profile at runtime (used by the benchmark)"""
+    global _profile
+    if name not in PROFILES:
+        raise ValueError(f"Unknown routing profile: {name}")
+    _profile = name
+
+
+def get_profile():
+    return _profile
+
+
+def _tier_for(prompt_type):
+    if prompt_type not in ROUTES:
+        return None
+    if _profile == 'quality':
+        return 'medium'
+    if _profile == 'fast':
+        return 'medium' if prompt_type == 'outline' else 'small'
+    return ROUTES[prompt_type][0]
+
+
+def model_for(prompt_type, model=None):
+    """Model to send this prompt type to; the caller's model when the type is unrouted or routing is off"""
+    if _profile == 'off':
+        return model
+    tier = _tier_for(prompt_type)
+    return TIERS[tier] if tier is not None else model
+
+
+def _tier_of(model):
+    return next((name for name, tier_model in TIERS.items() if tier_model == model), None)
+
+
+def escalation_chain(prompt_type, model):
+    """
+    Models to try in order: the routed one, then up to ESCALATION_STEPS bigger
+    tiers, none above ESCALATION_MAX_TIER
+    """
+    chain = [model]
+    tier = _tier_of(model)
+    if tier is not None:
+        start = TIER_ORDER.index(tier) + 1
+        stop = min(start + ESCALATION_STEPS, TIER_ORDER.index(ESCALATION_MAX_TIER) + 1)
+        chain.extend(TIERS[name] for name in TIER_ORDER[start:stop])
+    return chain
+
+
+def record_escalation(prompt_type, model=None):
+    """Count a retry of prompt_type one tier above model, the model whose answer failed validation"""
+    tier = _tier_of(model)
+    with _lock:
+        _escalations[prompt_type] = _escalations.get(prompt_type, 0) + 1
+        if tier is not None and TIER_ORDER.index(tier) + 1 == TIER_ORDER.index('large'):
+            _large_escalations[prompt_type] = _large_escalations.get(prompt_type, 0) + 1
+
+
+def slo_for(prompt_type):
+    route = ROUTES.get(prompt_type)
+    return route[1] if route else None
+
+
+def get_stats():
+    """Routing table, escalations and observed p95 against each latency target; per-model counts are in llm_ledger"""
+    latency = llm_latency.get_stats()['buckets']
+    slos = {}
+    for name, bucket in latency.items():
+        prompt_type = name.rsplit(':', 1)[0]
+        target = slo_for(prompt_type)
+        if target is not None:
+            slos[name] = {'p95': bucket['p95'], 'target': target, 'met': bucket['p95'] <= target}
+    with _lock:
+        escalations = dict(_escalations)
+        large_escalations = dict(_large_escalations)
+    return {
+        'profile': _profile,
+        'routes': {prompt_type: _tier_for(prompt_type) for prompt_type in ROUTES} if _profile != 'off' else {},
+        'escalations': escalations,
+        'escalations_to_large': large_escalations,
+        'escalation_limit': {'steps': ESCALATION_STEPS, 'max_tier': ESCALATION_MAX_TIER},
+        'slo': slos,
+    }
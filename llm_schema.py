@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Schema-constrained LLM output
+Prompts whose answer is data (the outline, the concise-bullet batch, the
+style config) are sent with a single tool whose input_schema describes that
+data, and the model is made to call it (see llm_client.call_structured). The
+tool input arrives already parsed, so there is no fence or trailing-comma
+cleanup, and validate() checks it locally against the same schema before it
+is used or cached.
+
+validate() covers the JSON Schema subset these tools use: type, enum,
+required, properties, additionalProperties, items, min/maxItems,
+min/maxLength, pattern and minimum/maximum.
+"""
+
+import re
+
+
+class SchemaError(Exception):
+    """Structured output that is missing or does not match its schema"""
+
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+}
+
+
+def tool(name, description, input_schema):
+    """Tool definition for the messages API"""
+    return {'name': name, 'description': description, 'input_schema': input_schema}
+
+
+def validate(instance, schema, path='$'):
+    """Raise SchemaError naming the first place instance does not match schema"""
+    expected = schema.get('type')
+    if expected is not None:
+        if not isinstance(instance, _TYPES[expected]) or \
+                (isinstance(instance, bool) and expected in ('integer', 'number')):
+            raise SchemaError(f"{path}: expected {expected}, got {type(instance).__name__}")
+
+    if 'enum' in schema and instance not in schema['enum']:
+        raise SchemaError(f"{path}: {instance!r} is not one of {schema['enum']}")
+
+    if isinstance(instance, str):
+        if len(instance) < schema.get('minLength', 0):
+            raise SchemaError(f"{path}: shorter than {schema['minLength']} characters")
+        if 'maxLength' in schema and len(instance) > schema['maxLength']:
+            raise SchemaError(f"{path}: longer than {schema['maxLength']} characters")
+        if 'pattern' in schema and not re.search(schema['pattern'], instance):
+            raise SchemaError(f"{path}: {instance!r} does not match {schema['pattern']}")
+
+    elif isinstance(instance, (int, float)) and not isinstance(instance, bool):
+        if 'minimum' in schema and instance < schema['minimum']:
+            raise SchemaError(f"{path}: {instance} is below {schema['minimum']}")
+        if 'maximum' in schema and instance > schema['maximum']:
+            raise SchemaError(f"{path}: {instance} is above {schema['maximum']}")
+
+    elif isinstance(instance, list):
+        if len(instance) < schema.get('minItems', 0):
+            raise SchemaError(f"{path}: fewer than {schema['minItems']} items")
+        if 'maxItems' in schema and len(instance) > schema['maxItems']:
+            raise SchemaError(f"{path}: more than {schema['maxItems']} items")
+        if 'items' in schema:
+            for index, item in enumerate(instance):
+                validate(item, schema['items'], f"{path}[{index}]")
+
+    elif isinstance(instance, dict):
+        for name in schema.get('required', ()):
+            if name not in instance:
+                raise SchemaError(f"{path}: missing required field {name}")
+        properties = schema.get('properties', {})
+        for name, value in instance.items():
+            if name in properties:
+                validate(value, properties[name], f"{path}.{name}")
+            elif schema.get('additionalProperties') is False:
+                raise SchemaError(f"{path}: unexpected field {name}")
+
+    return instance
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+PresPilot - Single-flight coalescing of identical LLM prompts
+When several callers send the same (model, prompt, max_tokens) at the same
+time, only the first one (the leader) goes upstream; the others wait for its
+result. Works for request threads and for the async fan-out loop alike.
+
+With LLM_SINGLE_FLIGHT_SHARED=true the leader also takes a short sqlite
+lease in the llm_cache file, so identical prompts from other gunicorn
+workers wait for it too and read the response from the lease row.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+import llm_cache
+
+logger = logging.getLogger(__name__)
+
+SHARED = os.environ.get('LLM_SINGLE_FLIGHT_SHARED', 'false').lower() == 'true'
+# How long a leader may hold a lease before others assume it died
+LEASE_TIMEOUT = int(os.environ.get('LLM_SINGLE_FLIGHT_LEASE', 90))
+# How long a finished response stays readable for late followers
+DONE_TTL = 30
+POLL_INTERVAL = 0.1
+
+_lock = threading.Lock()
+_in_flight = {}
+_stats = {
+    'leaders': 0,
+    'coalesced_local': 0,
+    'coalesced_shared': 0,
+}
+_tables_ready = set()
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def get_stats():
+    """Counters for how many calls were deduplicated"""
+    with _lock:
+        stats = dict(_stats)
+    stats['in_flight_keys'] = len(_in_flight)
+    stats['shared'] = SHARED
+    return stats
+
+
+def _join(key):
+    """Return (future, is_leader) for this key"""
+    with _lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            _stats['coalesced_local'] += 1
+            return future, False
+        future = Future()
+        _in_flight[key] = future
+        _stats['leaders'] += 1
+        return future, True
+
+
+def _finish(key, future, result=None, error=None):
+    with _lock:
+        _in_flight.pop(key, None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def do(key, fn):
+    """Run fn() once for all concurrent callers with the same key"""
+    future, leader = _join(key)
+    if not leader:
+        return future.result()
+
+    try:
+        result = _run_shared(key, fn) if SHARED else fn()
+    except BaseException as e:
+        _finish(key, future, error=e)
+        raise
+    _finish(key, future, result=result)
+    return result
+
+
+async def do_async(key, coro_fn):
+    """Async variant of do(); coro_fn() returns the coroutine to await"""
+    future, leader = _join(key)
+    if not leader:
+        return await asyncio.wrap_future(future)
+
+    try:
+        result = await _run_shared_async(key, coro_fn) if SHARED else await coro_fn()
+    except BaseException as e:
+        _finish(key, future, error=e)
+        raise
+    _finish(key, future, result=result)
+    return result
+
+
+# ============= Cross-worker leases =============
+
+def _conn():
+    conn = llm_cache.get_connection()
+    if id(conn) not in _tables_ready:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_leases (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                status TEXT NOT NULL,
+                response TEXT,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        _tables_ready.add(id(conn))
+    return conn
+
+
+def _owner():
+    return f"{os.getpid()}:{threading.get_ident()}"
+
+
+def _try_acquire(key):
+    """
+    Try to become the cross-worker leader for key.
+    Returns ('leader', None), ('done', response) or ('wait', None).
+    """
+    now = time.time()
+    conn = _conn()
+    conn.execute('DELETE FROM llm_leases WHERE expires_at < ?', (now,))
+    try:
+        conn.execute('''
+            INSERT INTO llm_leases (key, owner, status, expires_at) VALUES (?, ?, 'pending', ?)
+        ''', (key, _owner(), now + LEASE_TIMEOUT))
+        return 'leader', None
+    except sqlite3.IntegrityError:
+        row = conn.execute('SELECT status, response FROM llm_leases WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return _try_acquire(key)
+        if row[0] == 'done':
+            return 'done', row[1]
+        return 'wait', None
+
+
+def _complete(key, response):
+    _conn().execute('''
+        UPDATE llm_leases SET status = 'done', response = ?, expires_at = ? WHERE key = ?
+    ''', (response, time.time() + DONE_TTL, key))
+
+
+def _release(key):
+    _conn().execute("DELETE FROM llm_leases WHERE key = ? AND status = 'pending'", (key,))
+
+
+def _acquire_or_poll(key):
+    """One polling step; returns the same tuples as _try_acquire, degrading to leader on db errors"""
+    try:
+        return _try_acquire(key)
+    except sqlite3.Error as e:
+        logger.warning(f"Single-flight lease unavailable, calling directly: {e}")
+        return 'leader', None
+
+
+def _run_shared(key, fn):
+    while True:
+        state, response = _acquire_or_poll(key)
+        if state == 'done':
+            _count('coalesced_shared')
+            return response
+        if state == 'leader':
+            break
+        time.sleep(POLL_INTERVAL)
+    try:
+        result = fn()
+    except BaseException:
+        _safe(_release, key)
+        raise
+    _safe(_complete, key, result)
+    return result
+
+
+async def _run_shared_async(key, coro_fn):
+    while True:
+        state, response = _acquire_or_poll(key)
+        if state == 'done':
+            _count('coalesced_shared')
+            return response
+        if state == 'leader':
+            break
+        await asyncio.sleep(POLL_INTERVAL)
+    try:
+        result = await coro_fn()
+    except BaseException:
+        _safe(_release, key)
+        raise
+    _safe(_complete, key, result)
+    return result
+
+
+def _safe(fn, *args):
+    try:
+        fn(*args)
+    except sqlite3.Error as e:
+        logger.warning(f"Single-flight lease update failed: {e}")
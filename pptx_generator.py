@@ -1944,29 +1944,7 @@ def generate_presentation(title, topic, sections, theme_name="Business Black and
 
     # Add content slides
     for i, section in enumerate(sections):
-        # Use pre-generated AI speaker notes if available, otherwise generate locally
-        if 'speaker_notes' in section and section['speaker_notes']:
-            notes = section['speaker_notes']
-        else:
-            # Fallback to local generation
-            notes = generate_human_speaker_notes(
-                section.get('title', f'Section {i+1}'),
-                section.get('facts', []),
-                section.get('notes_context', ''),
-                notes_style,
-                i + 1,
-                section.get('custom_notes')
-            )
-
-        # Get facts - conversion should already be done in server.py before calling this
-        facts = section.get('facts', ['Content for this section'])
-
-        # Add content slide
-        gen.add_content_slide(
-            section.get('title', f'Section {i+1}'),
-            facts,
-            notes=notes
-        )
+        add_section_slide(gen, section, i, notes_style)
 
     # Add thank you slide
     gen.add_thank_you_slide()
@@ -1975,6 +1953,33 @@ def generate_presentation(title, topic, sections, theme_name="Business Black and
     return filename
 
 
+def add_section_slide(gen, section, index, notes_style="Detailed"):
+    """Add the content slide for sections[index] (0-based) to gen"""
+    # Use pre-generated AI speaker notes if available, otherwise generate locally
+    if 'speaker_notes' in section and section['speaker_notes']:
+        notes = section['speaker_notes']
+    else:
+        # Fallback to local generation
+        notes = generate_human_speaker_notes(
+            section.get('title', f'Section {index+1}'),
+            section.get('facts', []),
+            section.get('notes_context', ''),
+            notes_style,
+            index + 1,
+            section.get('custom_notes')
+        )
+
+    # Get facts - conversion should already be done in server.py before calling this
+    facts = section.get('facts', ['Content for this section'])
+
+    # Add content slide
+    return gen.add_content_slide(
+        section.get('title', f'Section {index+1}'),
+        facts,
+        notes=notes
+    )
+
+
 def generate_human_speaker_notes(title, facts, context, style, slide_num, custom_notes=None):
     """Generate natural, human-sounding speaker notes that read like actual presentation speech"""
 
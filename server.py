@@ -4,22 +4,40 @@ PresPilot - Backend Server with Authentication & Subscriptions
 PAYMENT REQUIRED - No free tier, users must subscribe to generate presentations.
 """
 
-from flask import Flask, request, jsonify, session, send_from_directory
+from flask import Flask, request, jsonify, session, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 import os
 import json
-import requests
 from datetime import datetime, timedelta
 import logging
 import sqlite3
 import hashlib
 import secrets
-from functools import wraps
+from functools import wraps, partial
 from dotenv import load_dotenv
 import stripe
 import time
+import threading
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Email, To, Content
+import deck_artifacts
+import deck_checkpoints
+import deck_dag
+import deck_events
+import deck_jobs
+import llm_client
+import llm_json
+import llm_batch
+import llm_budget
+import llm_cache
+import llm_cassette
+import llm_latency
+import llm_ledger
+import llm_limiter
+import llm_memo
+import llm_routing
+import llm_schema
+import llm_singleflight
 
 # Load environment variables from .env file
 load_dotenv()
@@ -39,6 +57,11 @@ allowed_origins = [
 allowed_origins = [origin for origin in allowed_origins if origin]
 CORS(app, supports_credentials=True, origins=allowed_origins if allowed_origins else "*")
 
+@app.before_request
+def bind_llm_ledger_context():
+    """Attribute LLM calls made while serving this request in the LLM ledger"""
+    llm_ledger.bind(endpoint=request.endpoint, user_id=session.get('user_id', 'anonymous'))
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -49,7 +72,6 @@ if not ANTHROPIC_API_KEY:
     logger.error("❌ ANTHROPIC_API_KEY not found! Please set it in .env file")
 else:
     logger.info(f"✅ API Key loaded: {ANTHROPIC_API_KEY[:20]}...")
-ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
 MODEL = "claude-sonnet-4-20250514"
 
 # Stripe configuration
@@ -324,66 +346,31 @@ def check_rate_limit(user_id, endpoint, limit=20, window_minutes=1):
     conn.close()
     return True
 
-def call_anthropic(prompt, max_tokens=2000, max_retries=6):
-    """Make API call to Anthropic with retry logic for 529 errors"""
-    if not ANTHROPIC_API_KEY:
-        raise Exception("ANTHROPIC_API_KEY environment variable not set")
+def call_anthropic(prompt, max_tokens=2000, max_retries=6, prompt_type=None, system=None, validate=None):
+    """Make API call to Anthropic over the shared connection pool (see llm_client)"""
+    return llm_client.call_anthropic(prompt, max_tokens=max_tokens, max_retries=max_retries,
+                                     model=MODEL, api_key=ANTHROPIC_API_KEY, prompt_type=prompt_type,
+                                     system=system, validate=validate)
 
-    headers = {
-        "x-api-key": ANTHROPIC_API_KEY,
-        "anthropic-version": "2023-06-01",
-        "content-type": "application/json"
-    }
+def submit_call(prompt, tool=None, max_tokens=2000, max_retries=6, prompt_type=None, system=None, validate=None):
+    """Start an API call without waiting; returns a Future for the text, or with a tool, the tool input"""
+    return llm_client.submit(prompt, max_tokens=max_tokens, max_retries=max_retries, model=MODEL,
+                             api_key=ANTHROPIC_API_KEY, prompt_type=prompt_type, system=system, validate=validate,
+                             tool=tool)
 
-    payload = {
-        "model": MODEL,
-        "max_tokens": max_tokens,
-        "messages": [{"role": "user", "content": prompt}]
-    }
+def call_structured(prompt, tool, max_tokens=2000, max_retries=6, prompt_type=None, system=None, validate=None):
+    """Ask for data through a forced tool call; returns the validated tool input (see llm_schema)"""
+    return llm_client.call_structured(prompt, tool, max_tokens=max_tokens, max_retries=max_retries,
+                                      model=MODEL, api_key=ANTHROPIC_API_KEY, prompt_type=prompt_type,
+                                      system=system, validate=validate)
 
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(ANTHROPIC_API_URL, headers=headers, json=payload, timeout=60)
-
-            if response.status_code == 200:
-                data = response.json()
-                return data['content'][0]['text']
-            elif response.status_code == 529 and attempt < max_retries - 1:
-                # Exponential backoff: wait 2^attempt seconds
-                wait_time = 2 ** attempt
-                logger.warning(f"API overloaded (529), retrying in {wait_time}s... (attempt {attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
-                continue
-            else:
-                raise Exception(f"API error: {response.status_code} - {response.text}")
+# Static instruction preambles are sent as system blocks; only the short per-call
+# text goes in the user message. At about 300 tokens each they are below the
+# upstream prompt-cache minimum (1024 tokens, 2048 on Haiku), so they are not
+# cached - padding them to qualify would cost more on every call than it saves
+NOTES_PROOFREAD_SYSTEM = """You are a professional editor proofreading speaker notes for a presentation.
 
-        except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                logger.warning(f"API timeout, retrying in {wait_time}s... (attempt {attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
-                continue
-            else:
-                raise Exception("API request timed out after multiple retries")
-
-        except Exception as e:
-            logger.error(f"Anthropic API error: {str(e)}")
-            raise
-
-    raise Exception("Max retries exceeded")
-
-def proofread_speaker_notes(notes_text, max_tokens=2200):
-    """
-    Proofread speaker notes for grammar, clarity, and naturalness.
-    Returns grammatically corrected version.
-    """
-    try:
-        prompt = f"""You are a professional editor proofreading speaker notes for a presentation.
-
-ORIGINAL SPEAKER NOTES:
-{notes_text}
-
-TASK: Thoroughly proofread and correct these speaker notes to ensure they are grammatically perfect, clear, and natural-sounding.
+TASK: Thoroughly proofread and correct the speaker notes you are given to ensure they are grammatically perfect, clear, and natural-sounding.
 
 FIX ALL OF THE FOLLOWING:
 1. **Grammar errors** - Subject-verb agreement, tense consistency, pronoun usage, etc.
@@ -401,30 +388,11 @@ MAINTAIN:
 - The core meaning and information
 - The engaging, human-like quality
 
-OUTPUT: Return ONLY the corrected text with no explanations, comments, or labels. The corrected notes should read smoothly and professionally.
-
-CORRECTED NOTES:"""
+OUTPUT: Return ONLY the corrected text with no explanations, comments, or labels. The corrected notes should read smoothly and professionally."""
 
-        corrected = call_anthropic(prompt, max_tokens=max_tokens)
-        return corrected.strip()
+SLIDE_PROOFREAD_SYSTEM = """You are a professional editor proofreading slide text for a presentation.
 
-    except Exception as e:
-        logger.error(f"Error proofreading notes: {str(e)}")
-        # Return original if proofreading fails
-        return notes_text
-
-def proofread_slide_text(slide_text, max_tokens=500):
-    """
-    Proofread slide text (titles and bullet points) for grammar and clarity.
-    Returns grammatically corrected version optimized for slides.
-    """
-    try:
-        prompt = f"""You are a professional editor proofreading slide text for a presentation.
-
-ORIGINAL SLIDE TEXT:
-{slide_text}
-
-TASK: Thoroughly proofread and correct this slide text to ensure it is grammatically perfect, clear, and concise.
+TASK: Thoroughly proofread and correct the slide text you are given to ensure it is grammatically perfect, clear, and concise.
 
 FIX ALL OF THE FOLLOWING:
 1. **Grammar errors** - Subject-verb agreement, tense consistency, pronoun usage, etc.
@@ -440,11 +408,133 @@ MAINTAIN:
 - Professional tone appropriate for presentations
 - Bullet point or phrase structure (don't turn it into full sentences if it wasn't)
 
-OUTPUT: Return ONLY the corrected text with no explanations, comments, or labels. Keep it concise and slide-appropriate.
+OUTPUT: Return ONLY the corrected text with no explanations, comments, or labels. Keep it concise and slide-appropriate."""
+
+OUTLINE_SYSTEM = """You create detailed outlines for slide presentations.
+
+CRITICAL REQUIREMENTS:
+1. Create EXACTLY the requested number of sections (one per slide)
+2. Each section title must be VERY SHORT - MAXIMUM 2 WORDS (like "Overview", "Key Benefits", "Statistics", "Implementation", "Results")
+3. Each section must have 3-4 key points
+4. Each key point MUST be a COMPLETE SENTENCE (12-20 words)
+5. Key points must be SPECIFIC - include numbers, examples, names, dates when relevant
+6. NO repetition between sections - each section covers a DIFFERENT aspect
+7. Each key point should be informative but concise enough to fit on a slide
+
+Return ONLY valid JSON (no markdown, no ```json):
+{
+  "sections": [
+    {"title": "Introduction", "facts": ["This is a complete sentence with specific information about the topic.", "This is another complete sentence covering a different aspect.", "This is a third sentence with relevant data or examples."]},
+    {"title": "Key Benefits", "facts": ["First complete sentence about benefits with specific details.", "Second complete sentence highlighting different advantages.", "Third sentence with concrete examples or statistics."]}
+  ]
+}
+
+Make it comprehensive, professional, and ensure each section is DISTINCT with VERY SHORT titles."""
+
+MIN_SECTION_FACTS = 3
+
+# What one usable outline section looks like. The full outline schema is looser
+# at the section level, so that a short or broken section can be repaired on
+# its own (see repair_outline) instead of failing the whole outline
+OUTLINE_SECTION_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'title': {'type': 'string', 'minLength': 1, 'description': 'Section title, at most 2 words'},
+        'facts': {'type': 'array', 'minItems': MIN_SECTION_FACTS, 'items': {'type': 'string', 'minLength': 1},
+                  'description': '3-4 complete sentences of 12-20 words'},
+    },
+    'required': ['title', 'facts'],
+}
+
+OUTLINE_TOOL = llm_schema.tool('record_outline', 'Record the presentation outline, one section per slide.', {
+    'type': 'object',
+    'properties': {
+        'sections': {
+            'type': 'array',
+            'minItems': 1,
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'title': {'type': 'string', 'description': 'Section title, at most 2 words'},
+                    'facts': {'type': 'array', 'description': '3-4 complete sentences of 12-20 words'},
+                },
+            },
+        },
+    },
+    'required': ['sections'],
+})
+
+OUTLINE_SECTION_TOOL = llm_schema.tool('record_section', 'Record one section of the presentation outline.',
+                                       OUTLINE_SECTION_SCHEMA)
+
+CONCISE_TOOL = llm_schema.tool('record_short_phrases', 'Record the shortened phrases, one per input bullet, in order.', {
+    'type': 'object',
+    'properties': {
+        'phrases': {'type': 'array', 'items': {'type': 'string', 'minLength': 1}},
+    },
+    'required': ['phrases'],
+})
+
+def proofread_speaker_notes(notes_text, max_tokens=2200):
+    """
+    Proofread speaker notes for grammar, clarity, and naturalness.
+    Returns grammatically corrected version.
+    """
+    try:
+        memoized = notes_proofread_memo.get(notes_text)
+        if memoized is not None:
+            return memoized
+
+        prompt = f"""ORIGINAL SPEAKER NOTES:
+{notes_text}
+
+CORRECTED NOTES:"""
+
+        corrected = call_anthropic(prompt, max_tokens=max_tokens, prompt_type='proofread_notes',
+                                   system=NOTES_PROOFREAD_SYSTEM).strip()
+        notes_proofread_memo.put(notes_text, corrected)
+        return corrected
+
+    except Exception as e:
+        logger.error(f"Error proofreading notes: {str(e)}")
+        # Return original if proofreading fails
+        return notes_text
+
+def build_slide_proofread_prompt(slide_text):
+    """User block for proofreading a single slide title or bullet (instructions are in SLIDE_PROOFREAD_SYSTEM)"""
+    return f"""ORIGINAL SLIDE TEXT:
+{slide_text}
 
 CORRECTED TEXT:"""
 
-        corrected = call_anthropic(prompt, max_tokens=max_tokens)
+SLIDE_PROOFREAD_BATCH_SYSTEM = SLIDE_PROOFREAD_SYSTEM.replace(
+    "OUTPUT: Return ONLY the corrected text with no explanations, comments, or labels.",
+    "You will be given a JSON list of items, each a separate piece of slide text with an id. "
+    "Proofread each one on its own.\n\n"
+    "OUTPUT: Record every item exactly once with the record_corrections tool, under the same id as its input, "
+    "with only its corrected text and no explanations, comments, or labels.")
+
+# Text that has been proofread before, in any deck, is answered from a durable
+# memo; editing a proofreading prompt invalidates that prompt's entries
+notes_proofread_memo = llm_memo.MemoTable('notes', NOTES_PROOFREAD_SYSTEM)
+slide_proofread_memo = llm_memo.MemoTable('slide', SLIDE_PROOFREAD_SYSTEM + SLIDE_PROOFREAD_BATCH_SYSTEM)
+
+# Titles and bullets from all concurrent requests are proofread together in
+# batches of id'd items instead of one upstream call each (see llm_batch)
+slide_proofreader = llm_batch.MicroBatcher(
+    'proofread_slide', build_slide_proofread_prompt, SLIDE_PROOFREAD_SYSTEM, SLIDE_PROOFREAD_BATCH_SYSTEM,
+    'proofread_slide', model=MODEL, api_key=ANTHROPIC_API_KEY, memo=slide_proofread_memo)
+
+# Longest a request waits on a batched proofread before keeping the original text
+PROOFREAD_WAIT_SECONDS = float(os.environ.get('PROOFREAD_WAIT_SECONDS', 150))
+
+def proofread_slide_text(slide_text, max_tokens=500):
+    """
+    Proofread slide text (titles and bullet points) for grammar and clarity.
+    Returns grammatically corrected version optimized for slides.
+    """
+    try:
+        corrected = slide_proofreader.submit(slide_text).result(timeout=PROOFREAD_WAIT_SECONDS)
         return corrected.strip()
 
     except Exception as e:
@@ -452,6 +542,80 @@ CORRECTED TEXT:"""
         # Return original if proofreading fails
         return slide_text
 
+def build_deck_notes_prompt(section):
+    """Prompt for one slide's detailed speaker notes in generate_pptx"""
+    facts_text = '\n'.join([f"- {fact}" for fact in section['facts'][:5]])
+    return f"""Create detailed speaker notes for a presentation slide about "{section.get('title', 'this topic')}".
+
+Key points to cover:
+{facts_text}
+
+Write a natural, conversational paragraph (5-7 sentences) that provides context, insights, and examples for these points.
+
+Speaker notes:"""
+
+# Slide tasks (LLM calls in flight and renders) one deck may have in progress
+# at once; the process-wide limiter still applies on top of this
+DECK_TASK_CONCURRENCY = int(os.environ.get('DECK_TASK_CONCURRENCY', os.environ.get('NOTES_CONCURRENCY', 8)))
+# How long a generate-pptx request waits for a running build with the same Idempotency-Key before a 409
+IDEMPOTENT_WAIT_SECONDS = float(os.environ.get('DECK_IDEMPOTENT_WAIT_SECONDS', 30))
+
+_stage_lock = threading.Lock()
+deck_stage_stats = {}
+
+class StageTimer:
+    """
+    Wall-clock time of each stage of one deck build. Each finished
+    deck is logged, sent back as a Server-Timing header, and added to
+    deck_stage_stats for /health; with a deck_events.Progress, stages are
+    also published as they start and finish.
+    """
+
+    def __init__(self, progress=None):
+        self.stages = []
+        self.started = time.monotonic()
+        self.progress = progress
+
+    def start(self, name):
+        self.stages.append([name, time.monotonic(), None, ''])
+        if self.progress is not None:
+            self.progress.emit('stage', stage=name, state='started')
+
+    def stop(self, detail=''):
+        stage = self.stages[-1]
+        stage[2] = time.monotonic() - stage[1]
+        stage[3] = detail
+        if self.progress is not None:
+            self.progress.emit('stage', stage=stage[0], state='finished', seconds=round(stage[2], 3), detail=detail)
+        self._account(stage)
+
+    def record(self, name, seconds, detail=''):
+        """Add a stage timed elsewhere, e.g. the summed time of one kind of slide task"""
+        stage = [name, None, seconds, detail]
+        self.stages.append(stage)
+        self._account(stage)
+
+    def _account(self, stage):
+        with _stage_lock:
+            totals = deck_stage_stats.setdefault(stage[0], {'count': 0, 'total_s': 0.0, 'max_s': 0.0})
+            totals['count'] += 1
+            totals['total_s'] = round(totals['total_s'] + stage[2], 3)
+            totals['max_s'] = round(max(totals['max_s'], stage[2]), 3)
+            totals['avg_s'] = round(totals['total_s'] / totals['count'], 3)
+
+    def header(self):
+        """Server-Timing header value, durations in milliseconds"""
+        return ', '.join(f"{name};dur={seconds * 1000:.0f}" for name, _, seconds, _ in self.stages if seconds is not None)
+
+    def summary(self):
+        parts = [f"{name} {seconds:.2f}s{f' ({detail})' if detail else ''}"
+                 for name, _, seconds, detail in self.stages if seconds is not None]
+        return f"{', '.join(parts)}; total {time.monotonic() - self.started:.2f}s"
+
+def get_deck_stage_stats():
+    with _stage_lock:
+        return {name: dict(totals) for name, totals in deck_stage_stats.items()}
+
 # ============= Authentication Endpoints =============
 
 @app.route('/api/auth/signup', methods=['POST'])
@@ -1103,97 +1267,242 @@ def cancel_subscription():
 
 # ============= Presentation Generation Endpoints =============
 
+def check_research_allowed(user_id):
+    """Generation-limit and rate-limit checks shared by the research endpoints.
+    Returns an error response, or None if the request may proceed."""
+    # Check generations limit (skip for anonymous users)
+    if user_id != 'anonymous' and not check_generations_limit(user_id):
+        conn = get_db()
+        cursor = conn.cursor()
+        user = cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+        conn.close()
+        
+        return jsonify({
+            'error': 'Generation limit reached for this month',
+            'limit_reached': True,
+            'subscription_status': user['subscription_status'],
+            'generations_used': user['generations_used'],
+            'generations_limit': user['generations_limit']
+        }), 403
+    
+    # Rate limiting - allow 10 research requests per minute
+    if not check_rate_limit(user_id, 'research', limit=10, window_minutes=1):
+        return jsonify({'error': 'Too many requests'}), 429
+
+    return None
+
+# The research endpoints accept this many slides (app.html enforces the same maximum)
+MIN_SLIDES = 1
+MAX_SLIDES = 20
+# At most this many outline sections are regenerated per outline, this many at a time
+OUTLINE_MAX_REPAIRS = int(os.environ.get('OUTLINE_MAX_REPAIRS', 6))
+OUTLINE_REPAIR_CONCURRENCY = int(os.environ.get('OUTLINE_REPAIR_CONCURRENCY', 3))
+
+def parse_num_slides(data):
+    """num_slides of a research request, or None if it is not a whole number from MIN_SLIDES to MAX_SLIDES"""
+    try:
+        num_slides = int(data.get('num_slides', 10))
+    except (TypeError, ValueError):
+        return None
+    return num_slides if MIN_SLIDES <= num_slides <= MAX_SLIDES else None
+
+def build_outline_prompt(topic, num_slides):
+    """User block asking for the slide outline (format rules are in OUTLINE_SYSTEM)"""
+    return f"""Create a detailed outline for a {num_slides}-slide presentation on: {topic}
+
+Create EXACTLY {num_slides} sections."""
+
+def find_outline_problems(sections, num_slides):
+    """Map section index -> what is wrong with it, for each of the num_slides sections that is missing or invalid"""
+    problems = {}
+    for index in range(num_slides):
+        if index >= len(sections):
+            problems[index] = 'missing'
+            continue
+        try:
+            llm_schema.validate(sections[index], OUTLINE_SECTION_SCHEMA)
+        except llm_schema.SchemaError as e:
+            problems[index] = str(e)
+    return problems
+
+def is_valid_outline_section(section):
+    try:
+        llm_schema.validate(section, OUTLINE_SECTION_SCHEMA)
+        return True
+    except llm_schema.SchemaError:
+        return False
+
+def _section_title(section):
+    title = (section or {}).get('title')
+    return title.strip() if isinstance(title, str) and title.strip() else None
+
+def build_section_repair_prompt(topic, num_slides, sections, index):
+    """User block asking for one outline section, with the other section titles as context"""
+    titles = '\n'.join(f"{i + 1}. {_section_title(section) or '(to be written)'}" for i, section in enumerate(sections))
+    title = _section_title(sections[index])
+    target = f'section {index + 1} ("{title}")' if title else f"section {index + 1}"
+    return f"""OUTLINE SECTION REPAIR for a {num_slides}-slide presentation on: {topic}
+
+Section titles:
+{titles}
+
+Write {target} only, with {MIN_SECTION_FACTS}-4 key points that do not repeat the other sections."""
+
+outline_repair_stats = {'outlines': 0, 'sections': 0, 'failed': 0, 'skipped': 0}
+_outline_repair_lock = threading.Lock()
+
+def repair_outline(topic, num_slides, sections):
+    """
+    Regenerate only the outline sections that are missing or invalid (the first
+    OUTLINE_MAX_REPAIRS of them), in parallel, and merge them in place. A section whose repair fails is kept as it was (or
+    left out, if it was missing), so the outline is never worse than the original.
+    """
+    sections = list(sections[:num_slides])
+    problems = find_outline_problems(sections, num_slides)
+    if not problems:
+        return sections
+
+    logger.warning(f"Outline has {len(problems)}/{num_slides} missing or invalid sections, repairing them: {problems}")
+    sections.extend([None] * (num_slides - len(sections)))
+    # An outline that is mostly broken gets its first OUTLINE_MAX_REPAIRS problems fixed, not a call per slide
+    indexes = sorted(problems)[:OUTLINE_MAX_REPAIRS]
+    skipped = len(problems) - len(indexes)
+    prompts = [{'prompt': build_section_repair_prompt(topic, num_slides, sections, index), 'tool': OUTLINE_SECTION_TOOL,
+                'max_tokens': 600, 'prompt_type': 'outline_section', 'system': OUTLINE_SYSTEM}
+               for index in indexes]
+    results = llm_client.run_many(prompts, model=MODEL, api_key=ANTHROPIC_API_KEY,
+                                  concurrency=OUTLINE_REPAIR_CONCURRENCY)
+
+    repaired = failed = 0
+    for index, result in zip(indexes, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Repair of outline section {index + 1} failed: {result}")
+            failed += 1
+            continue
+        sections[index] = result
+        repaired += 1
+    with _outline_repair_lock:
+        outline_repair_stats['outlines'] += 1
+        outline_repair_stats['sections'] += repaired
+        outline_repair_stats['failed'] += failed
+        outline_repair_stats['skipped'] += skipped
+    return [section for section in sections if section is not None]
+
+def _short_phrases_ok(phrases, max_words, expected_count):
+    if not phrases or (expected_count is not None and len(phrases) != expected_count):
+        return False
+    return all(len(phrase.split()) <= max_words for phrase in phrases)
+
+def short_lines_validator(max_words, expected_count=None):
+    """Validator for one-short-phrase-per-line answers; a failure retries on a larger model"""
+    def validate(text):
+        lines = [line.strip().strip('•-*').strip('1234567890.').strip() for line in text.split('\n') if line.strip()]
+        return _short_phrases_ok(lines, max_words, expected_count)
+    return validate
+
+def short_phrases_validator(max_words, expected_count=None):
+    """Same check for CONCISE_TOOL input"""
+    return lambda result: _short_phrases_ok(result['phrases'], max_words, expected_count)
+
 @app.route('/api/research', methods=['POST'])
 def research_topic():
     """Research topic and create presentation outline"""
     try:
         user_id = session.get('user_id', 'anonymous')
 
-        # Check generations limit (skip for anonymous users)
-        if user_id != 'anonymous' and not check_generations_limit(user_id):
-            conn = get_db()
-            cursor = conn.cursor()
-            user = cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-            conn.close()
-            
-            return jsonify({
-                'error': 'Generation limit reached for this month',
-                'limit_reached': True,
-                'subscription_status': user['subscription_status'],
-                'generations_used': user['generations_used'],
-                'generations_limit': user['generations_limit']
-            }), 403
-        
-        # Rate limiting - allow 10 research requests per minute
-        if not check_rate_limit(user_id, 'research', limit=10, window_minutes=1):
-            return jsonify({'error': 'Too many requests'}), 429
-        
+        denied = check_research_allowed(user_id)
+        if denied:
+            return denied
+
         data = request.json
         topic = data.get('topic', '')
-        num_slides = int(data.get('num_slides', 10))
+        num_slides = parse_num_slides(data)
         
         if not topic:
             return jsonify({'error': 'Topic is required'}), 400
+        if num_slides is None:
+            return jsonify({'error': f'num_slides must be between {MIN_SLIDES} and {MAX_SLIDES}'}), 400
         
         logger.info(f"User {user_id} researching: {topic[:50]}")
         
         # Generate outline
-        prompt = f"""Create a detailed outline for a {num_slides}-slide presentation on: {topic}
+        prompt = build_outline_prompt(topic, num_slides)
+        
+        # The outline comes back as schema-checked tool input; a malformed one
+        # fails here instead of costing a second full outline call
+        try:
+            result = call_structured(prompt, OUTLINE_TOOL, max_tokens=3000, prompt_type='outline',
+                                     system=OUTLINE_SYSTEM)
+        except llm_schema.SchemaError as e:
+            logger.error(f"Outline did not match its schema: {e}")
+            return jsonify({'error': 'Failed to generate a valid outline, please try again'}), 500
 
-CRITICAL REQUIREMENTS:
-1. Create EXACTLY {num_slides} sections (one per slide)
-2. Each section title must be VERY SHORT - MAXIMUM 2 WORDS (like "Overview", "Key Benefits", "Statistics", "Implementation", "Results")
-3. Each section must have 3-4 key points
-4. Each key point MUST be a COMPLETE SENTENCE (12-20 words)
-5. Key points must be SPECIFIC - include numbers, examples, names, dates when relevant
-6. NO repetition between sections - each section covers a DIFFERENT aspect
-7. Each key point should be informative but concise enough to fit on a slide
+        # A short outline or a section without facts is patched section by section
+        result['sections'] = repair_outline(topic, num_slides, result['sections'])
 
-Return ONLY valid JSON (no markdown, no ```json):
-{{
-  "sections": [
-    {{"title": "Introduction", "facts": ["This is a complete sentence with specific information about the topic.", "This is another complete sentence covering a different aspect.", "This is a third sentence with relevant data or examples."]}},
-    {{"title": "Key Benefits", "facts": ["First complete sentence about benefits with specific details.", "Second complete sentence highlighting different advantages.", "Third sentence with concrete examples or statistics."]}}
-  ]
-}}
+        return jsonify(result)
+    
+    except Exception as e:
+        logger.error(f"Research error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-Make it comprehensive, professional, and ensure each section is DISTINCT with VERY SHORT titles."""
-        
-        response = call_anthropic(prompt, max_tokens=3000)
-        response = response.replace('```json\n', '').replace('\n```', '').replace('```', '').strip()
-
-        # Clean up common JSON issues from AI responses
-        import re
-        # Remove trailing commas before closing brackets/braces
-        response = re.sub(r',(\s*[}\]])', r'\1', response)
-        # Remove comments (// or /* */)
-        response = re.sub(r'//.*?$', '', response, flags=re.MULTILINE)
-        response = re.sub(r'/\*.*?\*/', '', response, flags=re.DOTALL)
-
-        # Try to parse JSON with better error handling
-        try:
-            result = json.loads(response)
-        except json.JSONDecodeError as e:
-            # Log the malformed JSON for debugging
-            logger.error(f"JSON parsing error: {str(e)}")
-            logger.error(f"Malformed JSON response (first 500 chars): {response[:500]}")
+@app.route('/api/research/stream', methods=['POST'])
+def research_topic_stream():
+    """Streaming variant of /api/research - one JSON line per section as it is generated"""
+    try:
+        user_id = session.get('user_id', 'anonymous')
 
-            # Retry with a simplified prompt
-            logger.info("Retrying research with simplified prompt...")
-            retry_prompt = f"""Create a {num_slides}-slide presentation outline on: {topic}
+        denied = check_research_allowed(user_id)
+        if denied:
+            return denied
 
-Return ONLY valid JSON in this EXACT format (no extra text, no markdown):
-{{"sections": [{{"title": "Intro", "facts": ["First fact.", "Second fact.", "Third fact."]}}]}}
+        data = request.json
+        topic = data.get('topic', '')
+        num_slides = parse_num_slides(data)
 
-CRITICAL: Must be valid JSON. Each title max 2 words. Each fact must be a complete sentence."""
+        if not topic:
+            return jsonify({'error': 'Topic is required'}), 400
+        if num_slides is None:
+            return jsonify({'error': f'num_slides must be between {MIN_SLIDES} and {MAX_SLIDES}'}), 400
+
+        logger.info(f"User {user_id} streaming research: {topic[:50]}")
+        prompt = build_outline_prompt(topic, num_slides)
+
+        def generate():
+            sections = []
+            try:
+                chunks = llm_client.stream_anthropic(prompt, max_tokens=3000, model=MODEL,
+                                                     api_key=ANTHROPIC_API_KEY, prompt_type='outline',
+                                                     system=OUTLINE_SYSTEM)
+                for section in llm_json.iter_sections(chunks):
+                    yield json.dumps({'type': 'section', 'index': len(sections), 'section': section,
+                                      'valid': is_valid_outline_section(section)}) + '\n'
+                    sections.append(section)
+            except Exception as e:
+                # The sections that did arrive are still worth repairing around
+                logger.error(f"Streaming research error after {len(sections)} sections: {str(e)}")
+                if not sections:
+                    yield json.dumps({'type': 'error', 'error': str(e), 'count': 0}) + '\n'
+                    return
+            if not sections:
+                yield json.dumps({'type': 'error', 'error': 'No sections could be parsed from the outline'}) + '\n'
+                return
+
+            # Same repair pass as /api/research: a short outline or an invalid
+            # section is patched, and each replacement is sent before done
+            try:
+                repaired = repair_outline(topic, num_slides, sections)
+            except Exception as e:
+                logger.error(f"Streaming outline repair error: {str(e)}")
+                repaired = sections[:num_slides]
+            for index, section in enumerate(repaired):
+                if index >= len(sections) or section is not sections[index]:
+                    yield json.dumps({'type': 'repaired', 'index': index, 'section': section}) + '\n'
+            yield json.dumps({'type': 'done', 'count': len(repaired)}) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                        headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
 
-            response = call_anthropic(retry_prompt, max_tokens=3000)
-            response = response.replace('```json\n', '').replace('\n```', '').replace('```', '').strip()
-            response = re.sub(r',(\s*[}\]])', r'\1', response)
-            result = json.loads(response)
-        
-        return jsonify(result)
-    
     except Exception as e:
         logger.error(f"Research error: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -1210,7 +1519,7 @@ Key points to enhance:
 Include relevant statistics, real-world examples, or industry insights.
 Keep it conversational and natural - this is for speaker notes, not the slides themselves."""
 
-        response = call_anthropic(context_prompt, max_tokens=200)
+        response = call_anthropic(context_prompt, max_tokens=200, prompt_type='web_context')
         return response.strip()
     
     except Exception as e:
@@ -1341,7 +1650,8 @@ Examples:
 
 Return ONLY the short bullets, one per line, no formatting:"""
 
-            response = call_anthropic(prompt, max_tokens=300)
+            response = call_anthropic(prompt, max_tokens=300, prompt_type='concise_bullets',
+                                      validate=short_lines_validator(max_words=8))
             bullets = [line.strip().lstrip('•-*').strip() for line in response.strip().split('\n') if line.strip()]
             bullets = bullets[:5]  # Limit to 5 bullets
         else:
@@ -1425,7 +1735,7 @@ Speaker notes:"""
 
         # Detailed style needs more tokens to expand each bullet
         max_tokens = 1500 if style == "Concise" else 2500
-        response = call_anthropic(prompt, max_tokens=max_tokens)
+        response = call_anthropic(prompt, max_tokens=max_tokens, prompt_type='notes')
 
         # PROOFREAD THE NOTES
         proofread_max_tokens = 1800 if style == "Concise" else 3000
@@ -1476,131 +1786,498 @@ def complete_presentation():
         logger.error(f"Complete presentation error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def build_shorten_prompt(facts):
+    """Prompt turning one slide's bullets into Concise-format phrases"""
+    bullets_text = '\n'.join([f"{i+1}. {bullet}" for i, bullet in enumerate(facts)])
+    return f"""Convert each of these bullet points into a SHORT phrase of NO MORE THAN 5 WORDS.
+Return exactly one shortened phrase per bullet, in the same order:
+
+{bullets_text}"""
+
+def shorten_section_facts(section, on_fallback=None):
+    """
+    Concise format: shorten one slide's bullets to phrases of at most 5 words.
+    Returns a Future for the short phrases, which are also set as section['facts'].
+    """
+    facts = section['facts'][:5]
+
+    def apply(call):
+        try:
+            section['facts'] = [phrase.strip() for phrase in call.result()['phrases']]
+        except Exception as e:
+            logger.warning(f"Bullet conversion failed, using fallback: {e}")
+            # Fallback: Just take first 5 words of each
+            section['facts'] = [' '.join(fact.split()[:5]) for fact in facts]
+            if on_fallback is not None:
+                on_fallback()
+        return section['facts']
+    return deck_dag.then(submit_call(build_shorten_prompt(facts), tool=CONCISE_TOOL, max_tokens=500,
+                                     prompt_type='concise_batch',
+                                     validate=short_phrases_validator(max_words=5, expected_count=len(facts))),
+                         apply)
+
+def write_section_notes(section, on_fallback=None):
+    """Detailed notes: a Future for one slide's AI speaker notes, or its facts joined if the call fails"""
+    def result(call):
+        try:
+            return call.result().strip()
+        except Exception as e:
+            logger.warning(f"Failed to generate speaker notes: {e}")
+            if on_fallback is not None:
+                on_fallback()
+            return ' '.join(section['facts'])
+    return deck_dag.then(submit_call(build_deck_notes_prompt(section), max_tokens=500, prompt_type='deck_notes'),
+                         result)
+
+def proofread_section(section, on_item=None, on_fallback=None):
+    """
+    Grammar check one slide's title and bullets through the shared batcher.
+    Returns a Future for [(fact index or None for the title, corrected text)].
+    """
+    targets = []
+    texts = []
+    if section.get('title'):
+        targets.append(None)
+        texts.append(section['title'])
+    for index, fact in enumerate(section.get('facts') or []):
+        targets.append(index)
+        texts.append(fact)
+    futures = slide_proofreader.submit_many(texts)
+    if on_item is not None:
+        for future in futures:
+            future.add_done_callback(lambda _: on_item())
+
+    def corrections(done):
+        results = []
+        for index, future in zip(targets, done.result()):
+            try:
+                results.append((index, future.result().strip()))
+            except Exception as e:
+                # Use original if proofreading fails
+                logger.warning(f"Failed to proofread slide text: {e}")
+                if on_fallback is not None:
+                    on_fallback()
+        return results
+    return deck_dag.then(deck_dag.gather(futures), corrections)
+
+# Changing any prompt that produces a section's artifacts retires everything
+# stored under the old prompts (see deck_artifacts)
+SECTION_ARTIFACTS_VERSION = hashlib.sha256('\n'.join([
+    build_shorten_prompt(['{bullet}']), json.dumps(CONCISE_TOOL, sort_keys=True),
+    build_deck_notes_prompt({'title': '{title}', 'facts': ['{fact}']}),
+    SLIDE_PROOFREAD_SYSTEM, SLIDE_PROOFREAD_BATCH_SYSTEM,
+]).encode('utf-8')).hexdigest()[:16]
+SECTION_ARTIFACT_FIELDS = ('title', 'facts', 'custom_notes')
+
+def build_deck(data, filename, progress=None, checkpoint=None):
+    """
+    Run the generate_pptx pipeline for one request body and write the deck
+    to filename; returns the StageTimer. Shared by the synchronous endpoint
+    and the background deck jobs, which pass a deck_events.Progress to
+    publish per-stage and per-slide progress.
+
+    Each slide is its own chain of tasks (see deck_dag): shorten bullets
+    (Concise format), then speaker notes (Detailed notes) and proofreading,
+    then rendering, which also waits for the previous slide's render. A
+    section whose artifacts are already stored (see deck_artifacts) skips
+    straight to rendering. With a deck_checkpoints.Checkpoint, each slide
+    task's result is saved as it finishes and restored instead of rerun
+    when the same build is retried.
+    """
+    from pptx_generator import ThemeGenerator, add_section_slide
+
+    title = data.get('title', 'Presentation')
+    sections = data.get('sections', [])
+    theme = data.get('theme', 'Business Black and Yellow')
+    notes_style = data.get('notesStyle', 'Detailed')
+    slide_format = data.get('slideFormat', 'Detailed')  # Add slide format
+
+    logger.info(f"Generating PPTX: {title[:30]} with format: {slide_format}, notes: {notes_style}")
+
+    timer = StageTimer(progress)
+    gen = ThemeGenerator(theme_name=theme)
+    graph = deck_dag.TaskGraph()
+
+    def has_facts(section):
+        return 'facts' in section and section['facts']
+
+    # Look sections up before anything below edits them in place
+    keys = [deck_artifacts.section_key(section, slide_format, notes_style, SECTION_ARTIFACTS_VERSION)
+            for section in sections]
+    stored = [deck_artifacts.get(key) for key in keys]
+    computed = [section for section, artifacts in zip(sections, stored) if artifacts is None]
+    fallbacks = set()
+
+    def proofread_items(section):
+        facts = len(section['facts']) if has_facts(section) else 0
+        return bool(section.get('title')) + (min(facts, 5) if slide_format == "Concise" else facts)
+
+    proofread_step = notes_step = render_step = None
+    if progress is not None:
+        proofread_step = progress.counter('proofread', total=sum(proofread_items(section) for section in computed))
+        notes_step = progress.counter('notes', total=sum(1 for section in computed if has_facts(section)))
+        render_step = progress.counter('slide', total=len(sections))
+
+    def notes_task(section, number):
+        notes = write_section_notes(section, partial(fallbacks.add, number))
+        if notes_step is not None:
+            notes.add_done_callback(lambda _: notes_step(slide=number))
+        return notes
+
+    def render_task(section, index, proofread, notes):
+        for fact_index, corrected in graph.result(proofread):
+            if fact_index is None:
+                section['title'] = corrected
+            else:
+                section['facts'][fact_index] = corrected
+        if notes is not None:
+            section['custom_notes'] = graph.result(notes)
+        if index + 1 not in fallbacks:
+            deck_artifacts.put(keys[index], {name: section[name] for name in SECTION_ARTIFACT_FIELDS
+                                             if name in section})
+        add_section_slide(gen, section, index, notes_style)
+        if render_step is not None:
+            render_step(slide=index + 1)
+
+    def resumable(name, run, restore):
+        """run, or if the checkpoint already holds name's result, a task that restores it"""
+        if checkpoint is None or not checkpoint.has(name):
+            return run
+
+        def restored():
+            value = checkpoint.get(name)
+            restore(value)
+            return value
+        return restored
+
+    def save_checkpoint(name, result):
+        kind, _, number = name.partition(':')
+        if checkpoint is None or kind not in ('shorten', 'notes', 'proofread') or checkpoint.has(name):
+            return
+        # Fallback results are retried, never resumed
+        if int(number) not in fallbacks:
+            checkpoint.put(name, result)
+
+    def restore_facts(section, facts):
+        section['facts'] = facts
+
+    def restore_notes(number, notes):
+        if notes_step is not None:
+            notes_step(slide=number)
+
+    def restore_corrections(corrections):
+        if proofread_step is not None:
+            for _ in corrections:
+                proofread_step()
+
+    def reuse_task(section, index):
+        section.update(stored[index])
+        add_section_slide(gen, section, index, notes_style)
+        if render_step is not None:
+            render_step(slide=index + 1)
+
+    previous = graph.add('render:title', lambda: gen.add_title_slide(title, "[Your Name]"), kind='render')
+    for index, section in enumerate(sections):
+        number = index + 1
+        if stored[index] is not None:
+            previous = graph.add(f"render:{number}", partial(reuse_task, section, index), deps=[previous])
+            continue
+        shorten = notes = None
+        if slide_format == "Concise" and has_facts(section):
+            shorten = graph.add(f"shorten:{number}", resumable(
+                f"shorten:{number}", partial(shorten_section_facts, section, partial(fallbacks.add, number)),
+                partial(restore_facts, section)))
+        if notes_style == "Detailed" and has_facts(section):
+            notes = graph.add(f"notes:{number}", resumable(
+                f"notes:{number}", partial(notes_task, section, number), partial(restore_notes, number)),
+                deps=[shorten])
+        proofread = graph.add(f"proofread:{number}", resumable(
+            f"proofread:{number}",
+            partial(proofread_section, section, proofread_step, partial(fallbacks.add, number)),
+            restore_corrections), deps=[shorten], bounded=False)
+        previous = graph.add(f"render:{number}", partial(render_task, section, index, proofread, notes),
+                             deps=[previous, proofread, notes])
+
+    timer.start('slides')
+    graph.run(DECK_TASK_CONCURRENCY, on_done=save_checkpoint)
+    restored = f", {checkpoint.restored} restored" if checkpoint is not None and checkpoint.restored else ''
+    timer.stop(f"{len(sections)} slides ({len(sections) - len(computed)} reused), {len(graph.tasks)} tasks{restored}")
+    for kind, totals in graph.timings_by_kind().items():
+        timer.record(kind, totals['total_s'], f"{totals['count']} tasks, max {totals['max_s']:.2f}s")
+
+    timer.start('save')
+    gen.add_thank_you_slide()
+    gen.save(filename)
+    timer.stop()
+    logger.info(f"Deck stages: {timer.summary()}")
+    return timer
+
+def deck_download_name(title):
+    return f"{title.replace(' ', '_')}.pptx"
+
 @app.route('/api/presentations/generate-pptx', methods=['POST'])
 def generate_pptx():
-    """Generate the actual PowerPoint file"""
+    """
+    Generate the actual PowerPoint file. With an Idempotency-Key header, a
+    retry of the same request resumes from the slide tasks that already
+    finished, or gets the finished deck if the first attempt completed.
+    """
     try:
-        from pptx_generator import generate_presentation
         from flask import send_file
         import tempfile
 
         data = request.json
         title = data.get('title', 'Presentation')
-        topic = data.get('topic', '')
-        sections = data.get('sections', [])
-        theme = data.get('theme', 'Business Black and Yellow')
-        notes_style = data.get('notesStyle', 'Detailed')
-        slide_format = data.get('slideFormat', 'Detailed')  # Add slide format
+        user_id = session.get('user_id', 'anonymous')
+        idempotency_key = request.headers.get('Idempotency-Key')
+
+        if idempotency_key:
+            checkpoint = deck_checkpoints.Checkpoint(
+                deck_checkpoints.request_scope(user_id, idempotency_key, data))
+            filename = checkpoint.finished_output()
+            if filename is None:
+                # A duplicate of a build that is still running waits for it rather than building (and charging) twice
+                if not checkpoint.acquire(IDEMPOTENT_WAIT_SECONDS):
+                    return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+                filename = checkpoint.finished_output()
+                if filename is not None:
+                    checkpoint.release()
+            if filename is not None:
+                logger.info(f"Replaying finished deck for idempotency key {idempotency_key[:40]}")
+                return send_file(
+                    os.path.abspath(filename),
+                    mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation',
+                    as_attachment=True,
+                    download_name=deck_download_name(title)
+                )
+            try:
+                os.makedirs(deck_checkpoints.CHECKPOINT_DIR, exist_ok=True)
+                filename = checkpoint.output_path()
+                partial_filename = checkpoint.partial_path()
+                try:
+                    timer = build_deck(data, partial_filename, checkpoint=checkpoint)
+                    os.replace(partial_filename, filename)
+                finally:
+                    if os.path.exists(partial_filename):
+                        os.remove(partial_filename)
+                checkpoint.complete()
+            finally:
+                checkpoint.release()
+        else:
+            # Generate presentation in temp file
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.pptx') as tmp:
+                filename = tmp.name
+            timer = build_deck(data, filename)
+
+        # Increment generation count ONLY after successful generation
+        if user_id != 'anonymous':
+            increment_generation_count(user_id)
+            logger.info(f"User {user_id} successfully generated presentation: {title}")
+
+        # Send file
+        response = send_file(
+            os.path.abspath(filename),
+            mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation',
+            as_attachment=True,
+            download_name=deck_download_name(title)
+        )
+        response.headers['Server-Timing'] = timer.header()
+        return response
+
+    except Exception as e:
+        logger.error(f"PPTX generation error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-        logger.info(f"Generating PPTX: {title[:30]} with format: {slide_format}, notes: {notes_style}")
+ANONYMOUS_JOB_OWNER = 'anonymous:'
+
+def deck_job_owner():
+    """Who a new or requested deck job belongs to: the user, or this browser session if not logged in"""
+    user_id = session.get('user_id')
+    if user_id is not None:
+        return str(user_id)
+    if 'deck_job_token' not in session:
+        session['deck_job_token'] = secrets.token_hex(16)
+    return ANONYMOUS_JOB_OWNER + session['deck_job_token']
+
+def deck_job_user(job):
+    """The job's user id, or 'anonymous'"""
+    return 'anonymous' if job['user_id'].startswith(ANONYMOUS_JOB_OWNER) else job['user_id']
+
+def run_deck_job(job, output_path):
+    """deck_jobs runner: build the deck for a queued request on a worker thread"""
+    llm_ledger.bind(endpoint='deck_job', user_id=deck_job_user(job))
+    title = job['payload'].get('title', 'Presentation')
+    progress = deck_events.Progress(job['id'])
+    progress.emit('started', attempt=job['attempts'] + 1, slides=len(job['payload'].get('sections', [])))
+    # A job reclaimed after its worker died resumes from its own checkpoints
+    checkpoint = deck_checkpoints.Checkpoint(f"job-{job['id']}")
+    timer = build_deck(job['payload'], output_path, progress, checkpoint)
+    checkpoint.complete()
+    return {'title': title, 'timing': timer.summary()}
+
+def finish_deck_job(job, status, error):
+    """
+    Charge the generation and close the job's progress stream once the outcome
+    is in the jobs table - not in run_deck_job, where a worker dying before the
+    job is marked done would get the user charged again when it is reclaimed
+    """
+    user_id = deck_job_user(job)
+    if status == 'done' and user_id != 'anonymous':
+        increment_generation_count(user_id)
+        logger.info(f"User {user_id} successfully generated presentation: {job['payload'].get('title', 'Presentation')}")
+    if status == 'done':
+        deck_events.bus.publish(job['id'], 'done', file_url=f"/api/presentations/jobs/{job['id']}/file")
+    else:
+        deck_events.bus.publish(job['id'], 'failed', error=error)
 
-        # If Concise format, convert facts to short phrases (max 5 words) BEFORE generating PPTX
-        if slide_format == "Concise":
-            # Collect all bullets to convert in one batch
-            all_bullets = []
-            for section in sections:
-                if 'facts' in section and section['facts']:
-                    all_bullets.extend(section['facts'][:5])
-
-            # Convert all bullets in a single AI call for speed
-            if all_bullets:
-                bullets_text = '\n'.join([f"{i+1}. {bullet}" for i, bullet in enumerate(all_bullets)])
-                prompt = f"""Convert each of these bullet points into a SHORT phrase of NO MORE THAN 5 WORDS.
-Return ONLY the shortened phrases, one per line, in the same order:
+deck_job_queue = deck_jobs.JobQueue(run_deck_job, on_finish=finish_deck_job)
 
-{bullets_text}"""
-                try:
-                    response = call_anthropic(prompt, max_tokens=500)
-                    short_bullets = [line.strip().strip('•-*').strip('1234567890.').strip()
-                                   for line in response.split('\n') if line.strip()]
-
-                    # Distribute the shortened bullets back to sections
-                    bullet_index = 0
-                    for section in sections:
-                        if 'facts' in section and section['facts']:
-                            num_facts = min(len(section['facts']), 5)
-                            section['facts'] = short_bullets[bullet_index:bullet_index + num_facts]
-                            bullet_index += num_facts
-                except Exception as e:
-                    logger.warning(f"Batch conversion failed, using fallback: {e}")
-                    # Fallback: Just take first 5 words of each
-                    for section in sections:
-                        if 'facts' in section and section['facts']:
-                            section['facts'] = [' '.join(fact.split()[:5]) for fact in section['facts'][:5]]
-
-        # If Detailed notes, generate AI summaries for speaker notes
-        if notes_style == "Detailed":
-            for section in sections:
-                if 'facts' in section and section['facts']:
-                    # Create a prompt to generate a natural summary
-                    facts_text = '\n'.join([f"- {fact}" for fact in section['facts'][:5]])
-                    prompt = f"""Create detailed speaker notes for a presentation slide about "{section.get('title', 'this topic')}".
+# Latest event per job, kept in the jobs table so a progress stream served by
+# another worker process can follow along (buffered, see JobQueue.set_progress)
+def persist_deck_progress(job_id, event):
+    deck_job_queue.set_progress(job_id, event)
 
-Key points to cover:
-{facts_text}
+deck_events.bus.add_listener(persist_deck_progress)
 
-Write a natural, conversational paragraph (5-7 sentences) that provides context, insights, and examples for these points.
+@app.before_request
+def start_deck_job_workers():
+    """Make sure this process runs queued deck jobs, including ones left from before a restart"""
+    deck_job_queue.start()
 
-Speaker notes:"""
+def get_own_deck_job(job_id):
+    """The job if it belongs to the session's user, else None"""
+    job = deck_job_queue.get(job_id)
+    if job is None or job['user_id'] != deck_job_owner():
+        return None
+    return job
 
-                    try:
-                        summary = call_anthropic(prompt, max_tokens=500).strip()
-                        section['custom_notes'] = summary
-                    except Exception as e:
-                        logger.warning(f"Failed to generate speaker notes: {e}")
-                        # Fallback: Just join the facts
-                        section['custom_notes'] = ' '.join(section['facts'])
-
-        # Grammar check ALL slide titles and bullets for all themes
-        logger.info("Grammar checking slide text (titles and bullets)")
-        for section in sections:
-            # Proofread slide title
-            if 'title' in section and section['title']:
-                try:
-                    section['title'] = proofread_slide_text(section['title'])
-                except Exception as e:
-                    logger.warning(f"Failed to proofread title: {e}")
-
-            # Proofread bullets/facts
-            if 'facts' in section and section['facts']:
-                proofread_facts = []
-                for fact in section['facts']:
-                    try:
-                        proofread_facts.append(proofread_slide_text(fact))
-                    except Exception as e:
-                        logger.warning(f"Failed to proofread bullet: {e}")
-                        proofread_facts.append(fact)  # Use original if proofreading fails
-                section['facts'] = proofread_facts
-
-        # Generate presentation in temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pptx') as tmp:
-            filename = generate_presentation(
-                title=title,
-                topic=topic,
-                sections=sections,
-                theme_name=theme,
-                notes_style=notes_style,
-                slide_format=slide_format,  # Pass slide format
-                filename=tmp.name
-            )
-
-            # Increment generation count ONLY after successful generation
-            user_id = session.get('user_id', 'anonymous')
-            if user_id != 'anonymous':
-                increment_generation_count(user_id)
-                logger.info(f"User {user_id} successfully generated presentation: {title}")
-
-            # Send file
-            return send_file(
-                filename,
-                mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation',
-                as_attachment=True,
-                download_name=f"{title.replace(' ', '_')}.pptx"
-            )
+@app.route('/api/presentations/jobs', methods=['POST'])
+def submit_deck_job():
+    """
+    Queue a deck for generation; poll the returned status_url, then fetch
+    file_url. Repeating the request with the same Idempotency-Key returns
+    the job the first one queued.
+    """
+    data = request.json
+    if not data or not isinstance(data.get('sections'), list):
+        return jsonify({'error': 'sections are required'}), 400
+    job_id = deck_job_queue.submit(deck_job_owner(), data, idempotency_key=request.headers.get('Idempotency-Key'))
+    job = deck_job_queue.get(job_id)
+    logger.info(f"Deck job {job_id} ({job['status']}): {data.get('title', 'Presentation')[:30]}")
+    return jsonify({
+        'job_id': job_id,
+        'status': job['status'],
+        'status_url': f"/api/presentations/jobs/{job_id}",
+        'file_url': f"/api/presentations/jobs/{job_id}/file"
+    }), 202
+
+@app.route('/api/presentations/jobs/<job_id>', methods=['GET'])
+def deck_job_status(job_id):
+    """Status of a queued deck: queued, running, done or failed"""
+    job = get_own_deck_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({
+        'job_id': job_id,
+        'status': job['status'],
+        'queue_position': job.get('queue_position'),
+        'attempts': job['attempts'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'error': job['error'],
+        'timing': (job['summary'] or {}).get('timing'),
+        'file_url': f"/api/presentations/jobs/{job_id}/file" if job['status'] == 'done' else None
+    })
 
-    except Exception as e:
-        logger.error(f"PPTX generation error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+# Seconds between checks of the jobs table while a progress stream has no events
+SSE_POLL_SECONDS = 2.0
+SSE_KEEPALIVE_SECONDS = 15.0
+# An open stream holds a worker thread, so it is ended after this long and the
+# browser's EventSource reconnects with Last-Event-ID (see gunicorn.conf.py)
+SSE_MAX_SECONDS = float(os.environ.get('DECK_SSE_MAX_SECONDS', 60))
+SSE_RETRY_MS = 1000
+
+def format_sse(event):
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@app.route('/api/presentations/jobs/<job_id>/events', methods=['GET'])
+def deck_job_events(job_id):
+    """
+    Server-Sent Events stream of a deck job's progress: stage started and
+    finished, notes for slide N, proofreading X of Y, then done or failed.
+    Reconnecting clients send Last-Event-ID and get only what they missed;
+    each connection lasts at most SSE_MAX_SECONDS before the client reconnects.
+    """
+    job = get_own_deck_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.args.get('after') or 0)
+    except ValueError:
+        after = 0
+
+    def generate():
+        last_seq = after
+        idle = 0.0
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        yield format_sse({'seq': last_seq, 'type': 'status', 'status': job['status'],
+                          'queue_position': job.get('queue_position')})
+        for event in deck_events.bus.subscribe(job_id, after, timeout=SSE_POLL_SECONDS):
+            if time.monotonic() > deadline:
+                # Let go of the worker thread; the client reconnects from last_seq
+                if event is not None:
+                    yield format_sse(event)
+                return
+            if event is not None:
+                last_seq = event['seq']
+                idle = 0.0
+                yield format_sse(event)
+                continue
+            # Nothing published in this process lately: the job may still be
+            # queued, or running in another worker process
+            current = deck_job_queue.get(job_id)
+            progress = current['progress'] if current else None
+            if progress and progress['seq'] > last_seq:
+                last_seq = progress['seq']
+                idle = 0.0
+                yield format_sse(progress)
+            if current is None or (current['status'] in ('done', 'failed') and not deck_events.bus.has_channel(job_id)):
+                if not progress or progress['type'] not in ('done', 'failed'):
+                    final = {'seq': last_seq + 1, 'type': 'done' if current and current['status'] == 'done' else 'failed'}
+                    if final['type'] == 'done':
+                        final['file_url'] = f"/api/presentations/jobs/{job_id}/file"
+                    else:
+                        final['error'] = current['error'] if current else 'Job not found'
+                    yield format_sse(final)
+                return
+            idle += SSE_POLL_SECONDS
+            if idle >= SSE_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ': keep-alive\n\n'
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/presentations/jobs/<job_id>/file', methods=['GET'])
+def deck_job_file(job_id):
+    """Download the deck of a finished job"""
+    from flask import send_file
+
+    job = get_own_deck_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': 'Presentation is not ready', 'status': job['status']}), 409
+    if not os.path.exists(job['file_path']):
+        return jsonify({'error': 'Presentation has expired'}), 410
+    return send_file(
+        os.path.abspath(job['file_path']),
+        mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        as_attachment=True,
+        download_name=deck_download_name(job['summary']['title'])
+    )
 
 # ============= Static File Serving =============
 
@@ -1648,7 +2325,25 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'api_configured': bool(ANTHROPIC_API_KEY),
-        'stripe_configured': bool(stripe.api_key)
+        'stripe_configured': bool(stripe.api_key),
+        'llm_pool': llm_client.get_pool_stats(),
+        'llm_cache': llm_cache.get_stats(),
+        'llm_single_flight': llm_singleflight.get_stats(),
+        'llm_limiter': llm_limiter.get_stats(),
+        'llm_latency': llm_latency.get_stats(),
+        'llm_budget': llm_budget.get_stats(),
+        'llm_usage': llm_client.get_usage_stats(),
+        'llm_cassette': llm_cassette.get_stats(),
+        'llm_ledger': llm_ledger.get_stats(),
+        'llm_batch': llm_batch.get_stats(),
+        'proofread_memo': llm_memo.get_stats(),
+        'llm_routing': llm_routing.get_stats(),
+        'outline_repairs': dict(outline_repair_stats),
+        'deck_stages': get_deck_stage_stats(),
+        'deck_jobs': deck_job_queue.get_stats(),
+        'deck_events': deck_events.get_stats(),
+        'deck_artifacts': deck_artifacts.get_stats(),
+        'deck_checkpoints': deck_checkpoints.get_stats()
     })
 
 @app.route('/api/test', methods=['POST'])
@@ -40,7 +40,8 @@ from flask import Flask, request, jsonify, session
 from flask_cors import CORS
 import os
 import json
-import requests
+import llm_client
+import llm_schema
 from datetime import datetime, timedelta
 import logging
 import sqlite3
@@ -67,7 +68,6 @@ if not ANTHROPIC_API_KEY:
     logger.error("❌ ANTHROPIC_API_KEY not found! Please set it in .env file")
 else:
     logger.info(f"✅ API Key loaded: {ANTHROPIC_API_KEY[:20]}...")
-ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
 MODEL = "claude-sonnet-4-20250514"
 
 # Stripe configuration
@@ -262,49 +262,17 @@ def check_rate_limit(user_id, endpoint, limit=20, window_minutes=1):
     conn.close()
     return True
 
-def call_anthropic(prompt, max_tokens=2000, retry_count=0, max_retries=3):
+def call_anthropic(prompt, max_tokens=2000, max_retries=3, system=None, prompt_type=None):
     """Make API call to Anthropic with retry logic for overload errors"""
-    import time
+    return llm_client.call_anthropic(prompt, max_tokens=max_tokens, max_retries=max_retries + 1,
+                                     model=MODEL, api_key=ANTHROPIC_API_KEY, system=system,
+                                     prompt_type=prompt_type)
 
-    if not ANTHROPIC_API_KEY:
-        raise Exception("ANTHROPIC_API_KEY environment variable not set")
-
-    try:
-        headers = {
-            "x-api-key": ANTHROPIC_API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
-
-        payload = {
-            "model": MODEL,
-            "max_tokens": max_tokens,
-            "messages": [{"role": "user", "content": prompt}]
-        }
-
-        response = requests.post(ANTHROPIC_API_URL, headers=headers, json=payload, timeout=60)
-
-        if response.status_code == 200:
-            data = response.json()
-            return data['content'][0]['text']
-        elif response.status_code == 529 and retry_count < max_retries:
-            # Overloaded - retry with exponential backoff
-            wait_time = (2 ** retry_count) * 2  # 2, 4, 8 seconds
-            logger.warning(f"API overloaded (529), retrying in {wait_time}s (attempt {retry_count + 1}/{max_retries})")
-            time.sleep(wait_time)
-            return call_anthropic(prompt, max_tokens, retry_count + 1, max_retries)
-        else:
-            raise Exception(f"API error: {response.status_code} - {response.text}")
-
-    except Exception as e:
-        if "529" not in str(e) or retry_count >= max_retries:
-            logger.error(f"Anthropic API error: {str(e)}")
-            raise
-        # Retry for other temporary errors
-        wait_time = (2 ** retry_count) * 2
-        logger.warning(f"API error, retrying in {wait_time}s (attempt {retry_count + 1}/{max_retries})")
-        time.sleep(wait_time)
-        return call_anthropic(prompt, max_tokens, retry_count + 1, max_retries)
+def call_structured(prompt, tool, max_tokens=2000, max_retries=3, system=None, prompt_type=None):
+    """Ask for data through a forced tool call; returns the validated tool input (see llm_schema)"""
+    return llm_client.call_structured(prompt, tool, max_tokens=max_tokens, max_retries=max_retries + 1,
+                                      model=MODEL, api_key=ANTHROPIC_API_KEY, system=system,
+                                      prompt_type=prompt_type)
 
 def proofread_speaker_notes(notes_text):
     """
@@ -1153,41 +1121,15 @@ Write the spoken presentation now (pure information, no instructions):"""
         logger.error(f"Notes generation error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/presentations/style-from-prompt', methods=['POST'])
-@login_required
-# @subscription_required  # REMOVED FOR TESTING
-def generate_style_from_prompt():
-    """
-    NEW FEATURE: Generate presentation style from natural language prompt.
-
-    Users can describe their desired presentation style in natural language:
-    - "Make it look professional and corporate with blue and gray colors"
-    - "I want a creative, colorful design with bold fonts"
-    - "Tech startup style with modern fonts and vibrant colors"
-
-    AI interprets the prompt and returns structured style parameters.
-    """
-    try:
-        data = request.json
-        user_prompt = data.get('prompt', '').strip()
-
-        if not user_prompt:
-            return jsonify({'error': 'Style prompt is required'}), 400
-
-        logger.info(f"🎨 AI generating presentation style from prompt: {user_prompt[:50]}...")
-
-        # AI interprets the user's style preferences
-        prompt = f"""You are an AI design assistant creating a custom presentation theme based on the user's description.
+# Static part of the style-from-prompt request, sent as a prompt-cached system block
+STYLE_PROMPT_SYSTEM = """You are an AI design assistant creating a custom presentation theme based on the user's description.
 
 CRITICAL REQUIREMENT: Every content slide (ALL slides EXCEPT the title slide and the final "thank you" slide) MUST include blank spaces/placeholders for images.
 
-USER'S STYLE REQUEST:
-"{user_prompt}"
-
-YOUR TASK: Design a complete presentation style that incorporates blank image placeholders on every content slide.
+YOUR TASK: Design a complete presentation style for the user's style request that incorporates blank image placeholders on every content slide.
 
 Return a JSON object with these exact fields:
-{{
+{
   "theme_name": "Descriptive name for this theme (e.g. 'Corporate Blue', 'Creative Sunset')",
   "primary_color": "#RRGGBB hex color",
   "secondary_color": "#RRGGBB hex color",
@@ -1204,7 +1146,7 @@ Return a JSON object with these exact fields:
   "image_placeholder_size": "large, medium, or small",
   "image_placeholder_position": "alternating (left, right, top, bottom rotation)",
   "layout_preference": "balanced (text and images get equal space)"
-}}
+}
 
 IMPORTANT DESIGN CONSTRAINTS:
 - EVERY content slide (except title and thank you) MUST have a blank space for an image placeholder
@@ -1245,50 +1187,83 @@ UNIQUE STYLE INSPIRATIONS:
 - Luxury Brand: Deep colors (burgundy, forest green, navy), Didot/Garamond, gold accents
 - Startup Energy: Bold colors (electric blue, lime green), Oswald/Raleway, dynamic layouts
 
-REMEMBER: Title slide = NO image placeholder. Thank you slide = NO image placeholder. ALL OTHER SLIDES = MUST have image placeholder.
+REMEMBER: Title slide = NO image placeholder. Thank you slide = NO image placeholder. ALL OTHER SLIDES = MUST have image placeholder."""
+
+_HEX_COLOR = {'type': 'string', 'pattern': '^#[0-9A-Fa-f]{6}$'}
+STYLE_TOOL = llm_schema.tool('record_style', 'Record the presentation style configuration.', {
+    'type': 'object',
+    'properties': {
+        'theme_name': {'type': 'string', 'minLength': 1},
+        'primary_color': _HEX_COLOR,
+        'secondary_color': _HEX_COLOR,
+        'accent_color': _HEX_COLOR,
+        'background_color': _HEX_COLOR,
+        'text_color': _HEX_COLOR,
+        'title_font': {'type': 'string', 'minLength': 1},
+        'body_font': {'type': 'string', 'minLength': 1},
+        'title_size': {'type': 'integer', 'minimum': 12, 'maximum': 96},
+        'body_size': {'type': 'integer', 'minimum': 8, 'maximum': 60},
+        'style_description': {'type': 'string'},
+        'mood': {'type': 'string'},
+        'image_placeholder_style': {'type': 'string'},
+        'image_placeholder_size': {'type': 'string'},
+        'image_placeholder_position': {'type': 'string'},
+        'layout_preference': {'type': 'string'},
+    },
+    'required': [
+        'theme_name', 'primary_color', 'secondary_color', 'accent_color',
+        'background_color', 'text_color', 'title_font', 'body_font',
+        'title_size', 'body_size', 'style_description', 'mood',
+        'image_placeholder_style', 'image_placeholder_size',
+        'image_placeholder_position', 'layout_preference'
+    ],
+})
 
-Generate the style configuration JSON now:"""
+@app.route('/api/presentations/style-from-prompt', methods=['POST'])
+@login_required
+# @subscription_required  # REMOVED FOR TESTING
+def generate_style_from_prompt():
+    """
+    NEW FEATURE: Generate presentation style from natural language prompt.
 
-        response = call_anthropic(prompt, max_tokens=1500)
+    Users can describe their desired presentation style in natural language:
+    - "Make it look professional and corporate with blue and gray colors"
+    - "I want a creative, colorful design with bold fonts"
+    - "Tech startup style with modern fonts and vibrant colors"
 
-        # Parse JSON response
-        try:
-            # Clean markdown code blocks if present
-            import re
-            json_match = re.search(r'```json\s*(.*?)\s*```', response, re.DOTALL)
-            if json_match:
-                response = json_match.group(1)
+    AI interprets the prompt and returns structured style parameters.
+    """
+    try:
+        data = request.json
+        user_prompt = data.get('prompt', '').strip()
 
-            style_config = json.loads(response)
+        if not user_prompt:
+            return jsonify({'error': 'Style prompt is required'}), 400
 
-            # Validate required fields
-            required_fields = [
-                'theme_name', 'primary_color', 'secondary_color', 'accent_color',
-                'background_color', 'text_color', 'title_font', 'body_font',
-                'title_size', 'body_size', 'style_description', 'mood',
-                'image_placeholder_style', 'image_placeholder_size',
-                'image_placeholder_position', 'layout_preference'
-            ]
+        logger.info(f"🎨 AI generating presentation style from prompt: {user_prompt[:50]}...")
 
-            for field in required_fields:
-                if field not in style_config:
-                    raise ValueError(f"Missing required field: {field}")
+        # AI interprets the user's style preferences
+        prompt = f"""USER'S STYLE REQUEST:
+"{user_prompt}"
 
-            logger.info(f"✅ AI-generated style: {style_config.get('theme_name')}")
+Generate the style configuration JSON now:"""
 
-            return jsonify({
-                'success': True,
-                'style': style_config,
-                'generated_from': user_prompt,
-                'message': f"Custom style '{style_config.get('theme_name')}' created successfully!"
-            })
-
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parse error: {e}\nResponse: {response}")
+        # Fields and formats are enforced by STYLE_TOOL's schema
+        try:
+            style_config = call_structured(prompt, STYLE_TOOL, max_tokens=1500, system=STYLE_PROMPT_SYSTEM,
+                                           prompt_type='style')
+        except llm_schema.SchemaError as e:
+            logger.error(f"Style configuration did not match its schema: {e}")
             return jsonify({'error': 'Failed to parse style configuration'}), 500
-        except ValueError as e:
-            logger.error(f"Validation error: {e}")
-            return jsonify({'error': str(e)}), 500
+
+        logger.info(f"✅ AI-generated style: {style_config.get('theme_name')}")
+
+        return jsonify({
+            'success': True,
+            'style': style_config,
+            'generated_from': user_prompt,
+            'message': f"Custom style '{style_config.get('theme_name')}' created successfully!"
+        })
 
     except Exception as e:
         logger.error(f"❌ Style generation error: {str(e)}")
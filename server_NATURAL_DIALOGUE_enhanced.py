@@ -31,6 +31,7 @@ from flask_cors import CORS
 import os
 import json
 import requests
+import llm_client
 from datetime import datetime, timedelta
 import logging
 import sqlite3
@@ -57,7 +58,6 @@ if not ANTHROPIC_API_KEY:
     logger.error("❌ ANTHROPIC_API_KEY not found! Please set it in .env file")
 else:
     logger.info(f"✅ API Key loaded: {ANTHROPIC_API_KEY[:20]}...")
-ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
 MODEL = "claude-sonnet-4-20250514"
 
 # Stripe configuration
@@ -503,37 +503,8 @@ def subscription_status():
 
 def call_anthropic(prompt, max_tokens=4000):
     """Call Anthropic API with error handling"""
-    try:
-        headers = {
-            "x-api-key": ANTHROPIC_API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
-        
-        payload = {
-            "model": MODEL,
-            "max_tokens": max_tokens,
-            "messages": [{"role": "user", "content": prompt}]
-        }
-        
-        response = requests.post(ANTHROPIC_API_URL, headers=headers, json=payload, timeout=60)
-        
-        if response.status_code != 200:
-            error_detail = response.json() if response.text else {}
-            logger.error(f"API Error {response.status_code}: {error_detail}")
-            raise Exception(f"API Error: {response.status_code} - {error_detail}")
-        
-        result = response.json()
-        
-        if 'content' in result and len(result['content']) > 0:
-            return result['content'][0]['text']
-        else:
-            raise Exception("No content in API response")
-    
-    except requests.exceptions.Timeout:
-        raise Exception("API request timed out")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"API request failed: {str(e)}")
+    return llm_client.call_anthropic(prompt, max_tokens=max_tokens, max_retries=1,
+                                     model=MODEL, api_key=ANTHROPIC_API_KEY)
 
 def web_search(query):
     """
@@ -29,7 +29,7 @@ from flask import Flask, request, jsonify, session
 from flask_cors import CORS
 import os
 import json
-import requests
+import llm_client
 from datetime import datetime, timedelta
 import logging
 import sqlite3
@@ -56,7 +56,6 @@ if not ANTHROPIC_API_KEY:
     logger.error("❌ ANTHROPIC_API_KEY not found! Please set it in .env file")
 else:
     logger.info(f"✅ API Key loaded: {ANTHROPIC_API_KEY[:20]}...")
-ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
 MODEL = "claude-sonnet-4-20250514"
 
 # Stripe configuration
@@ -253,33 +252,8 @@ def check_rate_limit(user_id, endpoint, limit=20, window_minutes=1):
 
 def call_anthropic(prompt, max_tokens=2000):
     """Make API call to Anthropic"""
-    if not ANTHROPIC_API_KEY:
-        raise Exception("ANTHROPIC_API_KEY environment variable not set")
-    
-    try:
-        headers = {
-            "x-api-key": ANTHROPIC_API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
-        
-        payload = {
-            "model": MODEL,
-            "max_tokens": max_tokens,
-            "messages": [{"role": "user", "content": prompt}]
-        }
-        
-        response = requests.post(ANTHROPIC_API_URL, headers=headers, json=payload, timeout=60)
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data['content'][0]['text']
-        else:
-            raise Exception(f"API error: {response.status_code} - {response.text}")
-    
-    except Exception as e:
-        logger.error(f"Anthropic API error: {str(e)}")
-        raise
+    return llm_client.call_anthropic(prompt, max_tokens=max_tokens, max_retries=1,
+                                     model=MODEL, api_key=ANTHROPIC_API_KEY)
 
 def proofread_speaker_notes(notes_text):
     """
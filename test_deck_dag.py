@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Deck task graph tests
+Checks that TaskGraph starts a task only after its dependencies, follows
+tasks that return a Future, and stops at the first failure.
+Run with: python -m pytest -q test_deck_dag.py
+"""
+
+import time
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from deck_dag import TaskGraph, gather, then
+
+
+def _recorder():
+    events = []
+    lock = threading.Lock()
+
+    def task(name, result=None, delay=0.0):
+        def run():
+            time.sleep(delay)
+            with lock:
+                events.append(name)
+            return result if result is not None else name
+        return run
+    return events, task
+
+
+def test_dependencies_finish_first():
+    events, task = _recorder()
+    graph = TaskGraph()
+    graph.add('notes:1', task('notes:1', delay=0.05))
+    graph.add('shorten:1', task('shorten:1'))
+    graph.add('render:1', task('render:1'), deps=['notes:1', 'shorten:1'])
+    graph.add('notes:2', task('notes:2'))
+    graph.add('render:2', task('render:2'), deps=['render:1', 'notes:2'])
+
+    results = graph.run(4)
+
+    assert events.index('render:1') > max(events.index('notes:1'), events.index('shorten:1'))
+    assert events.index('render:2') > max(events.index('render:1'), events.index('notes:2'))
+    assert results['render:2'] == 'render:2'
+    assert graph.timings_by_kind()['render']['count'] == 2
+
+
+def test_unknown_and_duplicate_tasks_are_rejected():
+    graph = TaskGraph()
+    graph.add('a', lambda: None)
+    with pytest.raises(ValueError):
+        graph.add('a', lambda: None)
+    with pytest.raises(ValueError):
+        graph.add('b', lambda: None, deps=['missing'])
+
+
+def test_future_results_are_awaited():
+    graph = TaskGraph()
+    pending = Future()
+    threading.Timer(0.05, pending.set_result, args=['late']).start()
+    graph.add('llm', lambda: then(pending, lambda future: future.result().upper()))
+    graph.add('batch', lambda: gather([pending]))
+    graph.add('use', lambda: graph.result('llm') + '!', deps=['llm'])
+
+    results = graph.run(2)
+
+    assert results['llm'] == 'LATE'
+    assert [future.result() for future in results['batch']] == ['late']
+    assert results['use'] == 'LATE!'
+
+
+def test_failure_stops_dependents_and_is_raised():
+    events, task = _recorder()
+    done = []
+
+    def fail():
+        raise RuntimeError('notes call failed')
+
+    graph = TaskGraph()
+    graph.add('notes:1', fail)
+    graph.add('render:1', task('render:1'), deps=['notes:1'])
+    graph.add('shorten:2', task('shorten:2', delay=0.05))
+    graph.add('render:2', task('render:2'), deps=['shorten:2'])
+
+    with pytest.raises(RuntimeError, match='notes call failed'):
+        graph.run(4, on_done=lambda name, result: done.append(name))
+
+    # The task already running when notes:1 failed finishes; nothing new starts
+    assert events == ['shorten:2']
+    assert done == ['shorten:2']
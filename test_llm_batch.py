@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Proofreading micro-batch tests
+Checks how a batched answer is matched back to its items by id, and that
+items missing from it are retried one by one. No upstream calls are made:
+llm_client is patched.
+Run with: python -m pytest -q test_llm_batch.py
+"""
+
+import llm_batch
+import llm_cache
+import llm_client
+
+TEXTS = ['Teh quick brown fox', 'Jumps ovr the lazy dog', 'Renewable enrgy is growing fast']
+FIXED = ['The quick brown fox', 'Jumps over the lazy dog', 'Renewable energy is growing fast']
+
+
+def test_align_accepts_every_matching_item():
+    items = [{'id': i, 'text': text} for i, text in enumerate(FIXED, 1)]
+    assert llm_batch.align(TEXTS, items) == {1: FIXED[0], 2: FIXED[1], 3: FIXED[2]}
+
+
+def test_align_rejects_shifted_numbering():
+    # The model numbered from 0, so every correction sits under its neighbour's id
+    items = [{'id': i, 'text': text} for i, text in enumerate(FIXED)]
+    assert llm_batch.align(TEXTS, items) == {}
+
+
+def test_align_drops_unknown_empty_and_repeated_ids():
+    items = [{'id': 1, 'text': FIXED[0]}, {'id': 2, 'text': FIXED[1]}, {'id': 2, 'text': FIXED[1]},
+             {'id': 3, 'text': '  '}, {'id': 7, 'text': FIXED[2]}]
+    assert llm_batch.align(TEXTS, items) == {1: FIXED[0]}
+
+
+def test_partial_answer_falls_back_to_single_items(monkeypatch):
+    monkeypatch.setattr(llm_cache, 'CACHE_ENABLED', False)
+    monkeypatch.setattr(llm_client, 'call_structured',
+                        lambda *args, **kwargs: {'items': [{'id': 1, 'text': FIXED[0]}, {'id': 3, 'text': FIXED[2]}]})
+    singles = []
+
+    def run_many(prompts, **kwargs):
+        singles.extend(prompt['prompt'] for prompt in prompts)
+        return [FIXED[1] for _ in prompts]
+    monkeypatch.setattr(llm_client, 'run_many', run_many)
+
+    batcher = llm_batch.MicroBatcher('test', lambda text: f"PROOFREAD: {text}", 'system', 'batch system',
+                                     'proofread_test')
+    jobs = [llm_batch._Job(text) for text in TEXTS]
+    batcher._run_batch(jobs)
+
+    assert [job.future.result(timeout=1) for job in jobs] == FIXED
+    assert singles == [f"PROOFREAD: {TEXTS[1]}"]
+    stats = batcher.get_stats()
+    assert stats['batches'] == 1 and stats['batched_items'] == 3 and stats['fallbacks'] == 1
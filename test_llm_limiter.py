@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Adaptive LLM concurrency limiter tests
+Checks the AIMD steps of AdaptiveLimiter: about one more slot per window of
+successes, and half as many on an overload, at most once per cooldown.
+Run with: python -m pytest -q test_llm_limiter.py
+"""
+
+import pytest
+
+import llm_limiter
+from llm_limiter import AdaptiveLimiter
+
+
+def test_successes_add_about_one_slot_per_window():
+    limiter = AdaptiveLimiter(max_limit=8)
+    limiter.limit = 4.0
+    for _ in range(4):
+        limiter.on_success()
+    assert 4.8 < limiter.limit < 5.0
+    limiter.on_success()
+    assert limiter.get_stats()['limit'] == 5
+
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.limit == 8
+
+
+def test_overload_halves_once_per_cooldown():
+    limiter = AdaptiveLimiter(max_limit=8)
+    limiter.on_overload(529)
+    assert limiter.limit == 4
+    # The rest of the same burst does not halve it again
+    limiter.on_overload(529)
+    assert limiter.limit == 4
+
+    for _ in range(3):
+        limiter.last_decrease -= llm_limiter.DECREASE_COOLDOWN
+        limiter.on_overload(429)
+    assert limiter.limit == limiter.min_limit
+    assert limiter.is_congested()
+
+
+def test_overload_pauses_callers():
+    limiter = AdaptiveLimiter(max_limit=2)
+    assert limiter.on_overload(429, {'retry-after': '3'}) == pytest.approx(3, abs=0.1)
+    assert limiter.try_acquire() > 2
+    assert limiter.in_flight == 0
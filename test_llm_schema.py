@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Structured output validation tests
+Checks that llm_schema.validate accepts tool input matching its schema and
+names the first place where it does not.
+Run with: python -m pytest -q test_llm_schema.py
+"""
+
+import pytest
+
+from llm_schema import SchemaError, validate
+
+SECTION = {
+    'type': 'object',
+    'properties': {
+        'title': {'type': 'string', 'minLength': 1},
+        'facts': {'type': 'array', 'minItems': 2, 'maxItems': 4, 'items': {'type': 'string'}},
+        'level': {'type': 'integer', 'minimum': 1, 'maximum': 3},
+        'tone': {'enum': ['formal', 'casual']},
+    },
+    'required': ['title', 'facts'],
+    'additionalProperties': False,
+}
+
+
+def test_matching_instance_is_returned():
+    section = {'title': 'Costs', 'facts': ['One.', 'Two.'], 'level': 2, 'tone': 'formal'}
+    assert validate(section, SECTION) is section
+
+
+@pytest.mark.parametrize('section, message', [
+    ({'facts': ['One.', 'Two.']}, '$: missing required field title'),
+    ({'title': '', 'facts': ['One.', 'Two.']}, '$.title: shorter than 1'),
+    ({'title': 'Costs', 'facts': ['One.']}, '$.facts: fewer than 2 items'),
+    ({'title': 'Costs', 'facts': ['One.', 2]}, '$.facts[1]: expected string, got int'),
+    ({'title': 'Costs', 'facts': ['One.', 'Two.'], 'level': True}, '$.level: expected integer, got bool'),
+    ({'title': 'Costs', 'facts': ['One.', 'Two.'], 'level': 5}, '$.level: 5 is above 3'),
+    ({'title': 'Costs', 'facts': ['One.', 'Two.'], 'tone': 'loud'}, "$.tone: 'loud' is not one of"),
+    ({'title': 'Costs', 'facts': ['One.', 'Two.'], 'notes': ''}, '$: unexpected field notes'),
+])
+def test_first_mismatch_is_named(section, message):
+    with pytest.raises(SchemaError) as error:
+        validate(section, SECTION)
+    assert str(error.value).startswith(message)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Outline stream repair tests
+Feeds /api/research/stream a cut-off or partly invalid outline from the fake
+Anthropic API and checks that the repair pass fills in the missing sections.
+Run with: python -m pytest -q test_research_stream.py
+"""
+
+import os
+import sys
+import json
+import tempfile
+import importlib
+
+import pytest
+
+import llm_client
+from fake_anthropic import FakeAnthropic
+
+NUM_SLIDES = 4
+
+
+def _section(title, facts=3):
+    return {'title': title, 'facts': [f"{title} fact {i + 1} with a figure of {i + 10} percent." for i in range(facts)]}
+
+
+@pytest.fixture(scope='module')
+def env():
+    fake = FakeAnthropic(latency=(0.01, 0.0)).start()
+    previous = os.getcwd()
+    # Other test modules may already have imported llm_client (see conftest.py)
+    previous_url = llm_client.ANTHROPIC_API_URL
+    llm_client.ANTHROPIC_API_URL = fake.url
+    # server.py keeps its user database in the working directory
+    os.chdir(tempfile.mkdtemp())
+    try:
+        server = sys.modules.get('server') or importlib.import_module('server')
+        yield fake, server.app.test_client()
+    finally:
+        os.chdir(previous)
+        llm_client.ANTHROPIC_API_URL = previous_url
+        fake.stop()
+
+
+def _stream(client, topic):
+    response = client.post('/api/research/stream', json={'topic': topic, 'num_slides': NUM_SLIDES})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line.strip()]
+
+
+def _final_sections(events):
+    """What readOutlineStream in app.html ends up with"""
+    sections = []
+    for event in events:
+        if event['type'] == 'section':
+            sections.append(event['section'])
+        elif event['type'] == 'repaired':
+            if event['index'] < len(sections):
+                sections[event['index']] = event['section']
+            else:
+                sections.append(event['section'])
+        elif event['type'] == 'done':
+            sections = sections[:event['count']]
+    return sections
+
+
+def test_truncated_stream_is_repaired(env):
+    fake, client = env
+    complete = json.dumps({'sections': [_section('Overview'), _section('Background'), _section('Costs')]})
+    # Cut off inside the third section, as a response stopped at max_tokens would be
+    fake.responses['outline'] = complete[:complete.index('Costs fact 2')]
+    try:
+        events = _stream(client, 'Solar power')
+    finally:
+        fake.responses.pop('outline')
+
+    assert [event['type'] for event in events] == ['section', 'section', 'repaired', 'repaired', 'done']
+    assert [event['index'] for event in events if event['type'] == 'repaired'] == [2, 3]
+    sections = _final_sections(events)
+    assert len(sections) == NUM_SLIDES
+    assert [section['title'] for section in sections[:2]] == ['Overview', 'Background']
+    assert all(len(section['facts']) >= 2 for section in sections)
+
+
+def test_invalid_section_is_replaced(env):
+    fake, client = env
+    outline = {'sections': [_section('Overview'), _section('Background', facts=0), _section('Costs'),
+                            _section('Summary'), _section('Extra')]}
+    fake.responses['outline'] = json.dumps(outline)
+    try:
+        events = _stream(client, 'Wind power')
+    finally:
+        fake.responses.pop('outline')
+
+    section_events = [event for event in events if event['type'] == 'section']
+    assert [event['valid'] for event in section_events] == [True, False, True, True, True]
+    repaired = [event for event in events if event['type'] == 'repaired']
+    assert [event['index'] for event in repaired] == [1]
+    assert repaired[0]['section']['title'] == 'Background'
+    assert events[-1] == {'type': 'done', 'count': NUM_SLIDES}
+    sections = _final_sections(events)
+    assert [section['title'] for section in sections] == ['Overview', 'Background', 'Costs', 'Summary']
+    assert all(section['facts'] for section in sections)
+
+
+def test_unparseable_stream_reports_an_error(env):
+    fake, client = env
+    fake.responses['outline'] = "I can't write an outline for that."
+    try:
+        events = _stream(client, 'Tides')
+    finally:
+        fake.responses.pop('outline')
+    assert [event['type'] for event in events] == ['error']
+
+
+@pytest.mark.parametrize('num_slides', [0, 21, 'many'])
+def test_num_slides_out_of_range_is_rejected(env, num_slides):
+    fake, client = env
+    for path in ('/api/research', '/api/research/stream'):
+        response = client.post(path, json={'topic': 'Geothermal', 'num_slides': num_slides})
+        assert response.status_code == 400
+
+
+def test_repairs_per_outline_are_capped(env, monkeypatch):
+    fake, client = env
+    server = sys.modules['server']
+    monkeypatch.setattr(server, 'OUTLINE_MAX_REPAIRS', 2)
+    fake.responses['outline'] = json.dumps({'sections': [_section('Overview')]})
+    try:
+        response = client.post('/api/research/stream', json={'topic': 'Hydrogen', 'num_slides': 6})
+    finally:
+        fake.responses.pop('outline')
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line.strip()]
+    assert [event['index'] for event in events if event['type'] == 'repaired'] == [1, 2]
+    assert events[-1] == {'type': 'done', 'count': 3}